@@ -0,0 +1,99 @@
+import os
+import sys
+import tempfile
+import time
+from mmap import ACCESS_READ, mmap
+from typing import Callable, Iterable
+
+from blfgen import generate_blf
+from blfindex import get_container_index
+from blfparser import (BaseObject, parse_container_objects, parse_file_header,
+                       parse_log_container, parse_log_container_mm,
+                       parse_log_container_threaded)
+from blfrecord import parse_record_file
+from logstore import LogStore
+from multiproc import Columns, map_chunks
+from multiread import parse_base_object_mp
+
+
+def read_file(filename: str) -> Iterable:
+    with open(filename, "rb") as fp:
+        object_count, start_timestamp, stop_timestamp = parse_file_header(fp)
+        yield from parse_container_objects(parse_log_container(fp), object_count, start_timestamp, stop_timestamp)
+
+
+def read_mmap(filename: str) -> Iterable:
+    with open(filename, "rb") as fp:
+        with mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+            object_count, start_timestamp, stop_timestamp = parse_file_header(mm)
+            yield from parse_container_objects(parse_log_container_mm(mm), object_count, start_timestamp, stop_timestamp)
+
+
+def read_threaded(filename: str) -> Iterable:
+    with open(filename, "rb") as fp:
+        with mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+            object_count, start_timestamp, stop_timestamp = parse_file_header(mm)
+            yield from parse_container_objects(parse_log_container_threaded(mm), object_count, start_timestamp, stop_timestamp)
+
+
+def read_records(filename: str) -> Iterable:
+    return parse_record_file(filename)
+
+
+def read_multiread(filename: str) -> Iterable:
+    return parse_base_object_mp(filename)
+
+
+def store_columns(objs: Iterable[BaseObject]) -> Columns:
+    # the objects of a chunk
+    store = LogStore()
+    for item in objs:
+        store.append(item)
+    columns: Columns = dict(store.columns())
+    columns["payload"] = store.payload
+    return columns
+
+
+def read_map_chunks(filename: str) -> Iterable:
+    for columns in map_chunks(store_columns, [filename]):
+        yield from columns["time_ns"]
+
+
+READERS: list[tuple[str, Callable[[str], Iterable]]] = [
+    ("parse_log_container", read_file),
+    ("parse_log_container_mm", read_mmap),
+    ("parse_log_container_threaded", read_threaded),
+    ("parse_record_file", read_records),
+    ("multiread (RingChannel)", read_multiread),
+    ("multiproc.map_chunks", read_map_chunks),
+]
+
+
+def run(filename: str, repeat: int = 3):
+    size = os.path.getsize(filename)
+    for name, reader in READERS:
+        best = float("inf")
+        count = 0
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            count = sum(1 for _ in reader(filename))
+            t1 = time.perf_counter()
+            best = min(best, t1 - t0)
+        print(f"{name:30s} {size / best / 1e6:10.1f} MB/s {count / best:12.0f} objects/s")
+
+
+def main():
+    size = int(sys.argv[1]) * 1_000_000 if len(sys.argv) > 1 else 50_000_000
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for compressed in (True, False):
+            filename = os.path.join(tmpdir, f"bench_{'zlib' if compressed else 'raw'}.blf")
+            count = generate_blf(filename, size, compressed=compressed, seed=0)
+            with open(filename, "rb") as fp:
+                with mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+                    get_container_index(filename, mm)  # the sidecar gives each chunk of map_chunks its first object
+            print(f"{os.path.basename(filename)}: {os.path.getsize(filename) / 1e6:.1f} MB, {count} objects")
+            run(filename)
+
+
+if __name__ == "__main__":
+    main()
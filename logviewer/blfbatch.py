@@ -0,0 +1,180 @@
+import struct
+import sys
+import time
+from array import array
+from mmap import ACCESS_READ, mmap
+from typing import Iterable, Iterator, TypedDict
+
+from blfparser import (BaseObject, parse_base_object, parse_container_objects,
+                       parse_file_header, parse_log_container_mm,
+                       straddle_size)
+from constants import (BRS, CAN_FD_MESSAGE, CAN_FD_MESSAGE_64,
+                       CAN_FD_MESSAGE_64_STRUCT, CAN_FD_MESSAGE_STRUCT,
+                       CAN_MESSAGE, CAN_MESSAGE2, CAN_MESSAGE_STRUCT, DIR, ESI,
+                       ETHERNET_FRAME_EX, FDF, LOBJ, OBJ_HEADER_BASE_STRUCT,
+                       OBJ_HEADER_V1_STRUCT, OBJ_HEADER_V2_STRUCT,
+                       TIME_TEN_MICS)
+
+# CANBatch flags
+BATCH_RTR = 0x1
+BATCH_FDF = 0x2
+BATCH_BRS = 0x4
+BATCH_ESI = 0x8
+
+
+class CANBatch(TypedDict):
+    obj_type: array  # H
+    time_ns: array  # q, absolute
+    channel: array  # H
+    dir: array  # B
+    can_id: array  # L
+    dlc: array  # B
+    flags: array  # B, BATCH_RTR | BATCH_FDF | BATCH_BRS | BATCH_ESI
+    data_offset: array  # Q, into payload
+    data_length: array  # L
+    payload: bytearray
+
+
+# CAN rows of one container, the other objects with the row they come before
+Batch = tuple[CANBatch, list[tuple[int, BaseObject]]]
+
+
+def fuse_struct(*structs: struct.Struct) -> struct.Struct:
+    return struct.Struct("<" + "".join(s.format.lstrip("<") for s in structs))
+
+
+# object header + message body in one unpack
+CAN_BATCH_STRUCTS = {}
+for _version, _header in ((1, OBJ_HEADER_V1_STRUCT), (2, OBJ_HEADER_V2_STRUCT)):
+    _k = len(_header.unpack(bytes(_header.size)))  # number of header fields
+    CAN_BATCH_STRUCTS[(_version, CAN_MESSAGE)] = (fuse_struct(_header, CAN_MESSAGE_STRUCT), _k, CAN_MESSAGE)
+    CAN_BATCH_STRUCTS[(_version, CAN_MESSAGE2)] = (fuse_struct(_header, CAN_MESSAGE_STRUCT), _k, CAN_MESSAGE)
+    CAN_BATCH_STRUCTS[(_version, CAN_FD_MESSAGE)] = (fuse_struct(_header, CAN_FD_MESSAGE_STRUCT), _k, CAN_FD_MESSAGE)
+    CAN_BATCH_STRUCTS[(_version, CAN_FD_MESSAGE_64)] = (fuse_struct(_header, CAN_FD_MESSAGE_64_STRUCT), _k, CAN_FD_MESSAGE_64)
+
+
+def new_can_batch() -> CANBatch:
+    return {"obj_type": array("H"),
+            "time_ns": array("q"),
+            "channel": array("H"),
+            "dir": array("B"),
+            "can_id": array("L"),
+            "dlc": array("B"),
+            "flags": array("B"),
+            "data_offset": array("Q"),
+            "data_length": array("L"),
+            "payload": bytearray()}
+
+
+def parse_can_batch(buf: memoryview, first: int, last: int, batch: CANBatch, others: list[tuple[int, BaseObject]],
+                    object_count: int, start_timestamp: int, stop_timestamp: int) -> int:
+    # like parse_base_object, CAN messages go to the columns of batch, the other objects to others
+    structs = CAN_BATCH_STRUCTS
+    base_unpack = OBJ_HEADER_BASE_STRUCT.unpack_from
+    base_size = OBJ_HEADER_BASE_STRUCT.size
+    payload = batch["payload"]
+    offset = len(payload)
+    count = len(batch["time_ns"])
+    rows = []
+    append = rows.append
+    chunks = []
+    while first < last:
+        if last - first < base_size:
+            break  # need more data
+        sig, _, version, obj_size, obj_type = base_unpack(buf, first)
+        if sig != LOBJ:
+            raise Exception("no magic number LOBJ")
+        if last - first < obj_size:
+            break  # need more data
+        fused = structs.get((version, obj_type))
+        if fused is None:
+            others.append((count + len(rows), next(parse_base_object(buf, first, first + obj_size, object_count, start_timestamp, stop_timestamp))))
+        else:
+            s, k, kind = fused
+            m = s.unpack_from(buf, first + base_size)
+            timestamp = m[3] * 10000 if m[0] == TIME_TEN_MICS else m[3]
+            i = first + base_size + s.size
+            if kind == CAN_MESSAGE:
+                channel, flags, dlc, can_id = m[k:k + 4]
+                n = 8
+                dir = flags & DIR
+                bits = (flags >> 7) & BATCH_RTR
+            elif kind == CAN_FD_MESSAGE:
+                channel, flags, dlc, can_id, _, _, fd_flags, n = m[k:k + 8]
+                dir = flags & DIR
+                bits = ((flags >> 7) & BATCH_RTR) | ((fd_flags & (FDF | BRS | ESI)) << 1)
+            else:
+                channel, dlc, n, _, can_id, _, flags = m[k:k + 7]
+                dir = m[k + 12]
+                bits = ((flags >> 4) & BATCH_RTR) | ((flags >> 11) & (BATCH_FDF | BATCH_BRS | BATCH_ESI))
+            end = first + obj_size
+            j = i + n if i + n < end else end
+            if i > end:
+                i = end
+            append((obj_type, start_timestamp + timestamp, channel, dir, can_id, dlc, bits, offset, j - i))
+            chunks.append(buf[i:j])
+            offset += j - i
+        if obj_type not in (CAN_FD_MESSAGE_64, ETHERNET_FRAME_EX):
+            first += obj_size + obj_size % 4
+        else:
+            first += obj_size
+    if rows:
+        payload += b"".join(chunks)
+        for key, column in zip(("obj_type", "time_ns", "channel", "dir", "can_id", "dlc", "flags", "data_offset", "data_length"), zip(*rows)):
+            batch[key].extend(column)
+    return first
+
+
+def parse_container_batch(data: bytes, rest: bytes, skip: int, object_count: int, start_timestamp: int, stop_timestamp: int,
+                          batch: CANBatch, others: list[tuple[int, BaseObject]]) -> tuple[bytes, int]:
+    # like parse_container, returns (rest, skip) carried to the next container
+    if rest:
+        # only the object which straddles the containers is copied
+        need = straddle_size(rest, data)
+        if need < 0:
+            return (b"".join((rest, data)), 0)
+        buf = memoryview(b"".join((rest, data[:need])))
+        first = parse_can_batch(buf, 0, len(buf), batch, others, object_count, start_timestamp, stop_timestamp)
+        skip = first - len(rest)
+    if skip >= len(data):
+        return (b"", skip - len(data))
+    buf = memoryview(data)
+    last = len(buf)
+    first = parse_can_batch(buf, skip, last, batch, others, object_count, start_timestamp, stop_timestamp)
+    if first >= last:
+        return (b"", first - last)  # padding continued in the next container
+    return (bytes(buf[first:]), 0)
+
+
+def parse_container_batches(containers: Iterable[bytes], object_count: int, start_timestamp: int, stop_timestamp: int,
+                            skip: int = 0) -> Iterator[Batch]:
+    # one batch per container, empty ones are skipped
+    rest = b""  # head of an object continued in the next container
+    for data in containers:
+        batch = new_can_batch()
+        others: list[tuple[int, BaseObject]] = []
+        rest, skip = parse_container_batch(data, rest, skip, object_count, start_timestamp, stop_timestamp, batch, others)
+        if batch["time_ns"] or others:
+            yield (batch, others)
+
+
+def main():
+    filename = sys.argv[1]
+    with open(filename, "rb") as fp:
+        with mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+            object_count, start_timestamp, stop_timestamp = parse_file_header(mm)
+            containers = list(parse_log_container_mm(mm))
+    t0 = time.time()
+    for item in parse_container_objects(containers, object_count, start_timestamp, stop_timestamp):
+        pass
+    t1 = time.time()
+    print("scalar", t1 - t0)
+    t0 = time.time()
+    for batch, others in parse_container_batches(containers, object_count, start_timestamp, stop_timestamp):
+        pass
+    t1 = time.time()
+    print("batch", t1 - t0)
+
+
+if __name__ == "__main__":
+    main()
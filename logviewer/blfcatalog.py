@@ -0,0 +1,141 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, TypedDict
+
+from blfindex import load_index_span
+from blfparser import parse_file_header
+from logcache import CACHE_DIRNAME
+
+CATALOG_VERSION = 1
+CATALOG = "catalog.json"
+BLF_SUFFIX = ".blf"
+
+
+class CatalogEntry(TypedDict):
+    path: str
+    size: int
+    mtime_ns: int
+    object_count: int
+    start_timestamp: int
+    stop_timestamp: int
+    containers: int  # -1 without a container index
+    first_time_ns: int  # absolute, from the index if any, otherwise the header
+    last_time_ns: int
+
+
+def catalog_filename(root: str) -> str:
+    return os.path.join(root, CACHE_DIRNAME, CATALOG)
+
+
+def find_blf(root: str) -> Iterator[os.DirEntry]:
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name != CACHE_DIRNAME:
+                            stack.append(entry.path)
+                    elif entry.name.lower().endswith(BLF_SUFFIX) and entry.is_file():
+                        yield entry
+        except OSError:
+            continue  # unreadable directory
+
+
+def scan_file(path: str) -> CatalogEntry | None:
+    # the LOGG header and the first and last entries of the container index, nothing else is read
+    try:
+        st = os.stat(path)
+        with open(path, "rb") as fp:
+            object_count, start_timestamp, stop_timestamp = parse_file_header(fp)
+        span = load_index_span(path)
+    except Exception:
+        return None  # not a BLF file
+    if span is None:
+        containers, first_time_ns, last_time_ns = -1, start_timestamp, stop_timestamp
+    else:
+        containers = span[0]
+        first_time_ns = start_timestamp + span[1]
+        last_time_ns = start_timestamp + span[2]
+    return {"path": path,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "object_count": object_count,
+            "start_timestamp": start_timestamp,
+            "stop_timestamp": stop_timestamp,
+            "containers": containers,
+            "first_time_ns": first_time_ns,
+            "last_time_ns": last_time_ns}
+
+
+def load_catalog(root: str) -> dict[str, CatalogEntry]:
+    try:
+        with open(catalog_filename(root)) as fp:
+            catalog = json.load(fp)
+    except (OSError, ValueError):
+        return {}
+    if catalog.get("version") != CATALOG_VERSION:
+        return {}
+    return {entry["path"]: entry for entry in catalog["files"]}
+
+
+def save_catalog(root: str, entries: dict[str, CatalogEntry]):
+    filename = catalog_filename(root)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename + ".tmp", "w") as fp:
+        json.dump({"version": CATALOG_VERSION, "files": list(entries.values())}, fp)
+    os.replace(filename + ".tmp", filename)
+
+
+def scan_directory(root: str, workers: int | None = None) -> dict[str, CatalogEntry]:
+    # files whose size and mtime are unchanged come from the saved catalog, the others are scanned in a thread pool
+    root = os.path.abspath(root)
+    old = load_catalog(root)
+    entries: dict[str, CatalogEntry] = {}
+    changed = []
+    for item in find_blf(root):
+        st = item.stat()
+        entry = old.get(item.path)
+        if entry is not None and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            entries[item.path] = entry
+        else:
+            changed.append(item.path)
+    with ThreadPoolExecutor(workers or min(32, (os.cpu_count() or 1) * 4)) as executor:  # mostly waiting for the disk
+        for entry in executor.map(scan_file, changed):
+            if entry is not None:
+                entries[entry["path"]] = entry
+    if changed or len(entries) != len(old):
+        try:
+            save_catalog(root, entries)
+        except OSError:
+            pass  # read-only location, scanned again next time
+    return entries
+
+
+def find_files(entries: dict[str, CatalogEntry] | list[CatalogEntry], time_ns: int) -> list[CatalogEntry]:
+    # files covering time_ns, by start time
+    values = entries.values() if isinstance(entries, dict) else entries
+    return sorted((e for e in values if e["first_time_ns"] <= time_ns <= e["last_time_ns"]), key=lambda e: e["first_time_ns"])
+
+
+def main():
+    root = sys.argv[1]
+    t0 = time.time()
+    entries = scan_directory(root)
+    t1 = time.time()
+    entries = scan_directory(root)
+    t2 = time.time()
+    print("scan", len(entries), t1 - t0, "rescan", t2 - t1)
+    if entries:
+        middle = sorted(e["first_time_ns"] for e in entries.values())[len(entries) // 2]
+        t0 = time.time()
+        found = find_files(entries, middle)
+        t1 = time.time()
+        print("find", len(found), t1 - t0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import csv
+import json
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from itertools import accumulate, islice
+from mmap import ACCESS_READ, mmap
+from typing import Iterable, Iterator
+
+from blfindex import get_container_index, parse_time_range
+from blfparser import BaseObject, ObjectFilter, absolute_time, merge_base_object
+from blfwriter import BLFWriter
+from constants import CAN_MSG_EXT
+from logstore import COLUMNS, DIR_NAMES, LAYER_CAN, LAYER_ISOTP, LogStore
+
+CHUNK_ROWS = 65536  # rows per CSV write and per columnar block
+TIME_MAX = 2 ** 63 - 1
+
+CSV_HEADER = ["Date/Time", "Stream", "Layer", "Severity", "Event Type", "Message", "time_ns", "channel", "id", "dir", "data"]
+
+COLUMNAR_MAGIC = b"LVCOLS01"
+COLUMNAR_HEADER = struct.Struct("<8sL")  # magic, length of the JSON column spec which follows
+COLUMNAR_BLOCK = struct.Struct("<QQ")  # rows, payload bytes of the block which follows
+
+
+def select_objects(filenames: list[str], t0: int | None = None, t1: int | None = None,
+                   flt: ObjectFilter | None = None) -> Iterator[BaseObject]:
+    # objects of the files in [t0, t1] (absolute ns) in time order, seeking through the container indexes
+    with ExitStack() as stack:
+        sources = []
+        for filename in filenames:
+            fp = stack.enter_context(open(filename, "rb"))
+            mm = stack.enter_context(mmap(fp.fileno(), length=0, access=ACCESS_READ))
+            index = get_container_index(filename, mm)
+            start = index["start_timestamp"]
+            sources.append(parse_time_range(mm, index, 0 if t0 is None else t0 - start, TIME_MAX if t1 is None else t1 - start, flt))
+        yield from merge_base_object(sources)
+
+
+@contextmanager
+def removed_on_error(filename: str):
+    # no truncated export is left behind, whatever the source or the writer raised
+    try:
+        yield
+    except BaseException:
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        raise
+
+
+def export_blf(objs: Iterable[BaseObject], filename: str, workers: int | None = None) -> int:
+    # re-packs the objects into new containers, compressed by a thread pool and written in order
+    # an object before the first one, out of order in its file, is clamped to the start of the new file
+    objs = iter(objs)
+    first = next(objs, None)
+    start_timestamp = time.time_ns() if first is None else absolute_time(first)
+    start_timestamp -= start_timestamp % 1_000_000_000  # the file header keeps SYSTEMTIME, exact at whole seconds
+    count = 0
+    with removed_on_error(filename), open(filename, "wb") as fp, ThreadPoolExecutor(workers or os.cpu_count() or 1) as executor:
+        writer = BLFWriter(fp, start_timestamp, executor=executor)
+        if first is not None:
+            writer.write(first["obj_type"], absolute_time(first) - start_timestamp, first["obj_data"])
+            count += 1
+        for obj in objs:
+            writer.write(obj["obj_type"], max(absolute_time(obj) - start_timestamp, 0), obj["obj_data"])
+            count += 1
+        writer.close()
+    return count
+
+
+def store_rows(store: LogStore, t0: int | None = None, t1: int | None = None, rows: Iterable[int] | None = None) -> Iterable[int]:
+    # rows of the store in [t0, t1], only those of rows if given (e.g. search hits in ascending order)
+    start = 0 if t0 is None else bisect_left(store.time_ns, t0)
+    stop = len(store) if t1 is None else bisect_right(store.time_ns, t1)
+    if rows is None:
+        return range(start, stop)
+    return (row for row in rows if start <= row < stop)
+
+
+def chunks(rows: Iterable[int], size: int = CHUNK_ROWS) -> Iterator[list[int]]:
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def export_csv(store: LogStore, rows: Iterable[int], filename: str, chunk_rows: int = CHUNK_ROWS) -> int:
+    # the formatted columns and the raw fields, one writerows per chunk, off the GUI thread so without memo
+    count = 0
+    with removed_on_error(filename), open(filename, "w", newline="", encoding="utf-8", buffering=1024 * 1024) as fp:
+        writer = csv.writer(fp)
+        writer.writerow(CSV_HEADER)
+        for chunk in chunks(rows, chunk_rows):
+            writer.writerows([*store.format_row(row, memo=False), store.time_ns[row], store.channel[row],
+                              format_ident(store, row), DIR_NAMES[store.dir[row]] if store.dir[row] < len(DIR_NAMES) else store.dir[row],
+                              store.data(row).hex()] for row in chunk)
+            count += len(chunk)
+    return count
+
+
+def format_ident(store: LogStore, row: int) -> str:
+    ident = store.ident[row]
+    if store.layer[row] in (LAYER_CAN, LAYER_ISOTP):
+        return f"{ident & ~CAN_MSG_EXT:X}x" if ident & CAN_MSG_EXT else f"{ident:X}"
+    return f"{ident:04X}"
+
+
+def export_columns(store: LogStore, rows: Iterable[int], filename: str, chunk_rows: int = CHUNK_ROWS) -> int:
+    # blocks of COLUMNS and payload, data_offset is relative to the payload of its block
+    count = 0
+    spec = json.dumps([[name, typecode, array(typecode).itemsize] for name, typecode in COLUMNS]).encode()
+    payload = store.payload
+    with removed_on_error(filename), open(filename, "wb") as fp:
+        fp.write(COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, len(spec)) + spec)
+        for chunk in chunks(rows, chunk_rows):
+            lengths = array("L", map(store.data_length.__getitem__, chunk))
+            offsets = array("Q", accumulate(lengths, initial=0))
+            fp.write(COLUMNAR_BLOCK.pack(len(chunk), offsets[-1]))
+            for name, typecode in COLUMNS:
+                if name == "data_offset":
+                    column = offsets[:-1]
+                elif name == "data_length":
+                    column = lengths
+                else:
+                    column = array(typecode, map(getattr(store, name).__getitem__, chunk))
+                fp.write(column)
+            offset = store.data_offset
+            fp.write(b"".join(payload[offset[row]:offset[row] + n] for row, n in zip(chunk, lengths)))
+            count += len(chunk)
+    return count
+
+
+def read_columns(filename: str) -> Iterator[tuple[dict[str, array], bytes]]:
+    # the blocks of export_columns
+    with open(filename, "rb") as fp:
+        magic, n = COLUMNAR_HEADER.unpack(fp.read(COLUMNAR_HEADER.size))
+        if magic != COLUMNAR_MAGIC:
+            raise Exception("not a columnar export")
+        spec = json.loads(fp.read(n))
+        while True:
+            data = fp.read(COLUMNAR_BLOCK.size)
+            if not data:
+                return
+            rows, payload_size = COLUMNAR_BLOCK.unpack(data)
+            columns = {}
+            for name, typecode, itemsize in spec:
+                column = array(typecode)
+                column.frombytes(fp.read(rows * itemsize))
+                columns[name] = column
+            yield columns, fp.read(payload_size)
+
+
+def main():
+    filenames = sys.argv[1:]
+    out = "export"
+    t0 = time.time()
+    count = export_blf(select_objects(filenames), out + ".blf")
+    t1 = time.time()
+    print("blf", count, t1 - t0, os.path.getsize(out + ".blf"))
+    store = LogStore()
+    for item in select_objects(filenames):
+        store.append(item)
+    t0 = time.time()
+    count = export_csv(store, range(len(store)), out + ".csv")
+    t1 = time.time()
+    print("csv", count, t1 - t0, os.path.getsize(out + ".csv"))
+    t0 = time.time()
+    count = export_columns(store, range(len(store)), out + ".lvc")
+    t1 = time.time()
+    print("columns", count, t1 - t0, os.path.getsize(out + ".lvc"))
+
+
+if __name__ == "__main__":
+    main()
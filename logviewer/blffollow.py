@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+from typing import Iterator
+
+from blfparser import (BaseObject, parse_container, parse_file_header,
+                       parse_log_container_tail)
+from constants import FILE_HEADER_STRUCT, LOGG
+
+
+class BLFFollower:
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.pos = 0  # offset after the last fully parsed container, 0 until the file header is read
+        self.rest = b""  # head of an object continued in the next container
+        self.skip = 0
+        self.object_count = 0
+        self.start_timestamp = 0
+        self.stop_timestamp = 0
+
+    def poll(self) -> Iterator[BaseObject]:
+        # objects in the containers appended since the last poll
+        with open(self.filename, "rb") as fp:
+            size = os.fstat(fp.fileno()).st_size
+            if self.pos == 0:
+                if size < FILE_HEADER_STRUCT.size or fp.read(len(LOGG)) == bytes(len(LOGG)):
+                    return  # header not written yet, some writers leave it zeroed until they close the file
+                fp.seek(0)
+                self.object_count, self.start_timestamp, self.stop_timestamp = parse_file_header(fp)
+                if fp.tell() > size:
+                    return
+                self.pos = fp.tell()
+            if size <= self.pos:
+                return
+            fp.seek(self.pos)
+            for pos, data in parse_log_container_tail(fp):
+                self.rest, self.skip = yield from parse_container(data, self.rest, self.skip,
+                                                                  self.object_count, self.start_timestamp, self.stop_timestamp)
+                self.pos = pos
+
+
+def main():
+    filename = sys.argv[1]
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    follower = BLFFollower(filename)
+    count = 0
+    while True:
+        n = sum(1 for _ in follower.poll())
+        if n:
+            count += n
+            print(f"{count} objects, offset {follower.pos}")
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    main()
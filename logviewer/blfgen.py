@@ -0,0 +1,68 @@
+import random
+import struct
+import sys
+import time
+
+from blfwriter import (CONTAINER_SIZE, BLFWriter, pack_can_fd_message_64,
+                       pack_can_message, pack_ethernet_frame_ex)
+from constants import (BRS_64, CAN_FD_MESSAGE_64, CAN_MESSAGE, CAN_MSG_EXT,
+                       DLC_MAP, ETHERNET_FRAME_EX, FDF_64)
+
+DEFAULT_MIX = {"can": 6, "can_fd_64": 3, "ethernet_ex": 1}
+START_TIMESTAMP = 1_577_880_000_000_000_000  # 2020-01-01 12:00:00 UTC, fixed for reproducible files
+
+
+def generate_objects(rnd: random.Random, mix: dict[str, int]):
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    time_ns = 0
+    while True:
+        time_ns += rnd.randint(1_000, 200_000)
+        kind = rnd.choices(kinds, weights)[0]
+        if kind == "can":
+            data = rnd.randbytes(rnd.randint(0, 8))
+            yield (CAN_MESSAGE, time_ns, pack_can_message(rnd.randint(1, 4), rnd.randint(0, 1), rnd.randint(0, 0x7FF), data))
+        elif kind == "can_fd_64":
+            dlc = rnd.randint(0, 15)
+            can_id = rnd.randint(0, 0x1FFFFFFF) | CAN_MSG_EXT if rnd.random() < 0.3 else rnd.randint(0, 0x7FF)
+            flags = FDF_64 | (BRS_64 if rnd.random() < 0.5 else 0)
+            data = rnd.randbytes(DLC_MAP[dlc])
+            yield (CAN_FD_MESSAGE_64, time_ns, pack_can_fd_message_64(rnd.randint(1, 4), rnd.randint(0, 1), can_id, dlc, flags, data))
+        elif kind == "ethernet_ex":
+            payload = rnd.randbytes(rnd.randint(46, 1500))
+            if rnd.random() < 0.5:
+                header = rnd.randbytes(12) + struct.pack(">HHH", 0x8100, rnd.randint(0, 0xFFFF), 0x0800)
+            else:
+                header = rnd.randbytes(12) + struct.pack(">H", 0x86DD)
+            yield (ETHERNET_FRAME_EX, time_ns, pack_ethernet_frame_ex(1, rnd.randint(0, 1), header + payload))
+        else:
+            raise Exception(f"unknown object kind {kind}")
+
+
+def generate_blf(filename: str, size: int, mix: dict[str, int] = DEFAULT_MIX, compressed: bool = True,
+                 container_size: int = CONTAINER_SIZE, seed: int = 0) -> int:
+    # writes objects until about size bytes of uncompressed objects, returns the object count
+    rnd = random.Random(seed)
+    with open(filename, "wb") as fp:
+        writer = BLFWriter(fp, START_TIMESTAMP, compressed, container_size)
+        total = 0
+        for obj_type, time_ns, body in generate_objects(rnd, mix):
+            writer.write(obj_type, time_ns, body)
+            total += len(body)
+            if total >= size:
+                break
+        writer.close()
+    return writer.object_count
+
+
+def main():
+    filename = sys.argv[1]
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000_000
+    t0 = time.time()
+    count = generate_blf(filename, size)
+    t1 = time.time()
+    print(f"{count} objects written to {filename} in {t1 - t0:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+import os
+import struct
+import sys
+import time
+from bisect import bisect_left, bisect_right
+from mmap import ACCESS_READ, mmap
+from typing import Iterator, TypedDict
+
+from blfparser import (BaseObject, ObjectFilter, parse_container_objects,
+                       parse_file_header, parse_log_container_header_mm,
+                       read_log_container_mm)
+from cancel import CancelToken
+from constants import (CAN_FD_MESSAGE_64, ETHERNET_FRAME_EX, LOBJ,
+                       LOG_CONTAINER_STRUCT, OBJ_HEADER_BASE_STRUCT,
+                       OBJ_HEADER_V1_STRUCT, OBJ_HEADER_V2_STRUCT,
+                       TIME_TEN_MICS)
+
+INDEX_MAGIC = b"LIDX"
+INDEX_VERSION = 1
+INDEX_HEADER_STRUCT = struct.Struct("<4sLQQQL")
+INDEX_ENTRY_STRUCT = struct.Struct("<QLHLLlqq")
+
+
+class ContainerEntry(TypedDict):
+    offset: int
+    obj_size: int
+    compression_method: int
+    compressed_size: int
+    uncompressed_size: int
+    skip: int  # bytes at the top of the container which belong to earlier objects
+    first_time_ns: int
+    last_time_ns: int
+
+
+class ContainerIndex(TypedDict):
+    object_count: int
+    start_timestamp: int
+    stop_timestamp: int
+    data_offset: int
+    entries: list[ContainerEntry]
+
+
+def index_filename(filename: str) -> str:
+    return filename + ".idx"
+
+
+def parse_object_time(header: bytes | memoryview) -> tuple[int, int, int]:
+    # returns (header length needed, obj_size + padding, time_ns) of the object at the top of header
+    sig, _, version, obj_size, obj_type = OBJ_HEADER_BASE_STRUCT.unpack_from(header)
+    if sig != LOBJ:
+        raise Exception("no magic number LOBJ")
+    if version == 1:
+        size = OBJ_HEADER_BASE_STRUCT.size + OBJ_HEADER_V1_STRUCT.size
+        if len(header) < size:
+            return (size, 0, 0)
+        flags, _, _, timestamp = OBJ_HEADER_V1_STRUCT.unpack_from(header, OBJ_HEADER_BASE_STRUCT.size)
+    elif version == 2:
+        size = OBJ_HEADER_BASE_STRUCT.size + OBJ_HEADER_V2_STRUCT.size
+        if len(header) < size:
+            return (size, 0, 0)
+        flags, _, _, timestamp, _ = OBJ_HEADER_V2_STRUCT.unpack_from(header, OBJ_HEADER_BASE_STRUCT.size)
+    else:
+        raise Exception("unknown header version")
+    if obj_type not in (CAN_FD_MESSAGE_64, ETHERNET_FRAME_EX):
+        obj_size += obj_size % 4
+    if flags == TIME_TEN_MICS:
+        time_ns = timestamp * 10000
+    else:
+        time_ns = timestamp
+    return (size, obj_size, time_ns)
+
+
+class ContainerIndexBuilder:
+    # entries of the containers fed in file order with their decompressed data, by a scan or by a load pass
+
+    def __init__(self):
+        self.entries: list[ContainerEntry] = []
+        self.skip = 0
+        self.rest = b""  # header of an object continued in the next container
+        self.last_time_ns = -1
+        self.owner = -1  # entry of the container where rest starts
+
+    def add(self, pos: int, obj_size: int, compression_method: int, data: bytes):
+        entries = self.entries
+        n = len(data)
+        if self.rest:
+            header = self.rest + data[:64]
+            size = OBJ_HEADER_BASE_STRUCT.size
+            if len(header) >= size:
+                size, size_, time_ns = parse_object_time(header)
+            if len(header) >= size:
+                # the object belongs to the container where it starts
+                if entries[self.owner]["first_time_ns"] < 0:
+                    entries[self.owner]["first_time_ns"] = time_ns
+                entries[self.owner]["last_time_ns"] = self.last_time_ns = time_ns
+                self.skip = size_ - len(self.rest)
+                self.rest = b""
+        entry: ContainerEntry = {"offset": pos,
+                                 "obj_size": obj_size,
+                                 "compression_method": compression_method,
+                                 "compressed_size": obj_size - OBJ_HEADER_BASE_STRUCT.size - LOG_CONTAINER_STRUCT.size,
+                                 "uncompressed_size": n,
+                                 "skip": -1 if self.rest else self.skip,  # -1: no object can be decoded from here
+                                 "first_time_ns": -1,
+                                 "last_time_ns": self.last_time_ns}
+        entries.append(entry)
+        if self.rest:
+            self.rest += data
+            return
+        i = self.skip
+        while i < n:
+            if n - i < OBJ_HEADER_BASE_STRUCT.size:
+                break
+            size, size_, time_ns = parse_object_time(data[i:i + 64])
+            if n - i < size:
+                break
+            if entry["first_time_ns"] < 0:
+                entry["first_time_ns"] = time_ns
+            entry["last_time_ns"] = self.last_time_ns = time_ns
+            i += size_
+        if i < n:
+            self.rest = data[i:]
+            self.owner = len(entries) - 1
+            self.skip = 0
+        else:
+            self.skip = i - n
+
+    def index(self, object_count: int, start_timestamp: int, stop_timestamp: int, data_offset: int) -> ContainerIndex:
+        for entry in self.entries:
+            if entry["first_time_ns"] < 0:
+                entry["first_time_ns"] = entry["last_time_ns"]
+        return {"object_count": object_count,
+                "start_timestamp": start_timestamp,
+                "stop_timestamp": stop_timestamp,
+                "data_offset": data_offset,
+                "entries": self.entries}
+
+
+def scan_container_index(mm: mmap, cancel: CancelToken | None = None) -> ContainerIndex:
+    object_count, start_timestamp, stop_timestamp = parse_file_header(mm)
+    data_offset = mm.tell()
+    builder = ContainerIndexBuilder()
+    for pos, obj_size, compression_method, uncompressed_size in parse_log_container_header_mm(mm):
+        if cancel is not None:
+            cancel.check()  # scanning a large file decompresses all of it
+        builder.add(pos, obj_size, compression_method, read_log_container_mm(mm, pos, obj_size, compression_method, uncompressed_size))
+    return builder.index(object_count, start_timestamp, stop_timestamp, data_offset)
+
+
+def save_container_index(filename: str, index: ContainerIndex) -> None:
+    st = os.stat(filename)
+    entries = index["entries"]
+    with open(index_filename(filename) + ".tmp", "wb") as fp:
+        fp.write(INDEX_HEADER_STRUCT.pack(INDEX_MAGIC, INDEX_VERSION, st.st_size, st.st_mtime_ns, index["data_offset"], len(entries)))
+        fp.write(b"".join(INDEX_ENTRY_STRUCT.pack(e["offset"], e["obj_size"], e["compression_method"], e["compressed_size"],
+                                                  e["uncompressed_size"], e["skip"], e["first_time_ns"], e["last_time_ns"])
+                          for e in entries))
+    os.replace(index_filename(filename) + ".tmp", index_filename(filename))
+
+
+def load_container_index(filename: str, object_count: int, start_timestamp: int, stop_timestamp: int) -> ContainerIndex | None:
+    st = os.stat(filename)
+    try:
+        with open(index_filename(filename), "rb") as fp:
+            data = fp.read()
+    except OSError:
+        return None
+    if len(data) < INDEX_HEADER_STRUCT.size:
+        return None
+    magic, version, file_size, mtime_ns, data_offset, count = INDEX_HEADER_STRUCT.unpack_from(data)
+    if magic != INDEX_MAGIC or version != INDEX_VERSION:
+        return None
+    if file_size != st.st_size or mtime_ns != st.st_mtime_ns:
+        return None  # stale
+    if len(data) != INDEX_HEADER_STRUCT.size + count * INDEX_ENTRY_STRUCT.size:
+        return None
+    entries: list[ContainerEntry] = [{"offset": e[0],
+                                      "obj_size": e[1],
+                                      "compression_method": e[2],
+                                      "compressed_size": e[3],
+                                      "uncompressed_size": e[4],
+                                      "skip": e[5],
+                                      "first_time_ns": e[6],
+                                      "last_time_ns": e[7]}
+                                     for e in INDEX_ENTRY_STRUCT.iter_unpack(data[INDEX_HEADER_STRUCT.size:])]
+    return {"object_count": object_count,
+            "start_timestamp": start_timestamp,
+            "stop_timestamp": stop_timestamp,
+            "data_offset": data_offset,
+            "entries": entries}
+
+
+def load_index_span(filename: str) -> tuple[int, int, int] | None:
+    # (containers, first_time_ns, last_time_ns) of a fresh index without reading its entries in between
+    st = os.stat(filename)
+    try:
+        with open(index_filename(filename), "rb") as fp:
+            data = fp.read(INDEX_HEADER_STRUCT.size)
+            if len(data) < INDEX_HEADER_STRUCT.size:
+                return None
+            magic, version, file_size, mtime_ns, _, count = INDEX_HEADER_STRUCT.unpack(data)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION or file_size != st.st_size or mtime_ns != st.st_mtime_ns:
+                return None
+            if count == 0:
+                return (0, 0, 0)
+            first = INDEX_ENTRY_STRUCT.unpack(fp.read(INDEX_ENTRY_STRUCT.size))
+            fp.seek(INDEX_HEADER_STRUCT.size + (count - 1) * INDEX_ENTRY_STRUCT.size)
+            last = INDEX_ENTRY_STRUCT.unpack(fp.read(INDEX_ENTRY_STRUCT.size))
+    except (OSError, struct.error):
+        return None
+    return (count, first[6], last[7])
+
+
+def get_container_index(filename: str, mm: mmap, cancel: CancelToken | None = None) -> ContainerIndex:
+    pos = mm.tell()
+    mm.seek(0)
+    object_count, start_timestamp, stop_timestamp = parse_file_header(mm)
+    index = load_container_index(filename, object_count, start_timestamp, stop_timestamp)
+    if index is None:
+        mm.seek(0)
+        index = scan_container_index(mm, cancel)
+        try:
+            save_container_index(filename, index)
+        except OSError:
+            pass  # read-only location, scan again next time
+    mm.seek(pos)
+    return index
+
+
+def parse_log_container_index(mm: mmap, index: ContainerIndex, start: int = 0, stop: int | None = None) -> Iterator[bytes]:
+    for entry in index["entries"][start:stop]:
+        yield read_log_container_mm(mm, entry["offset"], entry["obj_size"], entry["compression_method"], entry["uncompressed_size"])
+
+
+def parse_base_object_index(mm: mmap, index: ContainerIndex, start: int = 0, stop: int | None = None,
+                            flt: ObjectFilter | None = None) -> Iterator[BaseObject]:
+    entries = index["entries"]
+    while start < len(entries) and entries[start]["skip"] < 0:
+        start += 1  # no object starts in the container
+    if start >= len(entries):
+        return
+    yield from parse_container_objects(parse_log_container_index(mm, index, start, stop),
+                                       index["object_count"], index["start_timestamp"], index["stop_timestamp"],
+                                       entries[start]["skip"], flt)
+
+
+def parse_base_object_range(mm: mmap, index: ContainerIndex, start: int, stop: int) -> Iterator[BaseObject]:
+    # objects which start in the containers [start, stop), completing the last one from the following containers
+    entries = index["entries"]
+    while start < stop and entries[start]["skip"] < 0:
+        start += 1  # no object starts in the container
+    if start >= stop:
+        return
+
+    def containers():
+        yield from parse_log_container_index(mm, index, start, stop)
+        for entry in entries[stop:]:
+            data = read_log_container_mm(mm, entry["offset"], entry["obj_size"], entry["compression_method"], entry["uncompressed_size"])
+            if 0 <= entry["skip"] < len(data):
+                yield data[:entry["skip"]]
+                return
+            yield data
+
+    yield from parse_container_objects(containers(), index["object_count"], index["start_timestamp"], index["stop_timestamp"],
+                                       entries[start]["skip"])
+
+
+def find_container(index: ContainerIndex, time_ns: int) -> int:
+    # first container which may hold an object at or after time_ns
+    entries = index["entries"]
+    k = bisect_left(entries, time_ns, key=lambda e: e["last_time_ns"])
+    while k > 0 and (k >= len(entries) or entries[k]["skip"] < 0):
+        k -= 1  # decoding has to start where the object starts
+    return k
+
+
+def parse_time_range(mm: mmap, index: ContainerIndex, t0: int, t1: int, flt: ObjectFilter | None = None) -> Iterator[BaseObject]:
+    # t0, t1 are relative to the start of measurement like BaseObject.time_ns
+    entries = index["entries"]
+    start = find_container(index, t0)
+    stop = bisect_right(entries, t1, lo=start, key=lambda e: e["first_time_ns"])
+    stop = min(stop + 1, len(entries))  # the last object may continue in the next container
+    for item in parse_base_object_index(mm, index, start, stop, flt):
+        time_ns = item["time_ns"]
+        if t0 <= time_ns <= t1:
+            yield item
+
+
+def main():
+    filename = sys.argv[1]
+    with open(filename, "rb") as fp:
+        with mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+            t0 = time.time()
+            index = scan_container_index(mm)
+            t1 = time.time()
+            print("scan", len(index["entries"]), t1 - t0)
+            save_container_index(filename, index)
+            mm.seek(0)
+            object_count, start_timestamp, stop_timestamp = parse_file_header(mm)
+            t0 = time.time()
+            index = load_container_index(filename, object_count, start_timestamp, stop_timestamp)
+            t1 = time.time()
+            print("load", t1 - t0)
+            entries = index["entries"]
+            if entries:
+                middle = (entries[0]["first_time_ns"] + entries[-1]["last_time_ns"]) // 2
+                t0 = time.time()
+                count = sum(1 for _ in parse_time_range(mm, index, middle, middle + 1_000_000_000))
+                t1 = time.time()
+                print("time range (1 s)", count, t1 - t0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
-from multiprocessing import Lock
+import heapq
+import os
+import sys
 import time
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, wait
 from datetime import datetime
 from mmap import ACCESS_READ, mmap
-from typing import BinaryIO, Iterator, Literal, TypedDict
+from multiprocessing import Lock
+from typing import (Any, BinaryIO, Callable, Container, Generator, Iterable,
+                    Iterator, Literal, TypedDict)
 from zlib import decompress
 
 from constants import (BRS, BRS_64, CAN_ERROR, CAN_ERROR_EXT, CAN_FD_MESSAGE,
@@ -18,6 +25,7 @@ from constants import (BRS, BRS_64, CAN_ERROR, CAN_ERROR_EXT, CAN_FD_MESSAGE,
                        TIME_ONE_NANS, TIME_TEN_MICS, VALID_CHECKSUM,
                        VALID_FRAME_HANDLE, VALID_HW_CHANNEL,
                        VLAN_TPID_TCI_TYPE, ZLIB_DEFLATE)
+from pipestats import STATS
 
 
 class CANMessage(TypedDict):
@@ -58,6 +66,18 @@ class BaseObject(TypedDict):
     msg: CANMessage | EthernetFrame | None
 
 
+Build = Callable[[int, int, memoryview], Any]  # (time_ns, obj_type, obj_data) -> item
+
+
+class ObjectFilter(TypedDict, total=False):
+    # every given field must match, objects without a field are dropped when it is given
+    obj_types: set[int]
+    channels: set[int]
+    dirs: set[int]
+    can_ids: list[tuple[int, int]]  # inclusive ranges, extended ids with CAN_MSG_EXT
+    eth_types: set[int]
+
+
 def to_nanosecond(year: int, month: int, weekday: int, day: int, hour: int, minute: int, second: int, millisecond: int) -> int:
     try:
         t = datetime(year, month, day, hour, minute, second, millisecond * 1000)
@@ -107,17 +127,56 @@ def parse_log_container(fp: mmap | BinaryIO) -> Iterator[bytes]:
         read_size = len(data)
         if read_size < data_size:
             raise Exception("truncated log container body")
+        if STATS.enabled:
+            t0 = time.thread_time()
         if compression_method == NO_COMPRESSION:
             pass
         elif compression_method == ZLIB_DEFLATE:
             data = decompress(data, 15, uncompressed_size)
         else:
             raise Exception("unknown compression method")
+        if STATS.enabled:
+            STATS.add("bytes_read", obj_size)
+            STATS.add("containers")
+            STATS.add("decompress_cpu_s", time.thread_time() - t0)
         yield data
         fp.read(obj_size % 4)
 
 
-def parse_log_container_mm(mm: mmap) -> Iterator[bytes]:
+def parse_log_container_tail(fp: BinaryIO) -> Iterator[tuple[int, bytes]]:
+    # (end position, data) of the complete containers from the current position of a file being written,
+    # stops silently at a partial trailing container which is read again by the next call
+    while True:
+        pos = fp.tell()
+        data = fp.read(OBJ_HEADER_BASE_STRUCT.size + LOG_CONTAINER_STRUCT.size)
+        if len(data) < OBJ_HEADER_BASE_STRUCT.size + LOG_CONTAINER_STRUCT.size:
+            fp.seek(pos)
+            return  # not yet complete
+        header = OBJ_HEADER_BASE_STRUCT.unpack_from(data)
+        if header[0] != LOBJ:
+            raise Exception("no magic number LOBJ")
+        obj_size = header[3]
+        obj_type = header[4]
+        if obj_type != LOG_CONTAINER:
+            raise Exception("obj_type not equal to LOG_CONTAINER")
+        compression_method, uncompressed_size = LOG_CONTAINER_STRUCT.unpack_from(data, OBJ_HEADER_BASE_STRUCT.size)
+        data_size = obj_size - OBJ_HEADER_BASE_STRUCT.size - LOG_CONTAINER_STRUCT.size
+        data = fp.read(data_size)
+        if len(data) < data_size:
+            fp.seek(pos)
+            return  # not yet complete
+        if compression_method == NO_COMPRESSION:
+            pass
+        elif compression_method == ZLIB_DEFLATE:
+            data = decompress(data, 15, uncompressed_size)
+        else:
+            raise Exception("unknown compression method")
+        end = pos + obj_size + obj_size % 4
+        fp.seek(end)
+        yield (end, data)
+
+
+def parse_log_container_header_mm(mm: mmap) -> Iterator[tuple[int, int, int, int]]:
     pos = mm.tell()
     end = mm.size()
     while pos < end:
@@ -131,35 +190,77 @@ def parse_log_container_mm(mm: mmap) -> Iterator[bytes]:
         if obj_type != LOG_CONTAINER:
             raise Exception("obj_type not equal to LOG_CONTAINER")
         compression_method, uncompressed_size = LOG_CONTAINER_STRUCT.unpack_from(mm, pos + OBJ_HEADER_BASE_STRUCT.size)
-        data = mm[pos + OBJ_HEADER_BASE_STRUCT.size + LOG_CONTAINER_STRUCT.size:pos + obj_size]
-        if compression_method == NO_COMPRESSION:
-            pass
-        elif compression_method == ZLIB_DEFLATE:
-            data = decompress(data, 15, uncompressed_size)
-        else:
-            raise Exception("unknown compression method")
-        yield data
+        yield (pos, obj_size, compression_method, uncompressed_size)
         pos = pos + obj_size + obj_size % 4
 
 
-def q_add(buf: memoryview, first: int, last: int, data: bytes) -> None | tuple[int, int]:
-    n = len(buf)
-    p = last + len(data)
-    r = p - n
-    if r > 0:
-        if r > first:
-            return None  # queue is full
-        else:
-            buf[last:] = data[:-r]
-            buf[:r] = data[-r:]
-            last = r
+def read_log_container_mm(mm: mmap, pos: int, obj_size: int, compression_method: int, uncompressed_size: int) -> bytes:
+    if STATS.enabled:
+        return read_log_container_mm_stats(mm, pos, obj_size, compression_method, uncompressed_size)
+    data = mm[pos + OBJ_HEADER_BASE_STRUCT.size + LOG_CONTAINER_STRUCT.size:pos + obj_size]
+    if compression_method == NO_COMPRESSION:
+        pass
+    elif compression_method == ZLIB_DEFLATE:
+        data = decompress(data, 15, uncompressed_size)
+    else:
+        raise Exception("unknown compression method")
+    return data
+
+
+def read_log_container_mm_stats(mm: mmap, pos: int, obj_size: int, compression_method: int, uncompressed_size: int) -> bytes:
+    # CPU time of the calling thread, the threads of a pool add up to more than the wall time
+    t0 = time.thread_time()
+    data = mm[pos + OBJ_HEADER_BASE_STRUCT.size + LOG_CONTAINER_STRUCT.size:pos + obj_size]
+    t1 = time.thread_time()
+    if compression_method == NO_COMPRESSION:
+        pass
+    elif compression_method == ZLIB_DEFLATE:
+        data = decompress(data, 15, uncompressed_size)
     else:
-        buf[last:p] = data
-        last = p
-    return (first, last)
+        raise Exception("unknown compression method")
+    t2 = time.thread_time()
+    STATS.add("bytes_read", obj_size)
+    STATS.add("containers")
+    STATS.add("read_cpu_s", t1 - t0)
+    STATS.add("decompress_cpu_s", t2 - t1)
+    return data
 
 
-def parse_base_object(buf: memoryview, first: int, last: int, object_count: int, start_timestamp: int, stop_timestamp: int) -> Iterator[BaseObject]:
+def parse_log_container_mm(mm: mmap) -> Iterator[bytes]:
+    for pos, obj_size, compression_method, uncompressed_size in parse_log_container_header_mm(mm):
+        yield read_log_container_mm(mm, pos, obj_size, compression_method, uncompressed_size)
+
+
+def read_log_container_threaded(mm: mmap, headers: Iterable[tuple[int, int, int, int]], executor: Executor, in_flight: int) -> Iterator[bytes]:
+    # containers of headers (pos, obj_size, compression_method, uncompressed_size) decompressed in the pool,
+    # yielded in file order with at most in_flight containers pending
+    pending: deque[Future[bytes]] = deque()
+    try:
+        for header in headers:
+            pending.append(executor.submit(read_log_container_mm, mm, *header))
+            if len(pending) >= in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        wait(pending)  # no thread reads mm after it is closed
+
+
+def parse_log_container_threaded(mm: mmap, workers: int | None = None, in_flight: int | None = None) -> Iterator[bytes]:
+    # drop-in for parse_log_container_mm, zlib releases the GIL
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(workers) as executor:
+        yield from read_log_container_threaded(mm, parse_log_container_header_mm(mm), executor, in_flight or 2 * workers)
+
+
+def parse_base_object(buf: memoryview, first: int, last: int, object_count: int, start_timestamp: int, stop_timestamp: int,
+                      flt: ObjectFilter | None = None, build: Build | None = None) -> Generator[BaseObject, None, int]:
+    # build(time_ns, obj_type, obj_data) makes another item type than BaseObject, e.g. the records of blfrecord
+    plan = None if flt is None else compile_filter(flt)
+    if plan is not None:
+        checks, channels, dirs = plan
     while first < last:
         if last - first < OBJ_HEADER_BASE_STRUCT.size:
             break  # need more data
@@ -172,41 +273,41 @@ def parse_base_object(buf: memoryview, first: int, last: int, object_count: int,
         obj_type = header[4]
         if last - first < obj_size:
             break  # need more data
-        i = first + OBJ_HEADER_BASE_STRUCT.size
-        if version == 1:
-            m = OBJ_HEADER_V1_STRUCT.unpack_from(buf, i)
-            flags = m[0]
-            timestamp = m[3]
-            i += OBJ_HEADER_V1_STRUCT.size
-        elif version == 2:
-            m = OBJ_HEADER_V2_STRUCT.unpack_from(buf, i)
-            flags = m[0]
-            timestamp = m[3]
-            i += OBJ_HEADER_V2_STRUCT.size
-        else:
-            raise Exception("unknown header version")
-        obj_data = buf[i:first + obj_size]
+        i = first
         if obj_type not in (CAN_FD_MESSAGE_64, ETHERNET_FRAME_EX):
             first += obj_size + obj_size % 4
         else:
             first += obj_size
+        if plan is not None:
+            check = checks.get(obj_type)
+            if check is None:
+                continue  # skipped by the base header only
+        header_struct = OBJ_HEADER_STRUCTS.get(version)
+        if header_struct is None:
+            raise Exception("unknown header version")
+        j = i + OBJ_HEADER_BASE_STRUCT.size + header_struct.size
+        if plan is not None and check[0] is not None:
+            # checked by the raw fields before any object is built
+            channel, dir, ident = check[0](buf, j)
+            if channels is not None and channel not in channels:
+                continue
+            if dirs is not None and dir not in dirs:
+                continue
+            if check[1] is not None and ident not in check[1]:
+                continue
+        m = header_struct.unpack_from(buf, i + OBJ_HEADER_BASE_STRUCT.size)
+        flags = m[0]
+        timestamp = m[3]
+        obj_data = buf[j:i + obj_size]
         if flags == TIME_TEN_MICS:
             time_ns = timestamp * 10000
         else:
             time_ns = timestamp
-        msg: CANMessage | EthernetFrame | None
-        if obj_type in (CAN_MESSAGE, CAN_MESSAGE2):
-            msg = parse_can_message(obj_data)
-        elif obj_type == CAN_FD_MESSAGE:
-            msg = parse_can_fd_message(obj_data)
-        elif obj_type == CAN_FD_MESSAGE_64:
-            msg = parse_can_fd_message_64(obj_data)
-        elif obj_type == ETHERNET_FRAME:
-            msg = parse_ethernet_frame(obj_data)
-        elif obj_type == ETHERNET_FRAME_EX:
-            msg = parse_ethernet_frame_ex(obj_data)
-        else:
-            msg = None
+        if build is not None:
+            yield build(time_ns, obj_type, obj_data)
+            continue
+        decode = DECODERS.get(obj_type)
+        msg: CANMessage | EthernetFrame | None = None if decode is None else decode(obj_data)
         item: BaseObject = {"type": "base",
                             "object_count": object_count,
                             "start_timestamp": start_timestamp,
@@ -216,104 +317,268 @@ def parse_base_object(buf: memoryview, first: int, last: int, object_count: int,
                             "obj_data": obj_data,
                             "msg": msg}
         yield item
+    return first
 
 
-def parse_can_message(obj_data: memoryview) -> CANMessage:
+def straddle_size(rest: bytes, data: bytes) -> int:
+    # bytes of data which complete the object at the top of rest, -1 if data is not enough
+    size = OBJ_HEADER_BASE_STRUCT.size
+    if len(rest) < size:
+        if len(rest) + len(data) < size:
+            return -1
+        header = b"".join((rest, data[:size - len(rest)]))
+    else:
+        header = rest
+    obj_size = OBJ_HEADER_BASE_STRUCT.unpack_from(header)[3]
+    need = obj_size - len(rest)
+    return need if need <= len(data) else -1
+
+
+def parse_container(data: bytes, rest: bytes, skip: int, object_count: int, start_timestamp: int, stop_timestamp: int,
+                    flt: ObjectFilter | None = None, build: Build | None = None) -> Generator[BaseObject, None, tuple[bytes, int]]:
+    # objects in one container, returns (rest, skip) carried to the next container
+    if rest:
+        # only the object which straddles the containers is copied
+        need = straddle_size(rest, data)
+        if need < 0:
+            return (b"".join((rest, data)), 0)
+        buf = memoryview(b"".join((rest, data[:need])))
+        first = yield from parse_base_object(buf, 0, len(buf), object_count, start_timestamp, stop_timestamp, flt, build)
+        skip = first - len(rest)
+    if skip >= len(data):
+        return (b"", skip - len(data))
+    buf = memoryview(data)
+    last = len(buf)
+    first = yield from parse_base_object(buf, skip, last, object_count, start_timestamp, stop_timestamp, flt, build)
+    if first >= last:
+        return (b"", first - last)  # padding continued in the next container
+    return (bytes(buf[first:]), 0)
+
+
+def parse_container_objects(containers: Iterable[bytes], object_count: int, start_timestamp: int, stop_timestamp: int, skip: int = 0,
+                            flt: ObjectFilter | None = None, build: Build | None = None) -> Iterator[BaseObject]:
+    rest = b""  # head of an object continued in the next container
+    for data in containers:
+        rest, skip = yield from parse_container(data, rest, skip, object_count, start_timestamp, stop_timestamp, flt, build)
+
+
+def parse_base_object_file(filename: str, flt: ObjectFilter | None = None) -> Iterator[BaseObject]:
+    with open(filename, "rb") as fp:
+        with mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+            object_count, start_timestamp, stop_timestamp = parse_file_header(mm)
+            yield from parse_container_objects(parse_log_container_mm(mm), object_count, start_timestamp, stop_timestamp, flt=flt)
+
+
+def absolute_time(item: BaseObject) -> int:
+    return item["start_timestamp"] + item["time_ns"]
+
+
+def merge_base_object(iterables: Iterable[Iterable[BaseObject]]) -> Iterator[BaseObject]:
+    # each source holds one decompressed container at a time
+    return heapq.merge(*iterables, key=absolute_time)
+
+
+CANFields = tuple[int, int, int, int, bool, bool, bool, bool, memoryview]  # channel, dir, can_id, dlc, rtr, fdf, brs, esi, data
+EthernetFields = tuple[int, int, int, bytes | memoryview, bytes | memoryview, int, int, int, int, memoryview]  # channel, hw_channel, dir,
+# mac_da, mac_sa, vlan_tpid, vlan_pri, vlan_id, eth_type, data
+
+
+def can_message_fields(obj_data: memoryview) -> CANFields:
     channel, flags, dlc, can_id = CAN_MESSAGE_STRUCT.unpack_from(obj_data)
     data = obj_data[CAN_MESSAGE_STRUCT.size:CAN_MESSAGE_STRUCT.size + 8]
-    return {"type": "can",
-            "channel": channel,
-            "dir": flags & DIR,
-            "can_id": can_id,
-            "dlc": dlc,
-            "rtr": flags & RTR != 0,
-            "fdf": False,
-            "brs": False,
-            "esi": False,
-            "data": data}
+    return (channel, flags & DIR, can_id, dlc, flags & RTR != 0, False, False, False, data)
 
 
-def parse_can_fd_message(obj_data: memoryview) -> CANMessage:
+def can_fd_message_fields(obj_data: memoryview) -> CANFields:
     channel, flags, dlc, can_id, _, _, fd_flags, valid_data_bytes = CAN_FD_MESSAGE_STRUCT.unpack_from(obj_data)
     data = obj_data[CAN_FD_MESSAGE_STRUCT.size:CAN_FD_MESSAGE_STRUCT.size + valid_data_bytes]
-    return {"type": "can",
-            "channel": channel,
-            "dir": flags & DIR,
-            "can_id": can_id,
-            "dlc": dlc,
-            "rtr": flags & RTR != 0,
-            "fdf": fd_flags & FDF != 0,
-            "brs": fd_flags & BRS != 0,
-            "esi": fd_flags & ESI != 0,
-            "data": data}
+    return (channel, flags & DIR, can_id, dlc, flags & RTR != 0, fd_flags & FDF != 0, fd_flags & BRS != 0, fd_flags & ESI != 0, data)
 
 
-def parse_can_fd_message_64(obj_data: memoryview) -> CANMessage:
+def can_fd_message_64_fields(obj_data: memoryview) -> CANFields:
     channel, dlc, valid_data_bytes, _, can_id, _, flags, _, _, _, _, _, dir, _, crc = CAN_FD_MESSAGE_64_STRUCT.unpack_from(obj_data)
     data = obj_data[CAN_FD_MESSAGE_64_STRUCT.size:CAN_FD_MESSAGE_64_STRUCT.size + valid_data_bytes]
+    return (channel, dir, can_id, dlc, flags & RTR_64 != 0, flags & FDF_64 != 0, flags & BRS_64 != 0, flags & ESI_64 != 0, data)
+
+
+def ethernet_frame_fields(obj_data: memoryview) -> EthernetFields:
+    mac_sa, channel, mac_da, dir, eth_type, vlan_tpid, vlan_tci, frame_length = ETHERNET_FRAME_STRUCT.unpack_from(obj_data)
+    data = obj_data[ETHERNET_FRAME_STRUCT.size:ETHERNET_FRAME_STRUCT.size + frame_length]
+    return (channel, -1, dir, mac_da, mac_sa, vlan_tpid, (vlan_tci >> 12) & 0x03, vlan_tci & 0x3F, eth_type, data)
+
+
+def ethernet_frame_ex_fields(obj_data: memoryview) -> EthernetFields:
+    _, flags, channel, hw_channel, _, checksum, dir, frame_length, frame_handle, _ = ETHERNET_FRAME_EX_STRUCT.unpack_from(obj_data)
+    if frame_length <= 14:
+        raise Exception("unexpected ethernet format")
+    data = obj_data[ETHERNET_FRAME_EX_STRUCT.size:ETHERNET_FRAME_EX_STRUCT.size + frame_length]
+    vlan_tpid, vlan_tci, eth_type = VLAN_TPID_TCI_TYPE.unpack_from(data, 12)
+    hw_channel = hw_channel if flags & VALID_HW_CHANNEL != 0 else -1
+    if len(data) > 18 and (vlan_tpid == 0x8100 or vlan_tpid == 0x8800 or vlan_tpid == 0x9100):
+        return (channel, hw_channel, dir, data[:6], data[6:12], vlan_tpid, (vlan_tci >> 12) & 0x03, vlan_tci & 0xFFF, eth_type, data[18:])
+    else:
+        return (channel, hw_channel, dir, data[:6], data[6:12], -1, -1, -1, vlan_tpid, data[14:])
+
+
+def can_message(fields: CANFields) -> CANMessage:
+    channel, dir, can_id, dlc, rtr, fdf, brs, esi, data = fields
     return {"type": "can",
             "channel": channel,
             "dir": dir,
             "can_id": can_id,
             "dlc": dlc,
-            "rtr": flags & RTR_64 != 0,
-            "fdf": flags & FDF_64 != 0,
-            "brs": flags & BRS_64 != 0,
-            "esi": flags & ESI_64 != 0,
+            "rtr": rtr,
+            "fdf": fdf,
+            "brs": brs,
+            "esi": esi,
             "data": data}
 
 
-def parse_ethernet_frame(obj_data: memoryview) -> EthernetFrame:
-    mac_sa, channel, mac_da, dir, eth_type, vlan_tpid, vlan_tci, frame_length = ETHERNET_FRAME_STRUCT.unpack_from(obj_data)
-    data = obj_data[ETHERNET_FRAME_STRUCT.size:ETHERNET_FRAME_STRUCT.size + frame_length]
+def ethernet_frame(fields: EthernetFields) -> EthernetFrame:
+    channel, hw_channel, dir, mac_da, mac_sa, vlan_tpid, vlan_pri, vlan_id, eth_type, data = fields
     return {"type": "ethernet",
             "channel": channel,
-            "hw_channel": -1,
+            "hw_channel": hw_channel,
             "dir": dir,
             "mac_da": mac_da,
             "mac_sa": mac_sa,
-            "eth_type": eth_type,
             "vlan_tpid": vlan_tpid,
-            "vlan_pri": (vlan_tci >> 12) & 0x03,
-            "vlan_id": vlan_tci & 0x3F,
+            "vlan_pri": vlan_pri,
+            "vlan_id": vlan_id,
+            "eth_type": eth_type,
             "data": data}
 
 
+def parse_can_message(obj_data: memoryview) -> CANMessage:
+    return can_message(can_message_fields(obj_data))
+
+
+def parse_can_fd_message(obj_data: memoryview) -> CANMessage:
+    return can_message(can_fd_message_fields(obj_data))
+
+
+def parse_can_fd_message_64(obj_data: memoryview) -> CANMessage:
+    return can_message(can_fd_message_64_fields(obj_data))
+
+
+def parse_ethernet_frame(obj_data: memoryview) -> EthernetFrame:
+    return ethernet_frame(ethernet_frame_fields(obj_data))
+
+
 def parse_ethernet_frame_ex(obj_data: memoryview) -> EthernetFrame:
-    _, flags, channel, hw_channel, _, checksum, dir, frame_length, frame_handle, _ = ETHERNET_FRAME_EX_STRUCT.unpack_from(obj_data)
-    if frame_length <= 14:
-        raise Exception("unexpected ethernet format")
-    data = obj_data[ETHERNET_FRAME_EX_STRUCT.size:ETHERNET_FRAME_EX_STRUCT.size + frame_length]
-    vlan_tpid, vlan_tci, eth_type = VLAN_TPID_TCI_TYPE.unpack_from(data, 12)
-    if len(data) > 18 and (vlan_tpid == 0x8100 or vlan_tpid == 0x8800 or vlan_tpid == 0x9100):
-        return {"type": "ethernet",
-                "channel": channel,
-                "hw_channel": hw_channel if flags & VALID_HW_CHANNEL != 0 else -1,
-                "dir": dir,
-                "mac_da": data[:6],
-                "mac_sa": data[6:12],
-                "vlan_tpid": vlan_tpid,
-                "vlan_pri": (vlan_tci >> 12) & 0x03,
-                "vlan_id": vlan_tci & 0xFFF,
-                "eth_type": eth_type,
-                "data": data[18:]}
+    return ethernet_frame(ethernet_frame_ex_fields(obj_data))
+
+
+OBJ_HEADER_STRUCTS = {1: OBJ_HEADER_V1_STRUCT, 2: OBJ_HEADER_V2_STRUCT}
+
+# field extraction shared by the dict API and the slotted records of blfrecord
+FIELDS: dict[int, Callable[[memoryview], CANFields | EthernetFields]] = {
+    CAN_MESSAGE: can_message_fields,
+    CAN_MESSAGE2: can_message_fields,
+    CAN_FD_MESSAGE: can_fd_message_fields,
+    CAN_FD_MESSAGE_64: can_fd_message_64_fields,
+    ETHERNET_FRAME: ethernet_frame_fields,
+    ETHERNET_FRAME_EX: ethernet_frame_ex_fields,
+}
+
+DECODERS: dict[int, Callable[[memoryview], CANMessage | EthernetFrame]] = {
+    CAN_MESSAGE: parse_can_message,
+    CAN_MESSAGE2: parse_can_message,
+    CAN_FD_MESSAGE: parse_can_fd_message,
+    CAN_FD_MESSAGE_64: parse_can_fd_message_64,
+    ETHERNET_FRAME: parse_ethernet_frame,
+    ETHERNET_FRAME_EX: parse_ethernet_frame_ex,
+}
+
+
+def can_message_key(buf: memoryview, i: int) -> tuple[int, int, int]:
+    channel, flags, _, can_id = CAN_MESSAGE_STRUCT.unpack_from(buf, i)
+    return (channel, flags & DIR, can_id)
+
+
+def can_fd_message_64_key(buf: memoryview, i: int) -> tuple[int, int, int]:
+    m = CAN_FD_MESSAGE_64_STRUCT.unpack_from(buf, i)
+    return (m[0], m[12], m[4])
+
+
+def ethernet_frame_key(buf: memoryview, i: int) -> tuple[int, int, int]:
+    m = ETHERNET_FRAME_STRUCT.unpack_from(buf, i)
+    return (m[1], m[3], m[4])
+
+
+def ethernet_frame_ex_key(buf: memoryview, i: int) -> tuple[int, int, int]:
+    m = ETHERNET_FRAME_EX_STRUCT.unpack_from(buf, i)
+    vlan_tpid, _, eth_type = VLAN_TPID_TCI_TYPE.unpack_from(buf, i + ETHERNET_FRAME_EX_STRUCT.size + 12)
+    if m[7] > 18 and (vlan_tpid == 0x8100 or vlan_tpid == 0x8800 or vlan_tpid == 0x9100):
+        return (m[2], m[6], eth_type)
+    return (m[2], m[6], vlan_tpid)
+
+
+# (channel, dir, can_id or eth_type) read from the raw fields, CAN_FD_MESSAGE starts like CAN_MESSAGE
+FILTER_KEYS: dict[int, Callable[[memoryview, int], tuple[int, int, int]]] = {
+    CAN_MESSAGE: can_message_key,
+    CAN_MESSAGE2: can_message_key,
+    CAN_FD_MESSAGE: can_message_key,
+    CAN_FD_MESSAGE_64: can_fd_message_64_key,
+    ETHERNET_FRAME: ethernet_frame_key,
+    ETHERNET_FRAME_EX: ethernet_frame_ex_key,
+}
+CAN_TYPES = (CAN_MESSAGE, CAN_MESSAGE2, CAN_FD_MESSAGE, CAN_FD_MESSAGE_64)
+
+
+class IdRanges:
+    # inclusive (lo, hi) ranges of ids
+
+    def __init__(self, ranges: list[tuple[int, int]]):
+        self.los: list[int] = []
+        self.his: list[int] = []
+        for lo, hi in sorted(ranges):
+            if self.his and lo <= self.his[-1] + 1:
+                self.his[-1] = max(self.his[-1], hi)  # merge overlapping ranges
+            else:
+                self.los.append(lo)
+                self.his.append(hi)
+
+    def __contains__(self, ident: object) -> bool:
+        k = bisect_right(self.los, ident) - 1
+        return k >= 0 and ident <= self.his[k]
+
+
+FilterCheck = tuple[Callable[[memoryview, int], tuple[int, int, int]] | None, Container[int] | None]
+
+
+def compile_filter(flt: ObjectFilter) -> tuple[dict[int, FilterCheck], set[int] | None, set[int] | None] | None:
+    # ({obj_type: (key, idents)}, channels, dirs), objects of the types missing in the dict are dropped
+    obj_types = flt.get("obj_types")
+    channels = flt.get("channels")
+    dirs = flt.get("dirs")
+    can_ids = flt.get("can_ids")
+    eth_types = flt.get("eth_types")
+    if channels is None and dirs is None and can_ids is None and eth_types is None:
+        if obj_types is None:
+            return None
+        return ({obj_type: (None, None) for obj_type in obj_types}, None, None)
+    can_idents: Container[int] | None
+    if can_ids is None:
+        can_idents = None if eth_types is None else ()
+    elif len(can_ids) == 1:
+        can_idents = range(can_ids[0][0], can_ids[0][1] + 1)
+    else:
+        can_idents = IdRanges(can_ids)
+    eth_idents: Container[int] | None
+    if eth_types is None:
+        eth_idents = None if can_ids is None else ()
     else:
-        return {"type": "ethernet",
-                "channel": channel,
-                "hw_channel": hw_channel if flags & VALID_HW_CHANNEL != 0 else -1,
-                "dir": dir,
-                "mac_da": data[:6],
-                "mac_sa": data[6:12],
-                "vlan_tpid": -1,
-                "vlan_pri": -1,
-                "vlan_id": -1,
-                "eth_type": vlan_tpid,
-                "data": data[14:]}
+        eth_idents = eth_types
+    checks: dict[int, FilterCheck] = {}
+    for obj_type, key in FILTER_KEYS.items():
+        if obj_types is None or obj_type in obj_types:
+            checks[obj_type] = (key, can_idents if obj_type in CAN_TYPES else eth_idents)
+    return (checks, channels, dirs)
 
 
 def main():
-    # filename = sys.argv[1]
-    filename = r"C:\Users\k_hir\Projects\numba-test\test.blf"
+    filename = sys.argv[1]
     with open(filename, "rb") as fp:
         object_count, start_timestamp, stop_timestamp = parse_file_header(fp)
         it = parse_log_container(fp)
@@ -332,6 +597,22 @@ def main():
             t1 = time.time()
             print(t1 - t0)
 
+    with open(filename, "rb") as fp:
+        with mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+            object_count, start_timestamp, stop_timestamp = parse_file_header(mm)
+            it = parse_log_container_threaded(mm)
+            t0 = time.time()
+            for item in it:
+                pass
+            t1 = time.time()
+            print("threaded", t1 - t0)
+    flt: ObjectFilter = {"obj_types": set(CAN_TYPES), "channels": {1}, "can_ids": [(0x700, 0x7FF)]}
+    for name, f in [("full", None), ("filtered", flt)]:
+        t0 = time.time()
+        count = sum(1 for _ in parse_base_object_file(filename, f))
+        t1 = time.time()
+        print(name, count, t1 - t0)
+
 
 if __name__ == "__main__":
     main()
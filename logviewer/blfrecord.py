@@ -0,0 +1,147 @@
+import sys
+import time
+import tracemalloc
+from mmap import ACCESS_READ, mmap
+from typing import Iterable, Iterator
+
+from blfparser import (FIELDS, Build, parse_container_objects,
+                       parse_file_header, parse_log_container_mm)
+from constants import (CAN_FD_MESSAGE, CAN_FD_MESSAGE_64, CAN_MESSAGE,
+                       CAN_MESSAGE2, ETHERNET_FRAME, ETHERNET_FRAME_EX)
+
+
+class FileHeader:
+    # file level metadata, shared by every record of the file
+    __slots__ = ("object_count", "start_timestamp", "stop_timestamp")
+
+    def __init__(self, object_count: int, start_timestamp: int, stop_timestamp: int):
+        self.object_count = object_count
+        self.start_timestamp = start_timestamp
+        self.stop_timestamp = stop_timestamp
+
+
+class Record:
+    # slotted alternative to BaseObject, the message fields are flattened into CANRecord and EthernetRecord
+    __slots__ = ("header", "time_ns", "obj_type", "obj_data")
+
+    def __init__(self, header: FileHeader, time_ns: int, obj_type: int, obj_data: memoryview):
+        self.header = header
+        self.time_ns = time_ns
+        self.obj_type = obj_type
+        self.obj_data = obj_data
+
+    @property
+    def timestamp(self) -> int:
+        return self.header.start_timestamp + self.time_ns
+
+
+class CANRecord(Record):
+    __slots__ = ("channel", "dir", "can_id", "dlc", "rtr", "fdf", "brs", "esi", "data")
+
+    def __init__(self, header: FileHeader, time_ns: int, obj_type: int, obj_data: memoryview,
+                 channel: int, dir: int, can_id: int, dlc: int, rtr: bool, fdf: bool, brs: bool, esi: bool, data: memoryview):
+        self.header = header
+        self.time_ns = time_ns
+        self.obj_type = obj_type
+        self.obj_data = obj_data
+        self.channel = channel
+        self.dir = dir
+        self.can_id = can_id
+        self.dlc = dlc
+        self.rtr = rtr
+        self.fdf = fdf
+        self.brs = brs
+        self.esi = esi
+        self.data = data
+
+
+class EthernetRecord(Record):
+    __slots__ = ("channel", "hw_channel", "dir", "mac_da", "mac_sa", "vlan_tpid", "vlan_pri", "vlan_id", "eth_type", "data")
+
+    def __init__(self, header: FileHeader, time_ns: int, obj_type: int, obj_data: memoryview,
+                 channel: int, hw_channel: int, dir: int, mac_da: bytes | memoryview, mac_sa: bytes | memoryview,
+                 vlan_tpid: int, vlan_pri: int, vlan_id: int, eth_type: int, data: memoryview):
+        self.header = header
+        self.time_ns = time_ns
+        self.obj_type = obj_type
+        self.obj_data = obj_data
+        self.channel = channel
+        self.hw_channel = hw_channel
+        self.dir = dir
+        self.mac_da = mac_da
+        self.mac_sa = mac_sa
+        self.vlan_tpid = vlan_tpid
+        self.vlan_pri = vlan_pri
+        self.vlan_id = vlan_id
+        self.eth_type = eth_type
+        self.data = data
+
+
+def record_builder(header: FileHeader) -> Build:
+    # the framing and the fields are those of blfparser, only the item type differs
+    def build(time_ns: int, obj_type: int, obj_data: memoryview) -> Record:
+        fields = FIELDS.get(obj_type)
+        if fields is None:
+            return Record(header, time_ns, obj_type, obj_data)
+        return RECORD_TYPES[obj_type](header, time_ns, obj_type, obj_data, *fields(obj_data))
+    return build
+
+
+def parse_container_records(containers: Iterable[bytes], header: FileHeader, skip: int = 0) -> Iterator[Record]:
+    yield from parse_container_objects(containers, header.object_count, header.start_timestamp, header.stop_timestamp, skip,
+                                       build=record_builder(header))
+
+
+def parse_record_file(filename: str) -> Iterator[Record]:
+    with open(filename, "rb") as fp:
+        with mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+            header = FileHeader(*parse_file_header(mm))
+            yield from parse_container_records(parse_log_container_mm(mm), header)
+
+
+RECORD_TYPES: dict[int, type[CANRecord] | type[EthernetRecord]] = {
+    CAN_MESSAGE: CANRecord,
+    CAN_MESSAGE2: CANRecord,
+    CAN_FD_MESSAGE: CANRecord,
+    CAN_FD_MESSAGE_64: CANRecord,
+    ETHERNET_FRAME: EthernetRecord,
+    ETHERNET_FRAME_EX: EthernetRecord,
+}
+
+
+def measure(items: Iterator) -> tuple[int, float, int, int]:
+    # (count, seconds, blocks and bytes allocated per retained item)
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    t0 = time.perf_counter()
+    kept = list(items)
+    t1 = time.perf_counter()
+    blocks = sys.getallocatedblocks() - blocks
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n = max(len(kept), 1)
+    return (len(kept), t1 - t0, blocks // n, size // n)
+
+
+def main():
+    filename = sys.argv[1]
+    with open(filename, "rb") as fp:
+        with mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+            object_count, start_timestamp, stop_timestamp = parse_file_header(mm)
+            pos = mm.tell()
+            readers = [("dict", lambda: parse_container_objects(parse_log_container_mm(mm), object_count, start_timestamp, stop_timestamp)),
+                       ("slots", lambda: parse_container_records(parse_log_container_mm(mm), FileHeader(object_count, start_timestamp, stop_timestamp)))]
+            for name, parse in readers:
+                mm.seek(pos)
+                t0 = time.perf_counter()
+                count = sum(1 for _ in parse())
+                t1 = time.perf_counter()
+                print(f"{name:6s} {count / (t1 - t0):12.0f} objects/s")
+            for name, parse in readers:
+                mm.seek(pos)
+                count, _, blocks, size = measure(parse())
+                print(f"{name:6s} {count} objects kept, {blocks} blocks/object, {size} bytes/object")
+
+
+if __name__ == "__main__":
+    main()
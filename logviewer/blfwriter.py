@@ -0,0 +1,121 @@
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
+from datetime import datetime
+from typing import BinaryIO
+from zlib import compress
+
+from constants import (CAN_FD_MESSAGE_64, CAN_FD_MESSAGE_64_STRUCT,
+                       CAN_MESSAGE_STRUCT, DIR_64_S, ETHERNET_FRAME_EX,
+                       ETHERNET_FRAME_EX_STRUCT, FILE_HEADER_STRUCT, LOBJ,
+                       LOG_CONTAINER, LOG_CONTAINER_STRUCT, LOGG,
+                       NO_COMPRESSION, OBJ_HEADER_BASE_STRUCT,
+                       OBJ_HEADER_V1_STRUCT, TIME_ONE_NANS, ZLIB_DEFLATE)
+
+FILE_HEADER_SIZE = 144
+CONTAINER_SIZE = 128 * 1024
+IN_FLIGHT = 16  # containers being compressed by an executor, bounds the memory of a writer
+OBJ_HEADER_V1_SIZE = OBJ_HEADER_BASE_STRUCT.size + OBJ_HEADER_V1_STRUCT.size
+
+
+def to_systemtime(time_ns: int) -> tuple[int, int, int, int, int, int, int, int]:
+    t = datetime.fromtimestamp(time_ns / 1e9)
+    return (t.year, t.month, t.isoweekday() % 7, t.day, t.hour, t.minute, t.second, t.microsecond // 1000)
+
+
+def pack_file_header(file_size: int, uncompressed_size: int, object_count: int, start_timestamp: int, stop_timestamp: int) -> bytes:
+    header = FILE_HEADER_STRUCT.pack(LOGG, FILE_HEADER_SIZE, 0, 0, 0, 0, 0, 0, 0, 0,
+                                     file_size, uncompressed_size, object_count, 0,
+                                     *to_systemtime(start_timestamp), *to_systemtime(stop_timestamp))
+    return header + bytes(FILE_HEADER_SIZE - len(header))
+
+
+def pack_object(obj_type: int, time_ns: int, body: bytes) -> bytes:
+    obj_size = OBJ_HEADER_V1_SIZE + len(body)
+    data = (OBJ_HEADER_BASE_STRUCT.pack(LOBJ, OBJ_HEADER_V1_SIZE, 1, obj_size, obj_type) +
+            OBJ_HEADER_V1_STRUCT.pack(TIME_ONE_NANS, 0, 0, time_ns) + body)
+    if obj_type not in (CAN_FD_MESSAGE_64, ETHERNET_FRAME_EX):
+        data += bytes(obj_size % 4)
+    return data
+
+
+def pack_can_message(channel: int, dir: int, can_id: int, data: bytes) -> bytes:
+    return CAN_MESSAGE_STRUCT.pack(channel, dir, len(data), can_id) + data.ljust(8, b"\0")
+
+
+def pack_can_fd_message_64(channel: int, dir: int, can_id: int, dlc: int, flags: int, data: bytes) -> bytes:
+    return CAN_FD_MESSAGE_64_STRUCT.pack(channel, dlc, len(data), 0, can_id, 0, flags | (dir << DIR_64_S),
+                                         0, 0, 0, 0, 0, dir, 0, 0) + data
+
+
+def pack_ethernet_frame_ex(channel: int, dir: int, frame: bytes) -> bytes:
+    return ETHERNET_FRAME_EX_STRUCT.pack(ETHERNET_FRAME_EX_STRUCT.size, 0, channel, 0, 0, 0, dir, len(frame), 0, 0) + frame
+
+
+def pack_log_container(data: bytes, compressed: bool = True, level: int = 6) -> bytes:
+    if compressed:
+        body = compress(data, level)
+        compression_method = ZLIB_DEFLATE
+    else:
+        body = data
+        compression_method = NO_COMPRESSION
+    obj_size = OBJ_HEADER_BASE_STRUCT.size + LOG_CONTAINER_STRUCT.size + len(body)
+    return (OBJ_HEADER_BASE_STRUCT.pack(LOBJ, OBJ_HEADER_BASE_STRUCT.size, 1, obj_size, LOG_CONTAINER) +
+            LOG_CONTAINER_STRUCT.pack(compression_method, len(data)) + body + bytes(obj_size % 4))
+
+
+class BLFWriter:
+
+    def __init__(self, fp: BinaryIO, start_timestamp: int | None = None, compressed: bool = True, container_size: int = CONTAINER_SIZE,
+                 executor: Executor | None = None, in_flight: int = IN_FLIGHT):
+        self.fp = fp
+        self.start_timestamp = time.time_ns() if start_timestamp is None else start_timestamp
+        self.stop_timestamp = self.start_timestamp
+        self.compressed = compressed
+        self.container_size = container_size
+        self.buf = bytearray()
+        self.object_count = 0
+        self.uncompressed_size = FILE_HEADER_SIZE
+        self.executor = executor  # compresses the containers, which are written in order
+        self.in_flight = in_flight
+        self.pending: deque[Future[bytes]] = deque()
+        # a valid header from the start, so the file can be followed while it is written, the counts are set by close
+        fp.write(pack_file_header(FILE_HEADER_SIZE, FILE_HEADER_SIZE, 0, self.start_timestamp, self.stop_timestamp))
+
+    def write(self, obj_type: int, time_ns: int, body: bytes):
+        # time_ns is relative to start_timestamp
+        self.write_object(pack_object(obj_type, time_ns, body), time_ns)
+
+    def write_object(self, data: bytes, time_ns: int):
+        self.buf += data
+        self.object_count += 1
+        self.stop_timestamp = max(self.stop_timestamp, self.start_timestamp + time_ns)
+        if len(self.buf) >= self.container_size:
+            self.flush(self.container_size)
+
+    def flush(self, size: int):
+        # objects are split at container boundaries as they fall
+        n = len(self.buf) // size * size
+        for i in range(0, n, size):
+            self.write_container(bytes(self.buf[i:i + size]))
+        del self.buf[:n]
+
+    def write_container(self, data: bytes):
+        self.uncompressed_size += len(data) + OBJ_HEADER_BASE_STRUCT.size + LOG_CONTAINER_STRUCT.size
+        if self.executor is None:
+            self.fp.write(pack_log_container(data, self.compressed))
+            return
+        self.pending.append(self.executor.submit(pack_log_container, data, self.compressed))
+        while len(self.pending) > self.in_flight:
+            self.fp.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.buf:
+            self.write_container(bytes(self.buf))
+            self.buf.clear()
+        while self.pending:
+            self.fp.write(self.pending.popleft().result())
+        file_size = self.fp.tell()
+        self.fp.seek(0)
+        self.fp.write(pack_file_header(file_size, self.uncompressed_size, self.object_count, self.start_timestamp, self.stop_timestamp))
+        self.fp.seek(file_size)
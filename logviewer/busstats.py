@@ -0,0 +1,164 @@
+import sys
+import time
+from itertools import groupby
+
+from blfparser import parse_base_object_file
+from constants import CAN_MSG_EXT
+from logstore import LAYER_CAN, LAYER_ISOTP, LAYER_NONE, LogStore
+
+CAN_BITRATE = 500_000  # not recorded in BLF, assumed for the bus load
+ETH_BITRATE = 100_000_000  # 100BASE-T1
+CAN_FRAME_BITS = 47  # SOF to IFS of a base frame without data and stuffing
+ETH_FRAME_BYTES = 8 + 14 + 4 + 12  # preamble, header, FCS and inter-frame gap around the data
+SECOND = 1_000_000_000
+SECOND_BITS = 40  # seconds since the epoch in the low bits of the bits keys
+
+STREAM_CAN = 0
+STREAM_ETH = 1
+
+
+class IdStats:
+    # frames and cycle times of one (stream, channel, ident)
+    __slots__ = ("count", "first_ns", "last_ns", "dt_min", "dt_max", "dt_sum", "dt_sq_sum", "bytes")
+
+    def __init__(self, time_ns: int):
+        self.count = 0
+        self.first_ns = time_ns
+        self.last_ns = time_ns
+        self.dt_min = 0
+        self.dt_max = 0
+        self.dt_sum = 0
+        self.dt_sq_sum = 0
+        self.bytes = 0
+
+    def cycle(self) -> tuple[float, float, float, float]:
+        # (min, mean, max, jitter) of the cycle time in ms, jitter is the standard deviation
+        n = self.count - 1
+        if n <= 0:
+            return (0.0, 0.0, 0.0, 0.0)
+        mean = self.dt_sum / n
+        jitter = max(self.dt_sq_sum / n - mean * mean, 0) ** 0.5
+        return (self.dt_min / 1e6, mean / 1e6, self.dt_max / 1e6, jitter / 1e6)
+
+
+class BusStats:
+    # per ID statistics and bus load, updated with the rows appended to a store since the last update
+
+    def __init__(self):
+        self.ids: dict[int, IdStats] = {}  # key() -> stats
+        self.bits: dict[int, int] = {}  # (stream, channel, second) packed -> bits in that second
+        self.size = 0  # rows aggregated
+
+    def update(self, store: LogStore, stop: int | None = None):
+        # one pass over the new rows, each row updates the stats of its key in place
+        stop = len(store) if stop is None else stop
+        start = self.size
+        if stop <= start:
+            return
+        self.size = stop
+        ids = self.ids
+        bits = self.bits
+        for layer, channel, ident, time_ns, length in zip(store.layer[start:stop], store.channel[start:stop], store.ident[start:stop],
+                                                          store.time_ns[start:stop], store.data_length[start:stop]):
+            if layer == LAYER_NONE or layer == LAYER_ISOTP:
+                continue
+            if layer == LAYER_CAN:
+                k = (channel << 33) | ident  # key() inlined
+                b = CAN_FRAME_BITS + 8 * length
+            else:
+                k = (channel << 33) | (1 << 32) | ident
+                b = (ETH_FRAME_BYTES + length) * 8
+            s = ids.get(k)
+            if s is None:
+                s = ids[k] = IdStats(time_ns)
+            else:
+                dt = time_ns - s.last_ns
+                if s.count > 1:
+                    if dt < s.dt_min:
+                        s.dt_min = dt
+                    elif dt > s.dt_max:
+                        s.dt_max = dt
+                else:
+                    s.dt_min = s.dt_max = dt
+                s.dt_sum += dt
+                s.dt_sq_sum += dt * dt
+                s.last_ns = time_ns
+            s.count += 1
+            s.bytes += length
+            lk = (k >> 32) << SECOND_BITS | time_ns // SECOND  # (stream, channel) and the second
+            bits[lk] = bits.get(lk, 0) + b
+
+    def to_json(self) -> dict:
+        # for the cache, rebuilt by from_json without the rows
+        return {"size": self.size,
+                "ids": [[k, s.count, s.first_ns, s.last_ns, s.dt_min, s.dt_max, s.dt_sum, s.dt_sq_sum, s.bytes] for k, s in self.ids.items()],
+                "bits": list(self.bits.items())}
+
+    @classmethod
+    def from_json(cls, value: dict) -> "BusStats":
+        stats = cls()
+        stats.size = value["size"]
+        for k, count, first_ns, last_ns, dt_min, dt_max, dt_sum, dt_sq_sum, size in value["ids"]:
+            s = stats.ids[k] = IdStats(first_ns)
+            s.count, s.last_ns, s.dt_min, s.dt_max, s.dt_sum, s.dt_sq_sum, s.bytes = count, last_ns, dt_min, dt_max, dt_sum, dt_sq_sum, size
+        stats.bits = {lk: b for lk, b in value["bits"]}
+        return stats
+
+    def rows(self) -> list[tuple[str, int, str, int, float, float, float, float]]:
+        # (stream, channel, ident, count, min, mean, max, jitter) sorted by channel, stream and ident
+        result = []
+        for k in sorted(self.ids):
+            stream, channel, ident = split_key(k)
+            result.append((STREAM_LABELS[stream], channel, format_ident(stream, ident), self.ids[k].count, *self.ids[k].cycle()))
+        return result
+
+    def load(self) -> list[tuple[str, int, float, float]]:
+        # (stream, channel, mean %, peak %) of the bus load over the seconds with traffic
+        result = []
+        for sc, items in groupby(sorted(self.bits.items()), lambda item: item[0] >> SECOND_BITS):
+            stream, channel = sc & 1, sc >> 1
+            bitrate = CAN_BITRATE if stream == STREAM_CAN else ETH_BITRATE
+            values = [bits * 100 / bitrate for _, bits in items]
+            result.append((stream, channel, sum(values) / len(values), max(values)))
+        result.sort()  # by stream, then channel
+        return [(STREAM_LABELS[stream], channel, mean, peak) for stream, channel, mean, peak in result]
+
+
+STREAM_LABELS = ["CAN", "ETH"]
+
+
+def key(layer: int, channel: int, ident: int) -> int:
+    # (stream, channel, ident) packed into one int, ident keeps the CAN_MSG_EXT bit
+    return (channel << 33) | ((0 if layer == LAYER_CAN else 1) << 32) | ident
+
+
+def split_key(k: int) -> tuple[int, int, int]:
+    return ((k >> 32) & 1, k >> 33, k & 0xFFFFFFFF)
+
+
+def format_ident(stream: int, ident: int) -> str:
+    if stream == STREAM_CAN:
+        return f"{ident & ~CAN_MSG_EXT:X}x" if ident & CAN_MSG_EXT else f"{ident:X}"
+    return f"{ident:04X}"
+
+
+def main():
+    filename = sys.argv[1]
+    store = LogStore()
+    stats = BusStats()
+    t0 = time.time()
+    for i, item in enumerate(parse_base_object_file(filename)):
+        store.append(item)
+        if i % 10000 == 9999:
+            stats.update(store)
+    stats.update(store)
+    t1 = time.time()
+    print("load + stats", len(store), t1 - t0)
+    for row in stats.rows()[:20]:
+        print("{} {} {:>9} {:8d} {:10.3f} {:10.3f} {:10.3f} {:10.3f}".format(*row))
+    for row in stats.load():
+        print("{} {} {:6.2f}% {:6.2f}%".format(*row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import time
+from multiprocessing.sharedctypes import RawValue
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+CHECK_EVERY = 1024  # items between two checks of guard
+POLL_INTERVAL = 0.05  # seconds between two checks of wait
+
+
+class Cancelled(Exception):
+    pass
+
+
+class CancelToken:
+    # set once by the GUI, polled by reader threads, pools and worker processes
+    # the flag is shared memory, so it can be passed to a Process and read without a lock
+
+    def __init__(self):
+        self.flag = RawValue("B", 0)
+
+    def cancel(self):
+        self.flag.value = 1
+
+    @property
+    def cancelled(self) -> bool:
+        return self.flag.value != 0
+
+    def check(self):
+        if self.flag.value:
+            raise Cancelled()
+
+    def wait(self, timeout: float) -> bool:
+        # sleeps up to timeout, True as soon as cancelled
+        deadline = time.monotonic() + timeout
+        while not self.flag.value:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(remaining, POLL_INTERVAL))
+        return True
+
+    def guard(self, iterable: Iterable[T], every: int = CHECK_EVERY) -> Iterator[T]:
+        # raises Cancelled within every items
+        flag = self.flag
+        n = 0
+        for item in iterable:
+            n += 1
+            if n == every:
+                n = 0
+                if flag.value:
+                    raise Cancelled()
+            yield item
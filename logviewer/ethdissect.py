@@ -0,0 +1,177 @@
+import struct
+import sys
+import time
+from array import array
+from ipaddress import IPv4Address, IPv6Address
+from itertools import compress
+from typing import Iterable, Sequence, TypedDict
+
+IPV4 = 0x0800
+IPV6 = 0x86DD
+TCP = 6
+UDP = 17
+DOIP_PORT = 13400
+DOIP_DIAGNOSTIC_MESSAGE = 0x8001
+SOMEIP_PROTOCOL_VERSION = 1
+
+U16 = struct.Struct(">H")
+PORTS = struct.Struct(">HH")
+DOIP_HEADER = struct.Struct(">BBHL")  # version, inverse version, payload type, payload length
+DOIP_ADDRESSES = struct.Struct(">HH")  # source and target address of a diagnostic message
+SOMEIP_HEADER = struct.Struct(">HHLLBBBB")  # service, method, length, request id, protocol/interface version, message type, return code
+
+# (name, typecode, value when the field is absent) of the columns of dissect_columns
+PROTOCOL_COLUMNS = [("ip_proto", "B", 0),
+                    ("src_port", "H", 0),
+                    ("dst_port", "H", 0),
+                    ("doip_type", "l", -1),
+                    ("uds_sid", "h", -1),
+                    ("someip_service", "l", -1),
+                    ("someip_method", "l", -1)]
+
+Fields = tuple[int, int, int, int, int, int, int, int]
+
+
+class Dissection(TypedDict):
+    ip_version: int
+    src: str
+    dst: str
+    ip_proto: int
+    src_port: int
+    dst_port: int
+    doip_type: int
+    doip_source: int
+    doip_target: int
+    uds_sid: int
+    someip_service: int
+    someip_method: int
+    payload: bytes  # above TCP/UDP, DoIP and SOME/IP headers included
+
+
+def dissect_fields(buf: bytes | bytearray | memoryview, eth_type: int, i: int, n: int) -> Fields | None:
+    # (ip_proto, src_port, dst_port, doip_type, uds_sid, someip_service, someip_method, L4 payload offset)
+    # of the IP packet buf[i:i + n], absent fields are 0 or -1 like PROTOCOL_COLUMNS
+    end = i + n
+    if eth_type == IPV4:
+        if n < 20 or buf[i] >> 4 != 4:
+            return None
+        ihl = (buf[i] & 0x0F) * 4
+        proto = buf[i + 9]
+        total = U16.unpack_from(buf, i + 2)[0]
+        if ihl <= total < n:
+            end = i + total  # Ethernet padding
+        j = i + ihl
+        if U16.unpack_from(buf, i + 6)[0] & 0x1FFF:
+            return (proto, 0, 0, -1, -1, -1, -1, j)  # not the first fragment
+    elif eth_type == IPV6:
+        if n < 40 or buf[i] >> 4 != 6:
+            return None
+        proto = buf[i + 6]
+        end = min(end, i + 40 + U16.unpack_from(buf, i + 4)[0])
+        j = i + 40
+    else:
+        return None
+    if proto == TCP:
+        if end - j < 20:
+            return (proto, 0, 0, -1, -1, -1, -1, j)
+        src_port, dst_port = PORTS.unpack_from(buf, j)
+        k = j + (buf[j + 12] >> 4) * 4
+    elif proto == UDP:
+        if end - j < 8:
+            return (proto, 0, 0, -1, -1, -1, -1, j)
+        src_port, dst_port = PORTS.unpack_from(buf, j)
+        k = j + 8
+    else:
+        return (proto, 0, 0, -1, -1, -1, -1, j)
+    doip_type = uds_sid = service = method = -1
+    if src_port == DOIP_PORT or dst_port == DOIP_PORT:
+        if end - k >= DOIP_HEADER.size:
+            version, inverse, payload_type, _ = DOIP_HEADER.unpack_from(buf, k)
+            if version ^ inverse == 0xFF:
+                doip_type = payload_type
+                if payload_type == DOIP_DIAGNOSTIC_MESSAGE and end - k > DOIP_HEADER.size + DOIP_ADDRESSES.size:
+                    uds_sid = buf[k + DOIP_HEADER.size + DOIP_ADDRESSES.size]
+    elif end - k >= SOMEIP_HEADER.size:
+        m = SOMEIP_HEADER.unpack_from(buf, k)
+        if m[4] == SOMEIP_PROTOCOL_VERSION and 8 <= m[2] <= end - k - 8:
+            service = m[0]
+            method = m[1]
+    return (proto, src_port, dst_port, doip_type, uds_sid, service, method, k)
+
+
+def dissect(eth_type: int, data: bytes | bytearray | memoryview) -> Dissection | None:
+    # full dissection of one frame for display
+    fields = dissect_fields(data, eth_type, 0, len(data))
+    if fields is None:
+        return None
+    proto, src_port, dst_port, doip_type, uds_sid, service, method, k = fields
+    if eth_type == IPV4:
+        src = str(IPv4Address(bytes(data[12:16])))
+        dst = str(IPv4Address(bytes(data[16:20])))
+        total = U16.unpack_from(data, 2)[0]
+        end = total if k <= total < len(data) else len(data)
+    else:
+        src = str(IPv6Address(bytes(data[8:24])))
+        dst = str(IPv6Address(bytes(data[24:40])))
+        end = min(len(data), 40 + U16.unpack_from(data, 4)[0])
+    doip_source = doip_target = -1
+    if doip_type == DOIP_DIAGNOSTIC_MESSAGE and end - k >= DOIP_HEADER.size + DOIP_ADDRESSES.size:
+        doip_source, doip_target = DOIP_ADDRESSES.unpack_from(data, k + DOIP_HEADER.size)
+    return {"ip_version": 4 if eth_type == IPV4 else 6,
+            "src": src,
+            "dst": dst,
+            "ip_proto": proto,
+            "src_port": src_port,
+            "dst_port": dst_port,
+            "doip_type": doip_type,
+            "doip_source": doip_source,
+            "doip_target": doip_target,
+            "uds_sid": uds_sid,
+            "someip_service": service,
+            "someip_method": method,
+            "payload": bytes(data[k:end])}
+
+
+def dissect_columns(rows: Iterable[int], ident: Sequence[int], payload: bytes | bytearray | memoryview,
+                    data_offset: Sequence[int], data_length: Sequence[int], count: int) -> dict[str, array]:
+    # PROTOCOL_COLUMNS of count rows, dissect_fields row by row for the IP rows only, the rest keeps the defaults
+    columns = {name: array(typecode, [default]) * count for name, typecode, default in PROTOCOL_COLUMNS}
+    ip_proto = columns["ip_proto"]
+    src_port = columns["src_port"]
+    dst_port = columns["dst_port"]
+    doip_type = columns["doip_type"]
+    uds_sid = columns["uds_sid"]
+    someip_service = columns["someip_service"]
+    someip_method = columns["someip_method"]
+    for row in rows:
+        fields = dissect_fields(payload, ident[row], data_offset[row], data_length[row])
+        if fields is None:
+            continue
+        ip_proto[row], src_port[row], dst_port[row], doip_type[row], uds_sid[row], someip_service[row], someip_method[row], _ = fields
+    return columns
+
+
+def select_rows(column: array | memoryview, value: int) -> array:
+    # rows where column == value, without a Python loop per row
+    return array("L", compress(range(len(column)), map(value.__eq__, column)))
+
+
+def main():
+    from blfparser import parse_base_object_file
+    from logstore import LogStore
+
+    filename = sys.argv[1]
+    store = LogStore()
+    for item in parse_base_object_file(filename):
+        store.append(item)
+    t0 = time.time()
+    store.dissect_all()
+    t1 = time.time()
+    rows = select_rows(store.protocols["doip_type"], DOIP_DIAGNOSTIC_MESSAGE)
+    t2 = time.time()
+    print("dissect_all", len(store), t1 - t0)
+    print("DoIP diagnostic messages", len(rows), t2 - t1)
+
+
+if __name__ == "__main__":
+    main()
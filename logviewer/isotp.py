@@ -0,0 +1,281 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Iterable, Iterator, TypedDict
+
+from blfparser import BaseObject, parse_base_object_file
+from constants import CAN_MSG_EXT, DLC_MAP
+
+SINGLE_FRAME = 0
+FIRST_FRAME = 1
+CONSECUTIVE_FRAME = 2
+FLOW_CONTROL = 3
+
+NEGATIVE_RESPONSE = 0x7F
+RESPONSE_PENDING = 0x78
+POSITIVE_RESPONSE = 0x40  # added to the request SID
+
+SESSION_TIMEOUT_NS = 1_000_000_000  # N_Cr, a segmented message is dropped after this gap
+MAX_SESSIONS = 1024  # segmented messages in progress
+MAX_REQUESTS = 1024  # requests waiting for their response
+
+SERVICE_NAMES = {0x10: "DiagnosticSessionControl",
+                 0x11: "ECUReset",
+                 0x14: "ClearDiagnosticInformation",
+                 0x19: "ReadDTCInformation",
+                 0x22: "ReadDataByIdentifier",
+                 0x23: "ReadMemoryByAddress",
+                 0x24: "ReadScalingDataByIdentifier",
+                 0x27: "SecurityAccess",
+                 0x28: "CommunicationControl",
+                 0x29: "Authentication",
+                 0x2A: "ReadDataByPeriodicIdentifier",
+                 0x2C: "DynamicallyDefineDataIdentifier",
+                 0x2E: "WriteDataByIdentifier",
+                 0x2F: "InputOutputControlByIdentifier",
+                 0x31: "RoutineControl",
+                 0x34: "RequestDownload",
+                 0x35: "RequestUpload",
+                 0x36: "TransferData",
+                 0x37: "RequestTransferExit",
+                 0x38: "RequestFileTransfer",
+                 0x3D: "WriteMemoryByAddress",
+                 0x3E: "TesterPresent",
+                 0x83: "AccessTimingParameter",
+                 0x84: "SecuredDataTransmission",
+                 0x85: "ControlDTCSetting",
+                 0x86: "ResponseOnEvent",
+                 0x87: "LinkControl"}
+
+NRC_NAMES = {0x10: "generalReject",
+             0x11: "serviceNotSupported",
+             0x12: "subFunctionNotSupported",
+             0x13: "incorrectMessageLengthOrInvalidFormat",
+             0x14: "responseTooLong",
+             0x21: "busyRepeatRequest",
+             0x22: "conditionsNotCorrect",
+             0x24: "requestSequenceError",
+             0x25: "noResponseFromSubnetComponent",
+             0x26: "failurePreventsExecutionOfRequestedAction",
+             0x31: "requestOutOfRange",
+             0x33: "securityAccessDenied",
+             0x35: "invalidKey",
+             0x36: "exceedNumberOfAttempts",
+             0x37: "requiredTimeDelayNotExpired",
+             0x70: "uploadDownloadNotAccepted",
+             0x71: "transferDataSuspended",
+             0x72: "generalProgrammingFailure",
+             0x73: "wrongBlockSequenceCounter",
+             0x78: "requestCorrectlyReceivedResponsePending",
+             0x7E: "subFunctionNotSupportedInActiveSession",
+             0x7F: "serviceNotSupportedInActiveSession"}
+
+
+class UdsMessage(TypedDict):
+    time_ns: int  # last frame
+    first_time_ns: int
+    channel: int
+    dir: int
+    can_id: int
+    data: bytes
+    sid: int  # of the request, also for responses
+    service: str
+    response: bool
+    nrc: int  # -1 unless a negative response
+    latency_ns: int  # since the request, -1 for requests and unmatched responses
+
+
+class Session:
+    # a segmented message in progress
+    __slots__ = ("first_time_ns", "last_time_ns", "size", "data", "sn")
+
+    def __init__(self, time_ns: int, size: int, data: bytes):
+        self.first_time_ns = time_ns
+        self.last_time_ns = time_ns
+        self.size = size
+        self.data = bytearray(data)
+        self.sn = 1
+
+
+def is_diagnostic_id(can_id: int) -> bool:
+    # 11-bit 0x700-0x7FF and 29-bit normal fixed addressing 0x18DA/0x18DB
+    if can_id & CAN_MSG_EXT:
+        return (can_id & 0x1FFF0000) >> 16 in (0x18DA, 0x18DB)
+    return 0x700 <= can_id <= 0x7FF
+
+
+def frame_length(dlc: int, fdf: bool) -> int:
+    # bytes of a frame seen by ISO-TP, padding beyond the DLC is cut
+    return DLC_MAP[dlc & 0x0F] if fdf else min(dlc, 8)
+
+
+def request_sid(data: bytes) -> int:
+    # SID of the request answered or made by the UDS message, -1 for no data
+    if not data:
+        return -1
+    sid = data[0]
+    if sid == NEGATIVE_RESPONSE:
+        return data[1] if len(data) > 1 else -1
+    if 0x50 <= sid <= 0x7E or 0xC3 <= sid <= 0xC7:
+        return sid - POSITIVE_RESPONSE
+    return sid
+
+
+def is_response(data: bytes) -> bool:
+    if not data:
+        return False
+    sid = data[0]
+    return sid == NEGATIVE_RESPONSE or 0x50 <= sid <= 0x7E or 0xC3 <= sid <= 0xC7
+
+
+def describe_uds(data: bytes) -> str:
+    if not data:
+        return ""
+    sid = request_sid(data)
+    service = SERVICE_NAMES.get(sid, f"{sid:02X}")
+    if data[0] == NEGATIVE_RESPONSE:
+        nrc = data[2] if len(data) > 2 else -1
+        return f"{service} NRC {nrc:02X} {NRC_NAMES.get(nrc, '')}".rstrip()
+    if is_response(data):
+        return f"{service} response"
+    return service
+
+
+class IsoTpReassembler:
+    # streaming ISO-TP over CAN and CAN FD, sessions are keyed by (channel, can_id)
+    # and bounded by max_sessions, the least recently active one is dropped first
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, timeout_ns: int = SESSION_TIMEOUT_NS,
+                 ids=is_diagnostic_id):
+        self.sessions: OrderedDict[tuple[int, int], Session] = OrderedDict()
+        self.requests: OrderedDict[tuple[int, int], int] = OrderedDict()  # (channel, sid) -> time_ns
+        self.max_sessions = max_sessions
+        self.timeout_ns = timeout_ns
+        self.ids = ids  # can_id -> bool, frames of the other ids are ignored, callers check it before feed_object
+        self.dropped = 0  # incomplete messages, timed out, evicted or out of sequence
+
+    def feed_object(self, obj: BaseObject) -> UdsMessage | None:
+        msg = obj["msg"]
+        if msg is None or msg["type"] != "can" or not self.ids(msg["can_id"]):
+            return None
+        length = frame_length(msg["dlc"], msg["fdf"])
+        return self.feed(obj["start_timestamp"] + obj["time_ns"], msg["channel"], msg["dir"], msg["can_id"], msg["data"][:length])
+
+    def feed(self, time_ns: int, channel: int, dir: int, can_id: int, frame: bytes | memoryview) -> UdsMessage | None:
+        if not frame:
+            return None
+        self.expire(time_ns)
+        pci = frame[0] >> 4
+        key = (channel, can_id)
+        if pci == SINGLE_FRAME:
+            size = frame[0] & 0x0F
+            start = 1
+            if size == 0 and len(frame) > 8:
+                size = frame[1]  # CAN FD escape
+                start = 2
+            if size == 0 or start + size > len(frame):
+                return None
+            return self.complete(time_ns, time_ns, channel, dir, can_id, bytes(frame[start:start + size]))
+        if pci == FIRST_FRAME:
+            if len(frame) < 2:
+                return None
+            size = (frame[0] & 0x0F) << 8 | frame[1]
+            start = 2
+            if size == 0 and len(frame) >= 6:
+                size = int.from_bytes(frame[2:6], "big")  # more than 4095 bytes
+                start = 6
+                if size <= 0xFFF:
+                    return None
+            if size <= (7 if len(frame) <= 8 else len(frame) - 2):
+                return None  # fits a single frame, not a valid first frame (ISO 15765-2)
+            if key in self.sessions:
+                self.dropped += 1
+            self.sessions[key] = Session(time_ns, size, frame[start:start + size])
+            self.sessions.move_to_end(key)
+            if len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.dropped += 1
+            return None
+        if pci == CONSECUTIVE_FRAME:
+            session = self.sessions.get(key)
+            if session is None:
+                return None
+            if frame[0] & 0x0F != session.sn:
+                del self.sessions[key]
+                self.dropped += 1
+                return None
+            session.sn = (session.sn + 1) & 0x0F
+            session.last_time_ns = time_ns
+            session.data += frame[1:1 + session.size - len(session.data)]
+            if len(session.data) < session.size:
+                self.sessions.move_to_end(key)
+                return None
+            del self.sessions[key]
+            return self.complete(session.first_time_ns, time_ns, channel, dir, can_id, bytes(session.data))
+        return None  # flow control
+
+    def expire(self, time_ns: int):
+        # sessions are ordered by their last frame
+        sessions = self.sessions
+        while sessions:
+            key, session = next(iter(sessions.items()))
+            if time_ns - session.last_time_ns <= self.timeout_ns:
+                break
+            del sessions[key]
+            self.dropped += 1
+
+    def complete(self, first_time_ns: int, time_ns: int, channel: int, dir: int, can_id: int, data: bytes) -> UdsMessage | None:
+        if not data:
+            return None
+        sid = request_sid(data)
+        response = is_response(data)
+        nrc = data[2] if data[0] == NEGATIVE_RESPONSE and len(data) > 2 else -1
+        latency_ns = -1
+        requests = self.requests
+        if response:
+            request = requests.get((channel, sid))
+            if request is not None:
+                latency_ns = time_ns - request
+                if nrc != RESPONSE_PENDING:
+                    del requests[(channel, sid)]
+        else:
+            requests[(channel, sid)] = time_ns
+            requests.move_to_end((channel, sid))
+            if len(requests) > MAX_REQUESTS:
+                requests.popitem(last=False)
+        return {"time_ns": time_ns,
+                "first_time_ns": first_time_ns,
+                "channel": channel,
+                "dir": dir,
+                "can_id": can_id,
+                "data": data,
+                "sid": sid,
+                "service": SERVICE_NAMES.get(sid, f"{sid:02X}"),
+                "response": response,
+                "nrc": nrc,
+                "latency_ns": latency_ns}
+
+
+def reassemble(objs: Iterable[BaseObject], reassembler: IsoTpReassembler | None = None) -> Iterator[UdsMessage]:
+    reassembler = reassembler or IsoTpReassembler()
+    feed = reassembler.feed_object
+    for obj in objs:
+        uds = feed(obj)
+        if uds is not None:
+            yield uds
+
+
+def main():
+    filename = sys.argv[1]
+    t0 = time.time()
+    count = sum(1 for _ in parse_base_object_file(filename))
+    t1 = time.time()
+    reassembler = IsoTpReassembler()
+    messages = sum(1 for _ in reassemble(parse_base_object_file(filename), reassembler))
+    t2 = time.time()
+    print("decode", count, t1 - t0)
+    print("decode + ISO-TP", messages, t2 - t1, "dropped", reassembler.dropped)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from array import array
+from mmap import ACCESS_READ, mmap
+
+from blfparser import merge_base_object, parse_base_object_file
+from ethdissect import PROTOCOL_COLUMNS
+from logstore import COLUMNS, LogStore
+
+CACHE_VERSION = 2  # 2: protocol columns of dissect_all
+CACHE_DIRNAME = ".logcache"
+CACHE_MAX_SIZE = 4_000_000_000
+MANIFEST = "manifest.json"
+PAYLOAD = "payload.bin"
+SUMMARY = "summary.json"
+
+
+def column_spec() -> list[list]:
+    return [[name, typecode, array(typecode).itemsize] for name, typecode in COLUMNS]
+
+
+def protocol_spec() -> list[list]:
+    return [[name, typecode, array(typecode).itemsize] for name, typecode, _ in PROTOCOL_COLUMNS]
+
+
+def cache_key(filenames: list[str]) -> list[list]:
+    key = []
+    for filename in filenames:
+        st = os.stat(filename)
+        key.append([os.path.abspath(filename), st.st_size, st.st_mtime_ns])
+    return key
+
+
+class LogCache:
+
+    def __init__(self, cache_dir: str, max_size: int = CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    @classmethod
+    def beside(cls, filenames: list[str], max_size: int = CACHE_MAX_SIZE) -> "LogCache":
+        return cls(os.path.join(os.path.dirname(os.path.abspath(filenames[0])), CACHE_DIRNAME), max_size)
+
+    def entry_dir(self, key: list[list]) -> str:
+        name = hashlib.sha1(json.dumps([path for path, _, _ in key]).encode()).hexdigest()
+        return os.path.join(self.cache_dir, name)
+
+    def load(self, filenames: list[str], store: LogStore) -> bool:
+        key = cache_key(filenames)
+        path = self.entry_dir(key)
+        try:
+            with open(os.path.join(path, MANIFEST)) as fp:
+                manifest = json.load(fp)
+        except (OSError, ValueError):
+            return False
+        if manifest.get("version") != CACHE_VERSION or manifest.get("key") != key or manifest.get("columns") != column_spec():
+            return False  # stale or written by another version
+        dissected = manifest.get("protocols") is not None
+        if dissected and manifest["protocols"] != protocol_spec():
+            return False
+        rows = manifest["rows"]
+        mmaps = []
+        columns = {}
+        protocols = {}
+        try:
+            for name, typecode in COLUMNS:
+                columns[name], mm = map_column(os.path.join(path, name + ".bin"), typecode, rows)
+                if mm is not None:
+                    mmaps.append(mm)
+            if dissected:
+                for name, typecode, _ in PROTOCOL_COLUMNS:
+                    protocols[name], mm = map_column(os.path.join(path, name + ".bin"), typecode, rows)
+                    if mm is not None:
+                        mmaps.append(mm)
+            payload, mm = map_column(os.path.join(path, PAYLOAD), "B", manifest["payload"])
+            if mm is not None:
+                mmaps.append(mm)
+        except (OSError, ValueError):
+            del columns, protocols
+            for mm in mmaps:
+                try:
+                    mm.close()
+                except BufferError:
+                    pass
+            return False
+        store.set_columns(columns, payload, mmaps, protocols if dissected else None)
+        manifest["last_used"] = time.time()
+        try:
+            write_manifest(path, manifest)
+        except OSError:
+            pass  # read-only cache
+        return True
+
+    def load_summary(self, filenames: list[str]) -> dict | None:
+        # what save was given with the rows, None for a stale entry
+        key = cache_key(filenames)
+        try:
+            with open(os.path.join(self.entry_dir(key), SUMMARY)) as fp:
+                value = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        return value["summary"] if value.get("key") == key else None
+
+    def save(self, filenames: list[str], store: LogStore, summary: dict | None = None):
+        key = cache_key(filenames)
+        path = self.entry_dir(key)
+        tmp = path + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        protocols = store.protocols
+        if protocols is not None and len(protocols["ip_proto"]) != len(store):
+            protocols = None  # rows appended after dissect_all
+        for name, column in store.columns() + list((protocols or {}).items()):
+            with open(os.path.join(tmp, name + ".bin"), "wb") as fp:
+                fp.write(column)
+        with open(os.path.join(tmp, PAYLOAD), "wb") as fp:
+            fp.write(store.payload)
+        if summary is not None:
+            with open(os.path.join(tmp, SUMMARY), "w") as fp:
+                json.dump({"key": key, "summary": summary}, fp)
+        write_manifest(tmp, {"version": CACHE_VERSION,
+                             "key": key,
+                             "columns": column_spec(),
+                             "protocols": None if protocols is None else protocol_spec(),
+                             "rows": len(store),
+                             "payload": len(store.payload),
+                             "last_used": time.time()})
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        self.evict(keep=path)
+
+    def entries(self) -> list[tuple[float, int, str]]:
+        # (last_used, size, path) of every cache entry
+        result = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return result
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                with open(os.path.join(path, MANIFEST)) as fp:
+                    last_used = json.load(fp).get("last_used", 0)
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+            except (OSError, ValueError):
+                continue
+            result.append((last_used, size, path))
+        return result
+
+    def evict(self, keep: str | None = None):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def map_column(filename: str, typecode: str, count: int) -> tuple[memoryview, mmap | None]:
+    with open(filename, "rb") as fp:
+        size = os.fstat(fp.fileno()).st_size
+        if size == 0:
+            if count:
+                raise ValueError("truncated column")
+            return (memoryview(b"").cast(typecode), None)  # empty files can't be mapped
+        mm = mmap(fp.fileno(), length=0, access=ACCESS_READ)
+    column = memoryview(mm).cast(typecode)
+    if len(column) != count:
+        column.release()
+        mm.close()
+        raise ValueError("truncated column")
+    return (column, mm)
+
+
+def write_manifest(path: str, manifest: dict):
+    with open(os.path.join(path, MANIFEST + ".tmp"), "w") as fp:
+        json.dump(manifest, fp)
+    os.replace(os.path.join(path, MANIFEST + ".tmp"), os.path.join(path, MANIFEST))
+
+
+def main():
+    filenames = sys.argv[1:]
+    cache = LogCache.beside(filenames)
+    store = LogStore()
+    t0 = time.time()
+    if not cache.load(filenames, store):
+        for item in merge_base_object([parse_base_object_file(filename) for filename in filenames]):
+            store.append(item)
+        t1 = time.time()
+        print("decode", len(store), t1 - t0)
+        cache.save(filenames, store)
+        t2 = time.time()
+        print("save", t2 - t1)
+        store = LogStore()
+        t0 = time.time()
+        cache.load(filenames, store)
+    t1 = time.time()
+    print("load", len(store), t1 - t0)
+
+
+if __name__ == "__main__":
+    main()
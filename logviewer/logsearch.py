@@ -0,0 +1,160 @@
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Callable, Iterable, Iterator
+
+from cancel import CancelToken
+from logstore import LogStore
+
+NGRAM = 3
+TEXT_INDEX = bool(os.environ.get("LOGVIEWER_TEXT_INDEX"))  # build a MessageIndex while loading
+EMPTY = array("L")
+PROGRESS_ROWS = 8192  # rows between two progress reports and cancel checks of find_text
+
+
+def parse_hex(text: str) -> bytes | None:
+    # "57 56 57" or "575657", None for anything else
+    digits = "".join(text.split())
+    if len(digits) < 2 or len(digits) % 2:
+        return None
+    try:
+        return bytes.fromhex(digits)
+    except ValueError:
+        return None
+
+
+def searchable(payload: bytearray | memoryview) -> bytearray | memoryview:
+    # the mmap behind a cached payload has find, memoryview has not
+    if isinstance(payload, memoryview) and hasattr(payload.obj, "find") and payload.nbytes == len(payload.obj):
+        return payload.obj
+    return payload
+
+
+def find_bytes(store: LogStore, pattern: bytes, start: int = 0, stop: int | None = None) -> Iterator[int]:
+    # rows in [start, stop) whose data contains pattern, one find per hit instead of a check per row
+    stop = len(store) if stop is None else stop
+    if not pattern or start >= stop:
+        return
+    offsets = store.data_offset
+    lengths = store.data_length
+    buf = searchable(store.payload)
+    end = offsets[stop - 1] + lengths[stop - 1]
+    pos = offsets[start]
+    while True:
+        pos = buf.find(pattern, pos, end)
+        if pos < 0:
+            return
+        row = bisect_right(offsets, pos, start, stop) - 1
+        if pos + len(pattern) <= offsets[row] + lengths[row]:
+            yield row
+            if row + 1 >= stop:
+                return
+            pos = offsets[row + 1]
+        else:
+            pos += 1  # across two rows
+
+
+def message_text(store: LogStore, row: int) -> str:
+    # the message column without the data bytes, which find_bytes searches, safe off the GUI thread
+    return store.format_row(row, memo=False)[5].rsplit(" [", 1)[0].lower()
+
+
+class MessageIndex:
+    # n-grams of message_text -> rows in ascending order, extended as rows are loaded
+
+    def __init__(self, n: int = NGRAM):
+        self.n = n
+        self.postings: dict[str, array] = {}
+        self.size = 0  # rows indexed
+        self.lock = threading.Lock()  # updated by the loader and by a search
+
+    def update(self, store: LogStore, stop: int | None = None):
+        stop = len(store) if stop is None else stop
+        postings = self.postings
+        n = self.n
+        with self.lock:
+            for row in range(self.size, stop):
+                text = message_text(store, row)
+                for gram in {text[i:i + n] for i in range(len(text) - n + 1)}:
+                    rows = postings.get(gram)
+                    if rows is None:
+                        rows = postings[gram] = array("L")
+                    rows.append(row)
+            self.size = max(self.size, stop)
+
+    def candidates(self, query: str) -> Iterable[int] | None:
+        # rows having every n-gram of query, None if query is shorter than n
+        n = self.n
+        if len(query) < n:
+            return None
+        lists = sorted((self.postings.get(query[i:i + n], EMPTY) for i in range(len(query) - n + 1)), key=len)
+        return [row for row in lists[0] if all(contains(rows, row) for rows in lists[1:])]
+
+
+def contains(rows: array, row: int) -> bool:
+    i = bisect_left(rows, row)
+    return i < len(rows) and rows[i] == row
+
+
+def find_text(store: LogStore, query: str, index: MessageIndex | None = None, stop: int | None = None,
+              progress: Callable[[int], None] | None = None, cancel: CancelToken | None = None) -> Iterator[int]:
+    # rows in [0, stop) whose message text contains query, ignoring case
+    # the rows not indexed are formatted one by one, progress gets the percent done
+    query = query.lower()
+    stop = len(store) if stop is None else stop
+    start = 0
+    if index is not None:
+        candidates = index.candidates(query)
+        if candidates is not None:
+            start = min(index.size, stop)
+            yield from (row for row in candidates if row < start and query in message_text(store, row))
+    for chunk in range(start, stop, PROGRESS_ROWS):
+        if cancel is not None:
+            cancel.check()
+        if progress is not None:
+            progress(chunk * 100 // stop)
+        for row in range(chunk, min(chunk + PROGRESS_ROWS, stop)):
+            if query in message_text(store, row):
+                yield row
+
+
+def find_all(store: LogStore, text: str, index: MessageIndex | None = None, stop: int | None = None,
+             progress: Callable[[int], None] | None = None, cancel: CancelToken | None = None,
+             messages: bool | None = None) -> array:
+    # the message text and its encoding in the data, text that is also hex like "F1 90" the data bytes too
+    # messages: search the message text too, by default unless text is hex and no index saves formatting every row
+    stop = len(store) if stop is None else stop
+    rows = set(find_bytes(store, text.encode(), 0, stop))
+    pattern = parse_hex(text)
+    if pattern is not None:
+        rows.update(find_bytes(store, pattern, 0, stop))
+    if messages is None:
+        messages = pattern is None or index is not None
+    if messages:
+        rows.update(find_text(store, text, index, stop, progress, cancel))
+    return array("L", sorted(rows))
+
+
+def main():
+    from blfparser import parse_base_object_file
+
+    filename = sys.argv[1]
+    text = sys.argv[2]
+    store = LogStore()
+    for item in parse_base_object_file(filename):
+        store.append(item)
+    t0 = time.time()
+    index = MessageIndex()
+    index.update(store)
+    t1 = time.time()
+    rows = find_all(store, text, index)
+    t2 = time.time()
+    print("index", len(store), t1 - t0, len(index.postings), "n-grams")
+    print("find_all", len(rows), t2 - t1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,500 @@
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from itertools import compress
+from mmap import ACCESS_READ, mmap
+
+from blfbatch import BATCH_FDF, CANBatch
+from blfparser import (BaseObject, parse_container_objects, parse_file_header,
+                       parse_log_container_mm)
+from cancel import CancelToken
+from constants import (CAN_ERROR, CAN_ERROR_EXT, CAN_FD_MESSAGE,
+                       CAN_FD_MESSAGE_64, CAN_MESSAGE, CAN_MESSAGE2,
+                       CAN_MSG_EXT, ETHERNET_FRAME, ETHERNET_FRAME_EX,
+                       GLOBAL_MARKER)
+from ethdissect import Dissection, dissect, dissect_columns, select_rows
+from isotp import (IsoTpReassembler, UdsMessage, describe_uds, frame_length,
+                   is_response, request_sid)
+from pipestats import STATS
+
+LAYER_NONE = 0
+LAYER_CAN = 1
+LAYER_ETHERNET = 2
+LAYER_TCPIP = 3
+LAYER_DOIP = 4
+LAYER_UDS = 5
+LAYER_SOMEIP = 6
+LAYER_ISOTP = 7  # UDS reassembled from CAN frames
+LAYER_NAMES = ["", "CAN", "Ethernet", "TCP/IP", "DoIP", "UDS", "SOME/IP", "UDS"]
+STREAM_NAMES = ["", "CAN", "ETH", "ETH", "ETH", "ETH", "ETH", "CAN"]
+IP_LAYERS = (LAYER_TCPIP, LAYER_DOIP, LAYER_UDS, LAYER_SOMEIP)  # dissected from the payload
+DIR_NAMES = ["Rx", "Tx", "TxRq"]
+EVENT_NAMES = {CAN_MESSAGE: "CAN",
+               CAN_MESSAGE2: "CAN",
+               CAN_FD_MESSAGE: "CAN FD",
+               CAN_FD_MESSAGE_64: "CAN FD",
+               CAN_ERROR: "CAN Error",
+               CAN_ERROR_EXT: "CAN Error",
+               ETHERNET_FRAME: "Ethernet",
+               ETHERNET_FRAME_EX: "Ethernet",
+               GLOBAL_MARKER: "Marker"}
+ERROR_TYPES = (CAN_ERROR, CAN_ERROR_EXT)
+IP_ETH_TYPES = (0x0800, 0x86DD)
+
+MESSAGE_DATA_MAX = 32  # bytes shown in the message column
+UDS_PAIR_WINDOW = 64  # preceding UDS rows searched for the request of a response
+
+COLUMNS = [("time_ns", "q"),
+           ("obj_type", "H"),
+           ("channel", "H"),
+           ("layer", "B"),
+           ("dir", "B"),
+           ("ident", "L"),  # can_id or eth_type
+           ("data_offset", "Q"),
+           ("data_length", "L")]
+
+
+class LogStore:
+
+    time_ns: array | memoryview
+    obj_type: array | memoryview
+    channel: array | memoryview
+    layer: array | memoryview
+    dir: array | memoryview
+    ident: array | memoryview
+    data_offset: array | memoryview
+    data_length: array | memoryview
+    payload: bytearray | memoryview
+
+    def __init__(self, cache_size: int = 4096):
+        self.mmaps: list[mmap] = []  # backing the columns loaded by set_columns
+        self.cache: OrderedDict[int, list[str]] = OrderedDict()
+        self.cache_size = cache_size
+        self.orders: dict[tuple[int, bool], array] = {}
+        self.dissections: OrderedDict[int, Dissection | None] = OrderedDict()
+        self.protocols: dict[str, array | memoryview] | None = None  # columns of dissect_all
+        self.uds_rows = array("L")  # rows of LAYER_ISOTP, scanned up to uds_scanned
+        self.uds_scanned = 0
+        self.lock = threading.Lock()  # the caches, layer and UDS rows, shared with the loader, sort, search and export threads
+        self.clear()
+
+    def __len__(self):
+        return len(self.time_ns)
+
+    def columns(self) -> list[tuple[str, array | memoryview]]:
+        return [(name, getattr(self, name)) for name, _ in COLUMNS]
+
+    def set_columns(self, columns: dict[str, array | memoryview], payload: bytearray | memoryview, mmaps: list[mmap] = [],
+                    protocols: dict[str, array | memoryview] | None = None):
+        # columns may be read-only memoryviews over mmaps, which are closed by the next clear
+        # protocols are those of dissect_all for these columns, e.g. from the cache
+        with self.lock:
+            for name, _ in COLUMNS:
+                setattr(self, name, columns[name])
+            self.payload = payload
+            self.cache.clear()
+            self.orders.clear()
+            self.dissections.clear()
+            self.protocols = protocols
+            self.uds_rows = array("L")
+            self.uds_scanned = 0
+        self.release()
+        self.mmaps = list(mmaps)
+
+    def release(self):
+        for mm in self.mmaps:
+            try:
+                mm.close()
+            except BufferError:
+                pass  # still exported, closed when the last view goes away
+        self.mmaps = []
+
+    def clear(self):
+        self.set_columns({name: array(typecode) for name, typecode in COLUMNS}, bytearray())
+
+    def append(self, obj: BaseObject):
+        msg = obj["msg"]
+        if msg is None:
+            layer = LAYER_NONE
+            channel = 0
+            dir = 0
+            ident = 0
+            data = b""
+        elif msg["type"] == "can":
+            layer = LAYER_CAN
+            channel = msg["channel"]
+            dir = msg["dir"]
+            ident = msg["can_id"]
+            data = msg["data"]
+        else:
+            ident = msg["eth_type"]
+            layer = LAYER_TCPIP if ident in IP_ETH_TYPES else LAYER_ETHERNET
+            channel = msg["channel"]
+            dir = msg["dir"]
+            data = msg["data"]
+        self.time_ns.append(obj["start_timestamp"] + obj["time_ns"])
+        self.obj_type.append(obj["obj_type"])
+        self.channel.append(channel)
+        self.layer.append(layer)
+        self.dir.append(dir)
+        self.ident.append(ident)
+        self.data_offset.append(len(self.payload))
+        self.data_length.append(len(data))
+        self.payload += data
+
+    def append_batch(self, batch: CANBatch, lo: int, hi: int):
+        # rows lo to hi of a CAN batch, column slices instead of a row at a time
+        if lo >= hi:
+            return
+        offsets = batch["data_offset"]
+        start = offsets[lo]
+        stop = offsets[hi - 1] + batch["data_length"][hi - 1]
+        base = len(self.payload) - start
+        self.time_ns.extend(batch["time_ns"][lo:hi])
+        self.obj_type.extend(batch["obj_type"][lo:hi])
+        self.channel.extend(batch["channel"][lo:hi])
+        self.layer.frombytes(bytes((LAYER_CAN,)) * (hi - lo))
+        self.dir.extend(batch["dir"][lo:hi])
+        self.ident.extend(batch["can_id"][lo:hi])
+        self.data_offset.extend(map(base.__add__, offsets[lo:hi]))
+        self.data_length.extend(batch["data_length"][lo:hi])
+        self.payload += batch["payload"][start:stop]
+
+    def append_uds(self, uds: UdsMessage, obj_type: int):
+        # a message of IsoTpReassembler, after the frame that completed it
+        data = uds["data"]
+        self.time_ns.append(uds["time_ns"])
+        self.obj_type.append(obj_type)
+        self.channel.append(uds["channel"])
+        self.layer.append(LAYER_ISOTP)
+        self.dir.append(uds["dir"])
+        self.ident.append(uds["can_id"])
+        self.data_offset.append(len(self.payload))
+        self.data_length.append(len(data))
+        self.payload += data
+
+    def delete(self, rows: list[int]):
+        if self.mmaps:
+            self.set_columns({name: array(typecode, getattr(self, name)) for name, typecode in COLUMNS}, bytearray(self.payload))
+        with self.lock:
+            for row in sorted(rows, reverse=True):
+                for _, column in self.columns():
+                    del column[row]
+            self.cache.clear()
+            self.orders.clear()
+            self.dissections.clear()
+            self.protocols = None
+            self.uds_rows = array("L")
+            self.uds_scanned = 0
+
+    def data(self, row: int) -> bytes:
+        i = self.data_offset[row]
+        return bytes(self.payload[i:i + self.data_length[row]])
+
+    def dissect(self, row: int, memo: bool = True) -> Dissection | None:
+        # lazy, memoized like the formatted rows, memo=False leaves the cache of the GUI thread alone
+        if not memo:
+            return dissect(self.ident[row], self.data(row)) if self.layer[row] in IP_LAYERS else None
+        cache = self.dissections
+        if row in cache:
+            cache.move_to_end(row)
+            return cache[row]
+        value = cache[row] = dissect(self.ident[row], self.data(row)) if self.layer[row] in IP_LAYERS else None
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return value
+
+    def dissect_all(self, cancel: CancelToken | None = None) -> dict[str, array | memoryview]:
+        # protocol columns of all rows, the IP rows are dissected one by one, also refines the layer column
+        n = len(self.time_ns)
+        if self.protocols is not None and len(self.protocols["ip_proto"]) == n:
+            return self.protocols
+        rows = compress(range(n), map(IP_LAYERS.__contains__, self.layer))
+        if cancel is not None:
+            rows = cancel.guard(rows)  # raises Cancelled, the store is left as it was
+        protocols = dissect_columns(rows, self.ident, self.payload, self.data_offset, self.data_length, n)
+        layer = array("B", self.layer)
+        for name, code in (("someip_service", LAYER_SOMEIP), ("doip_type", LAYER_DOIP), ("uds_sid", LAYER_UDS)):
+            column = protocols[name]
+            for row in compress(range(n), map((-1).__ne__, column)):
+                layer[row] = code
+        with self.lock:  # called by the loader while the GUI formats rows and a thread may sort them
+            self.layer = layer
+            self.protocols = protocols
+            self.cache.clear()
+            self.orders.clear()
+        return protocols
+
+    def select_rows(self, name: str, value: int) -> array:
+        # rows whose protocol column name equals value, e.g. ("doip_type", DOIP_DIAGNOSTIC_MESSAGE)
+        return select_rows(self.dissect_all()[name], value)
+
+    def isotp_rows(self) -> array:
+        with self.lock:
+            n = len(self.time_ns)
+            if self.uds_scanned < n:
+                start = self.uds_scanned
+                self.uds_rows.extend(compress(range(start, n), map(LAYER_ISOTP.__eq__, self.layer[start:n])))
+                self.uds_scanned = n
+            return self.uds_rows
+
+    def uds_latency(self, row: int) -> int:
+        # time since the request answered by a response row, -1 if none is found nearby
+        data = self.data(row)
+        if not data or not is_response(data):
+            return -1
+        sid = request_sid(data)
+        channel = self.channel[row]
+        rows = self.isotp_rows()
+        i = bisect_left(rows, row)
+        for r in reversed(rows[max(i - UDS_PAIR_WINDOW, 0):i]):
+            if self.channel[r] == channel and self.data_length[r] and self.payload[self.data_offset[r]] == sid:
+                return self.time_ns[row] - self.time_ns[r]
+        return -1
+
+    def format_row(self, row: int, memo: bool = True) -> list[str]:
+        # memo=False for threads other than the GUI thread, nothing but the locked UDS rows is written
+        t = self.time_ns[row]
+        obj_type = self.obj_type[row]
+        layer = self.layer[row]
+        stamp = format_time(t)
+        stream = f"{STREAM_NAMES[layer]} {self.channel[row]}" if layer != LAYER_NONE else ""
+        severity = "Error" if obj_type in ERROR_TYPES else "Info"
+        event = EVENT_NAMES.get(obj_type, str(obj_type))
+        dissection = self.dissect(row, memo) if layer in IP_LAYERS else None
+        if layer == LAYER_NONE:
+            message = ""
+        else:
+            ident = self.ident[row]
+            if dissection is not None:
+                layer = dissection_layer(dissection)
+                name = describe(dissection)
+                body = dissection["payload"]
+                n = len(body)
+                data = body[:MESSAGE_DATA_MAX].hex(" ").upper()
+            else:
+                if layer in (LAYER_CAN, LAYER_ISOTP):
+                    name = f"{ident & ~CAN_MSG_EXT:X}x" if ident & CAN_MSG_EXT else f"{ident:X}"
+                else:
+                    name = f"{ident:04X}"
+                n = self.data_length[row]
+                i = self.data_offset[row]
+                data = self.payload[i:i + min(n, MESSAGE_DATA_MAX)].hex(" ").upper()
+            if n > MESSAGE_DATA_MAX:
+                data += " ..."
+            dir = self.dir[row]
+            if layer == LAYER_ISOTP:
+                name += " " + describe_uds(self.data(row))
+                latency = self.uds_latency(row)
+                if latency >= 0:
+                    name += f" (+{latency / 1e6:.3f} ms)"
+            message = f"{name} {DIR_NAMES[dir] if dir < len(DIR_NAMES) else dir} [{n}] {data}"
+        return [stamp, stream, LAYER_NAMES[layer], severity, event, message]
+
+    def get_row(self, row: int) -> list[str]:
+        # formatted outside the lock, which format_row takes for the UDS rows
+        cache = self.cache
+        with self.lock:
+            value = cache.get(row)
+            if value is not None:
+                cache.move_to_end(row)
+                return value
+            layer = self.layer
+        if STATS.enabled:
+            t0 = time.perf_counter()
+            value = self.format_row(row)
+            STATS.add("format_rows")
+            STATS.add("format_s", time.perf_counter() - t0)
+        else:
+            value = self.format_row(row)
+        with self.lock:
+            if self.layer is layer:  # else formatted with the layer replaced meanwhile
+                cache[row] = value
+                if len(cache) > self.cache_size:
+                    cache.popitem(last=False)
+        return value
+
+    def get_value(self, row: int, col: int) -> str:
+        return self.get_row(row)[col]
+
+    def sort_keys(self, col: int, stop: int | None = None) -> list[array | list]:
+        # keys of the rows before stop, most significant first, ordered like the formatted text but for col 5
+        # the columns are sliced first, a sort thread runs while the loader appends and dissect_all replaces layer
+        n = len(self.time_ns) if stop is None else stop
+        if col == 0:
+            return [self.time_ns[:n]]
+        if col == 1:
+            rank = rank_names(STREAM_NAMES)
+            return [list(map(rank.__getitem__, self.layer[:n])), self.channel[:n]]
+        if col == 2:
+            rank = rank_names(LAYER_NAMES)
+            return [list(map(rank.__getitem__, self.layer[:n]))]
+        if col == 3:
+            return [[0 if t in ERROR_TYPES else 1 for t in self.obj_type[:n]]]  # Error < Info
+        if col == 4:
+            obj_type = self.obj_type[:n]
+            names = {t: EVENT_NAMES.get(t, str(t)) for t in set(obj_type)}
+            ranks = {name: i for i, name in enumerate(sorted(set(names.values())))}
+            rank = {t: ranks[name] for t, name in names.items()}
+            return [list(map(rank.__getitem__, obj_type))]
+        if col == 5:
+            # grouped by layer and id, then the data bytes, the text would take formatting every row
+            payload = self.payload
+            data = [bytes(payload[i:i + k]) for i, k in zip(self.data_offset[:n], self.data_length[:n])]
+            return [[layer << 32 | ident for layer, ident in zip(self.layer[:n], self.ident[:n])], data]
+        raise Exception(f"unknown column {col}")
+
+    def sort_order(self, col: int, ascending: bool, stop: int | None = None) -> array:
+        # the rows before stop, all by default
+        n = len(self.time_ns) if stop is None else stop
+        with self.lock:
+            order = self.orders.get((col, ascending))
+            layer = self.layer
+        if order is not None and len(order) == n:
+            return order
+        rows = list(range(n))
+        for key in reversed(self.sort_keys(col, n)):
+            rows.sort(key=key.__getitem__, reverse=not ascending)  # stable
+        order = array("L", rows)
+        with self.lock:
+            if self.layer is layer:  # else keyed by the layer replaced meanwhile
+                self.orders[(col, ascending)] = order
+        return order
+
+    def find_time(self, time_ns: int) -> int:
+        # nearest row, rows are in time order
+        n = len(self.time_ns)
+        if n == 0:
+            return -1
+        row = bisect_left(self.time_ns, time_ns)
+        if row == n or (row > 0 and time_ns - self.time_ns[row - 1] <= self.time_ns[row] - time_ns):
+            row -= 1
+        return row
+
+
+def append_object(store: LogStore, isotp: IsoTpReassembler, obj: BaseObject):
+    # the frame, then the UDS message it completes, only frames of diagnostic ids go through the reassembler
+    store.append(obj)
+    msg = obj["msg"]
+    if msg is not None and msg["type"] == "can" and isotp.ids(msg["can_id"]):
+        uds = isotp.feed_object(obj)
+        if uds is not None:
+            store.append_uds(uds, obj["obj_type"])
+
+
+def append_batch(store: LogStore, isotp: IsoTpReassembler, batch: CANBatch, others: list[tuple[int, BaseObject]]):
+    # the rows of append_object in the same order, the CAN rows in column slices between
+    # the other objects and the UDS messages, each after the frame that completed it
+    inserts = [(row, 1, obj) for row, obj in others]
+    time_ns, channel, dir, can_id, dlc, flags = (batch[name] for name in ("time_ns", "channel", "dir", "can_id", "dlc", "flags"))
+    offsets, lengths, obj_type = batch["data_offset"], batch["data_length"], batch["obj_type"]
+    payload = memoryview(batch["payload"])
+    for k in compress(range(len(can_id)), map(isotp.ids, can_id)):
+        i = offsets[k]
+        n = min(frame_length(dlc[k], flags[k] & BATCH_FDF != 0), lengths[k])
+        uds = isotp.feed(time_ns[k], channel[k], dir[k], can_id[k], payload[i:i + n])
+        if uds is not None:
+            inserts.append((k + 1, 0, (uds, obj_type[k])))
+    lo = 0
+    for row, kind, item in sorted(inserts, key=lambda insert: insert[:2]):
+        store.append_batch(batch, lo, row)
+        lo = row
+        if kind:
+            append_object(store, isotp, item)
+        else:
+            store.append_uds(*item)
+    store.append_batch(batch, lo, len(can_id))
+
+
+def dissection_layer(d: Dissection) -> int:
+    if d["uds_sid"] >= 0:
+        return LAYER_UDS
+    if d["doip_type"] >= 0:
+        return LAYER_DOIP
+    if d["someip_service"] >= 0:
+        return LAYER_SOMEIP
+    return LAYER_TCPIP
+
+
+def describe(d: Dissection) -> str:
+    src = d["src"] if d["ip_version"] == 4 else f"[{d['src']}]"
+    dst = d["dst"] if d["ip_version"] == 4 else f"[{d['dst']}]"
+    if d["src_port"] or d["dst_port"]:
+        text = f"{src}:{d['src_port']} > {dst}:{d['dst_port']}"
+    else:
+        text = f"{d['src']} > {d['dst']} proto {d['ip_proto']}"
+    if d["doip_type"] >= 0:
+        text += f" DoIP {d['doip_type']:04X}"
+        if d["doip_source"] >= 0:
+            text += f" {d['doip_source']:04X}>{d['doip_target']:04X}"
+        if d["uds_sid"] >= 0:
+            text += f" UDS {d['uds_sid']:02X}"
+    elif d["someip_service"] >= 0:
+        text += f" SOME/IP {d['someip_service']:04X}.{d['someip_method']:04X}"
+    return text
+
+
+def inverse_order(order: array) -> array:
+    # inverse[store row] = view row, one pass, faster than sorting range(n) by order
+    inverse = array("L", bytes(len(order) * order.itemsize))
+    for i, row in enumerate(order):
+        inverse[row] = i
+    return inverse
+
+
+def rank_names(names: list[str]) -> list[int]:
+    # rank[code] orders the codes like their names
+    order = sorted(range(len(names)), key=names.__getitem__)
+    rank = [0] * len(names)
+    for i, code in enumerate(order):
+        rank[code] = i
+    return rank
+
+
+def format_time(time_ns: int) -> str:
+    return datetime.fromtimestamp(time_ns // 1_000_000_000).strftime("%Y-%m-%d %H:%M:%S") + f".{time_ns % 1_000_000_000 // 1000:06d}"
+
+
+def parse_time(text: str) -> int:
+    text = text.strip()
+    if "." in text:
+        text, fraction = text.split(".", 1)
+    else:
+        fraction = ""
+    t = datetime.strptime(text, "%Y-%m-%d %H:%M:%S")
+    return int(t.timestamp()) * 1_000_000_000 + int((fraction + "000000000")[:9])
+
+
+def main():
+    filename = sys.argv[1]
+    store = LogStore()
+    with open(filename, "rb") as fp:
+        with mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+            object_count, start_timestamp, stop_timestamp = parse_file_header(mm)
+            t0 = time.time()
+            for item in parse_container_objects(parse_log_container_mm(mm), object_count, start_timestamp, stop_timestamp):
+                store.append(item)
+            t1 = time.time()
+    size = sum(column.itemsize * len(column) for _, column in store.columns())
+    print("load", len(store), t1 - t0)
+    print("bytes/row", size / max(len(store), 1), "+ payload", len(store.payload) / max(len(store), 1))
+    t0 = time.time()
+    for row in range(min(len(store), 10000)):
+        store.get_row(row)
+    t1 = time.time()
+    print("format 10000 rows", t1 - t0)
+    for col in range(6):
+        t0 = time.time()
+        store.sort_order(col, True)
+        t1 = time.time()
+        store.sort_order(col, True)
+        t2 = time.time()
+        print(f"sort column {col}", t1 - t0, "cached", t2 - t1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,96 @@
+import os
 import threading
 import time
-from typing import Any, Callable, Iterator, Sequence
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from mmap import ACCESS_READ, mmap
+from typing import Any, Callable, Iterator
 
 import wx
 import wx.dataview as dv
 
-
-class LogView(dv.DataViewIndexListModel):
-
-    def __init__(self, data: list[Any]):
-        super().__init__(len(data))
-        self.data = data
+from blfbatch import Batch, parse_container_batches
+from blfcatalog import CatalogEntry, find_files, scan_directory
+from blfexport import (export_blf, export_columns, export_csv, select_objects,
+                       store_rows)
+from blffollow import BLFFollower
+from blfindex import (ContainerIndexBuilder, load_container_index,
+                      save_container_index)
+from blfparser import (BaseObject, merge_base_object, parse_container_objects,
+                       parse_file_header, parse_log_container_header_mm,
+                       read_log_container_threaded)
+from busstats import BusStats
+from cancel import CancelToken, Cancelled
+from isotp import IsoTpReassembler
+from logcache import LogCache
+from logsearch import TEXT_INDEX, MessageIndex, find_all
+from logstore import (LogStore, append_batch, append_object, format_time,
+                      inverse_order, parse_time)
+from pipestats import STATS
+
+
+class LogView(dv.DataViewVirtualListModel):
+    RESET_THRESHOLD = 1000
+    HIGHLIGHT = wx.Colour(255, 240, 140)
+
+    def __init__(self, store: LogStore):
+        super().__init__(len(store))
+        self.store = store
+        self.size = len(store)  # rows notified to the control
+        self.order: array | None = None  # view row -> store row
+        self.inverse: array | None = None  # store row -> view row
+        self.sort_column = -1
+        self.sort_ascending = True
+        self.hits = array("L")  # store rows found by the last search, ascending
+        self.index = MessageIndex() if TEXT_INDEX else None
 
     def GetColumnType(self, col: int):
         return "string"
 
+    def StoreRow(self, row: int) -> int:
+        order = self.order
+        if order is not None and row < len(order):
+            return order[row]
+        return row
+
+    def ViewRow(self, row: int) -> int:
+        order = self.order
+        if order is None or row >= len(order):
+            return row
+        return self.inverse[row]
+
     def GetValueByRow(self, row: int, col: int):
-        return self.data[row][col]
+        return self.store.get_value(self.StoreRow(row), col)
 
     def SetValueByRow(self, value: Any, row: int, col: int):
-        self.data[row][col] = value
-        return True
+        return False
 
     def GetColumnCount(self):
-        return len(self.data[0])
+        return 6
 
     def GetCount(self):
-        return len(self.data)
+        return self.size
 
     def GetAttrByRow(self, row: int, col: int, attr: dv.DataViewItemAttr):
-        return False
+        hits = self.hits
+        if not hits:
+            return False
+        row = self.StoreRow(row)
+        i = bisect_left(hits, row)
+        if i == len(hits) or hits[i] != row:
+            return False
+        attr.SetBackgroundColour(self.HIGHLIGHT)
+        return True
 
     def Compare(self, item1: dv.DataViewItem, item2: dv.DataViewItem, col: int, ascending: bool):
         if not ascending:
             item2, item1 = item1, item2
-        row1 = self.GetRow(item1)
-        row2 = self.GetRow(item2)
-        v = self.data[row1][col]
-        w = self.data[row2][col]
+        row1 = self.StoreRow(self.GetRow(item1))
+        row2 = self.StoreRow(self.GetRow(item2))
+        v = self.store.get_value(row1, col)
+        w = self.store.get_value(row2, col)
         if v < w:
             return -1
         if v > w:
@@ -45,23 +98,86 @@ class LogView(dv.DataViewIndexListModel):
         return 0
 
     def DeleteRows(self, rows: list[int]):
-        rows = sorted(rows, reverse=True)
-        for row in rows:
-            del self.data[row]
-            self.RowDeleted(row)
-
-    def AddRow(self, value: Any):
-        self.data.append(value)
+        self.store.delete([self.StoreRow(row) for row in rows])
+        self.Unsort()
+        self.hits = array("L")
+        if self.index is not None:
+            self.index = MessageIndex()  # rows moved, indexed again by the next search
+        self.size -= len(rows)
+        self.RowsDeleted(rows)
+
+    def AddRow(self, value: BaseObject):
+        self.store.append(value)
+        self.size += 1
         self.RowAppended()
 
+    def RowsAppended(self, size: int, reset: bool = True):
+        # notify rows appended to the store since the last call
+        if STATS.enabled:
+            t0 = time.perf_counter()
+        if reset and size - self.size > self.RESET_THRESHOLD:
+            self.Reset(size)
+        else:
+            for _ in range(size - self.size):
+                self.RowAppended()
+        self.size = size
+        if STATS.enabled:
+            STATS.add("ui_batches")
+            STATS.add("ui_s", time.perf_counter() - t0)
+
+    def Clear(self):
+        self.store.clear()
+        self.Unsort()
+        self.hits = array("L")
+        if self.index is not None:
+            self.index = MessageIndex()
+        self.size = 0
+        self.Reset(0)
+
+    def Sort(self, col: int, ascending: bool, order: array, inverse: array):
+        # order and its inverse are built by a thread, see AppFrame.SortRows
+        self.order = order
+        self.inverse = inverse
+        self.sort_column = col
+        self.sort_ascending = ascending
+        self.Reset(self.size)
+
+    def SetHits(self, hits: array) -> int:
+        # store rows found by a search thread, those deleted since are dropped
+        self.hits = array("L", (row for row in hits if row < self.size))
+        self.Reset(self.size)  # repaint the highlights
+        return len(self.hits)
+
+    def NextHit(self, row: int, forward: bool = True) -> int:
+        # view row of the hit after (or before) view row, -1 if none
+        hits = self.hits
+        if not hits:
+            return -1
+        if self.order is None:
+            if forward:
+                i = bisect_right(hits, row)
+                return hits[i] if i < len(hits) else -1
+            i = bisect_left(hits, row)
+            return hits[i - 1] if i > 0 else -1
+        rows = [self.ViewRow(hit) for hit in hits]
+        if forward:
+            return min((r for r in rows if r > row), default=-1)
+        return max((r for r in rows if r < row), default=-1)
+
+    def Unsort(self):
+        self.order = None
+        self.inverse = None
+        self.sort_column = -1
+        self.sort_ascending = True
+
 
 class CustomStatusBar(wx.StatusBar):
 
     def __init__(self, parent):
         wx.StatusBar.__init__(self, parent)
 
-        self.SetFieldsCount(3)
-        self.SetStatusWidths([-2, -1, 150])
+        self.SetFieldsCount(4)
+        self.SetStatusWidths([-2, -1, 200, 150])  # message, -, throughput, progress
         self.sizeChanged = False
         self.Bind(wx.EVT_SIZE, self.OnSize)
         self.Bind(wx.EVT_IDLE, self.OnIdle)
@@ -79,7 +195,7 @@ class CustomStatusBar(wx.StatusBar):
             self.Reposition()
 
     def Reposition(self):
-        rect: wx.Rect = self.GetFieldRect(2)
+        rect: wx.Rect = self.GetFieldRect(3)
         rect.x += 4
         rect.y += 2
         rect.width -= 8
@@ -88,19 +204,147 @@ class CustomStatusBar(wx.StatusBar):
         self.sizeChanged = False
 
 
-LogFunc = Callable[[list[str]], Iterator[tuple[int, int, Sequence[Any]]]]
+class SummaryPanel(wx.Panel):
+    COLUMNS = [("Stream", 60), ("Channel", 60), ("ID", 90), ("Count", 80),
+               ("Min [ms]", 80), ("Mean [ms]", 80), ("Max [ms]", 80), ("Jitter [ms]", 80)]
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.busload = wx.StaticText(self)
+        self.list = wx.ListCtrl(self, style=wx.LC_REPORT | wx.LC_SINGLE_SEL)
+        for i, (name, width) in enumerate(self.COLUMNS):
+            self.list.InsertColumn(i, name, wx.LIST_FORMAT_LEFT if i < 3 else wx.LIST_FORMAT_RIGHT, width)
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(self.busload, 0, wx.EXPAND | wx.ALL, 4)
+        sizer.Add(self.list, 1, wx.EXPAND)
+        self.SetSizer(sizer)
+
+    def ShowStats(self, stats: BusStats):
+        self.list.DeleteAllItems()
+        for stream, channel, ident, count, dt_min, dt_mean, dt_max, jitter in stats.rows():
+            i = self.list.InsertItem(self.list.GetItemCount(), stream)
+            for col, text in enumerate([str(channel), ident, str(count), f"{dt_min:.3f}", f"{dt_mean:.3f}", f"{dt_max:.3f}", f"{jitter:.3f}"], 1):
+                self.list.SetItem(i, col, text)
+        self.busload.SetLabel("Bus load: " + ", ".join(f"{stream} {channel} {mean:.1f}% (peak {peak:.1f}%)" for stream, channel, mean, peak in stats.load()))
+        self.Layout()
+
+
+class CatalogList(wx.ListCtrl):
+    COLUMNS = [("File", 360), ("Start", 170), ("Stop", 170), ("Duration [s]", 90), ("Objects", 90), ("Size [MB]", 80)]
+
+    def __init__(self, parent):
+        super().__init__(parent, style=wx.LC_REPORT | wx.LC_VIRTUAL)
+        for i, (name, width) in enumerate(self.COLUMNS):
+            self.InsertColumn(i, name, wx.LIST_FORMAT_LEFT if i < 3 else wx.LIST_FORMAT_RIGHT, width)
+        self.entries: list[CatalogEntry] = []
+        self.sort_column = 1
+        self.sort_ascending = True
+        self.Bind(wx.EVT_LIST_COL_CLICK, self.OnColClick)
+
+    def SetEntries(self, entries: list[CatalogEntry]):
+        self.entries = entries
+        self.Sort(self.sort_column, self.sort_ascending)
+
+    def Sort(self, col: int, ascending: bool):
+        keys = [lambda e: e["path"], lambda e: e["first_time_ns"], lambda e: e["last_time_ns"],
+                lambda e: e["last_time_ns"] - e["first_time_ns"], lambda e: e["object_count"], lambda e: e["size"]]
+        self.entries.sort(key=keys[col], reverse=not ascending)
+        self.sort_column = col
+        self.sort_ascending = ascending
+        self.SetItemCount(len(self.entries))
+        self.Refresh()
+
+    def OnColClick(self, evt: wx.ListEvent):
+        col = evt.GetColumn()
+        self.Sort(col, not self.sort_ascending if col == self.sort_column else True)
+
+    def OnGetItemText(self, item: int, col: int) -> str:
+        e = self.entries[item]
+        if col == 0:
+            return e["path"]
+        if col == 1:
+            return format_time(e["first_time_ns"])
+        if col == 2:
+            return format_time(e["last_time_ns"])
+        if col == 3:
+            return f"{(e['last_time_ns'] - e['first_time_ns']) / 1e9:.1f}"
+        if col == 4:
+            return str(e["object_count"])
+        return f"{e['size'] / 1e6:.1f}"
+
+
+class CatalogFrame(wx.Frame):
+    # the BLF files of a directory tree, Enter or double click opens the selected files
+
+    def __init__(self, parent: "AppFrame", root: str, entries: list[CatalogEntry]):
+        super().__init__(parent, title=f"Catalog - {root}", size=(1000, 600))
+        self.app = parent
+        self.list = CatalogList(self)
+        self.list.SetEntries(entries)
+        self.CreateStatusBar()
+        self.SetStatusText(f"{len(entries)} files, Ctrl+G to find the files covering a time")
+        self.list.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.OnActivated)
+        self.list.Bind(wx.EVT_CHAR, self.OnChar)
+
+    def OnChar(self, evt: wx.KeyEvent):
+        if evt.GetKeyCode() == wx.WXK_CONTROL_G:
+            self.FindTime()
+        else:
+            evt.Skip()
+
+    def Selected(self) -> list[str]:
+        paths = []
+        item = self.list.GetFirstSelected()
+        while item >= 0:
+            paths.append(self.list.entries[item]["path"])
+            item = self.list.GetNextSelected(item)
+        return paths
+
+    def OnActivated(self, evt: wx.ListEvent):
+        paths = self.Selected()
+        if paths:
+            self.app.drop.Start(paths)
+
+    def FindTime(self):
+        with wx.TextEntryDialog(self, "Date/Time", "Find files") as dlg:
+            if dlg.ShowModal() != wx.ID_OK:
+                return
+            try:
+                time_ns = parse_time(dlg.GetValue())
+            except ValueError:
+                self.SetStatusText(f"invalid time: {dlg.GetValue()}")
+                return
+        found = {e["path"] for e in find_files(self.list.entries, time_ns)}
+        for item, e in enumerate(self.list.entries):
+            self.list.Select(item, e["path"] in found)
+        if found:
+            self.list.EnsureVisible(self.list.GetFirstSelected())
+        self.SetStatusText(f"{len(found)} files cover {format_time(time_ns)}")
+
+
+CLOSE_TIMEOUT = 1.0  # seconds for a cancelled load to stop when the window closes
+
+LogFunc = Callable[[list[str], CancelToken], Iterator[tuple[int, int, BaseObject | Batch]]]
 
 
 class AppFrame(wx.Frame):
 
     def __init__(self, parent, title, size, logfunc: LogFunc):
         super().__init__(parent, title=title, size=size)
-        self.logview = LogView([])
-        self.dvc = self.CreateDVC(self)
+        self.logview = LogView(LogStore())
+        self.splitter = wx.SplitterWindow(self, style=wx.SP_LIVE_UPDATE)
+        self.splitter.SetMinimumPaneSize(50)
+        self.splitter.SetSashGravity(1.0)
+        self.dvc = self.CreateDVC(self.splitter)
         self.dvc.AssociateModel(self.logview)
+        self.summary = SummaryPanel(self.splitter)
+        self.splitter.Initialize(self.dvc)
         self.sbar = CustomStatusBar(self)
         self.SetStatusBar(self.sbar)
         self.drop = MyFileDropTarget(self, logfunc)
+        self.query = ""
+        self.search = CancelToken()  # of the running search, a new one for each search
+        self.sorting = CancelToken()  # of the running sort, likewise
         self.SetDropTarget(self.drop)
         self.Bind(wx.EVT_CLOSE, self.OnClose)
 
@@ -112,80 +356,467 @@ class AppFrame(wx.Frame):
         dvc.AppendTextColumn("Severity", 3, width=60)  # Error, Warning, Info, Debug
         dvc.AppendTextColumn("Event Type", 4, width=80)
         dvc.AppendTextColumn("Message", 5, width=200)
+        dvc.Bind(dv.EVT_DATAVIEW_COLUMN_HEADER_CLICK, self.OnColumnHeaderClick)
         dvc.Bind(dv.EVT_DATAVIEW_COLUMN_HEADER_RIGHT_CLICK, self.OnColumnHeaderRightClick)
         dvc.Bind(wx.EVT_CHAR, self.OnChar)
         return dvc
 
+    def OnColumnHeaderClick(self, evt: dv.DataViewEvent):
+        col = evt.GetColumn()
+        if col == self.logview.sort_column:
+            ascending = not self.logview.sort_ascending
+        else:
+            ascending = True
+        self.sorting.cancel()
+        self.sorting = token = CancelToken()
+        self.sbar.SetStatusText("Sorting")
+        threading.Thread(target=self.SortRows, args=(token, col, ascending), daemon=True).start()
+
+    def SortRows(self, token, col, ascending):
+        # the keys, the sort and the inverse off the GUI thread, of the rows loaded so far
+        store = self.logview.store
+        try:
+            order = store.sort_order(col, ascending, len(store))
+            inverse = inverse_order(order)
+        except Exception as e:
+            wx.CallAfter(self.SortFailed, token, e)
+            return
+        wx.CallAfter(self.SortedRows, token, col, ascending, order, inverse)
+
+    def SortFailed(self, token, e):
+        if not token.cancelled:
+            self.sbar.SetStatusText(f"sort failed: {e}")
+
+    def SortedRows(self, token, col, ascending, order, inverse):
+        if token.cancelled:
+            return  # cleared or sorted again meanwhile
+        self.logview.Sort(col, ascending, order, inverse)
+        for column in self.dvc.GetColumns():
+            if column.GetModelColumn() == col:
+                column.SetSortOrder(ascending)
+            else:
+                column.UnsetAsSortKey()
+        self.sbar.SetStatusText("")
+
     def OnColumnHeaderRightClick(self, evt: dv.DataViewEvent):
         pass
 
     def OnClose(self, evt):
+        self.search.cancel()
         self.drop.Abort()
+        if self.drop.th is not None:
+            self.drop.th.join(CLOSE_TIMEOUT)  # no more CallAfter to the destroyed window, daemon otherwise
         self.Destroy()
 
     def OnChar(self, evt: wx.KeyEvent):
         key = evt.GetKeyCode()
         if key == wx.WXK_ESCAPE:
+            self.search.cancel()
             self.drop.Abort()
+        elif key == wx.WXK_CONTROL_G:
+            self.JumpToTime()
+        elif key == wx.WXK_CONTROL_T:
+            self.drop.ToggleFollow()
+        elif key == wx.WXK_CONTROL_F:
+            self.Find()
+        elif key == wx.WXK_F3:
+            self.FindNext(not evt.ShiftDown())
+        elif key == wx.WXK_CONTROL_B:
+            self.ToggleSummary()
+        elif key == wx.WXK_CONTROL_E:
+            self.Export()
+        elif key == wx.WXK_CONTROL_O:
+            self.OpenCatalog()
         else:
             evt.Skip()
 
+    def JumpToTime(self):
+        store = self.logview.store
+        if self.logview.GetCount() == 0:
+            return
+        row = self.dvc.GetSelectedRow()
+        value = format_time(store.time_ns[self.logview.StoreRow(max(row, 0))])
+        with wx.TextEntryDialog(self, "Date/Time", "Jump to time", value) as dlg:
+            if dlg.ShowModal() != wx.ID_OK:
+                return
+            try:
+                time_ns = parse_time(dlg.GetValue())
+            except ValueError:
+                self.sbar.SetStatusText(f"invalid time: {dlg.GetValue()}")
+                return
+        row = min(self.logview.ViewRow(store.find_time(time_ns)), self.logview.GetCount() - 1)
+        item = self.logview.GetItem(row)
+        self.dvc.Select(item)
+        self.dvc.EnsureVisible(item)
+
+    def Find(self):
+        # text searches the messages and the data, hex like "F1 90" the data bytes too, on a thread
+        if self.logview.GetCount() == 0:
+            return
+        with wx.TextEntryDialog(self, "Hex bytes or text", "Find", self.query) as dlg:
+            if dlg.ShowModal() != wx.ID_OK or not dlg.GetValue():
+                return
+            self.query = dlg.GetValue()
+        self.search.cancel()
+        self.search = token = CancelToken()
+        self.sbar.SetStatusText("Searching, press ESC to abort")
+        args = (token, self.query, self.logview.GetCount(), self.logview.index)
+        threading.Thread(target=self.FindRows, args=args, daemon=True).start()
+
+    def FindRows(self, token, text, size, index):
+        # the rows shown when the search started, formatted without touching the caches of the GUI thread
+        store = self.logview.store
+        started = time.perf_counter()
+        try:
+            if index is not None:
+                index.update(store, size)
+            hits = find_all(store, text, index, size, self.SetProgressAfter, token)
+        except Cancelled:
+            return
+        wx.CallAfter(self.FoundRows, token, hits, time.perf_counter() - started)
+
+    def FoundRows(self, token, hits, elapsed):
+        if token.cancelled:
+            return  # cleared or searched again meanwhile
+        count = self.logview.SetHits(hits)
+        self.sbar.gauge.SetValue(100)
+        self.sbar.SetStatusText(f"{count} hits ({elapsed * 1000:.0f} ms), F3 for the next")
+        self.FindNext(True, -1)
+
+    def FindNext(self, forward: bool = True, row: int | None = None):
+        if row is None:
+            row = self.dvc.GetSelectedRow()
+        row = self.logview.NextHit(row if row >= 0 or forward else self.logview.GetCount(), forward)
+        if row < 0:
+            self.sbar.SetStatusText("no more hits")
+            return
+        item = self.logview.GetItem(row)
+        self.dvc.Select(item)
+        self.dvc.EnsureVisible(item)
+
+    def OpenCatalog(self):
+        with wx.DirDialog(self, "Catalog of a log directory") as dlg:
+            if dlg.ShowModal() != wx.ID_OK:
+                return
+            root = dlg.GetPath()
+        self.sbar.SetStatusText(f"Scanning {root}")
+        threading.Thread(target=self.ScanCatalog, args=(root,), daemon=True).start()
+
+    def ScanCatalog(self, root: str):
+        started = time.monotonic()
+        entries = list(scan_directory(root).values())
+        wx.CallAfter(self.sbar.SetStatusText, f"{len(entries)} files scanned in {time.monotonic() - started:.1f} s")
+        wx.CallAfter(lambda: CatalogFrame(self, root, entries).Show())
+
+    def Export(self):
+        # the time range, only the search hits if any, BLF is cut from the source files
+        store = self.logview.store
+        if self.logview.GetCount() == 0:
+            return
+        with wx.FileDialog(self, "Export", wildcard="BLF (*.blf)|*.blf|CSV (*.csv)|*.csv|Columns (*.lvc)|*.lvc",
+                           style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as dlg:
+            if dlg.ShowModal() != wx.ID_OK:
+                return
+            filename = dlg.GetPath()
+            kind = dlg.GetFilterIndex()
+        value = f"{format_time(store.time_ns[0])} to {format_time(store.time_ns[self.logview.GetCount() - 1])}"
+        with wx.TextEntryDialog(self, "Date/Time range", "Export", value) as dlg:
+            if dlg.ShowModal() != wx.ID_OK:
+                return
+            try:
+                t0, t1 = (parse_time(text) for text in dlg.GetValue().split(" to "))
+            except ValueError:
+                self.sbar.SetStatusText(f"invalid time range: {dlg.GetValue()}")
+                return
+        hits = self.logview.hits if self.logview.hits else None
+        self.sbar.SetStatusText(f"Exporting to {os.path.basename(filename)}")
+        threading.Thread(target=self.ExportRows, args=(kind, filename, t0, t1, hits), daemon=True).start()
+
+    def ExportRows(self, kind, filename, t0, t1, hits):
+        store = self.logview.store
+        started = time.monotonic()
+        try:
+            if kind == 0:
+                count = export_blf(select_objects(self.drop.filenames, t0, t1), filename)
+            elif kind == 1:
+                count = export_csv(store, store_rows(store, t0, t1, hits), filename)
+            else:
+                count = export_columns(store, store_rows(store, t0, t1, hits), filename)
+        except Exception as e:
+            wx.CallAfter(self.sbar.SetStatusText, f"export failed: {e}")  # the file is removed by the export
+            return
+        wx.CallAfter(self.sbar.SetStatusText, f"{count} rows exported to {os.path.basename(filename)} in {time.monotonic() - started:.1f} s")
+
+    def ShowSummary(self, stats: BusStats):
+        self.summary.ShowStats(stats)
+        if not self.splitter.IsSplit():
+            self.splitter.SplitHorizontally(self.dvc, self.summary, -200)
+
+    def ToggleSummary(self):
+        if self.splitter.IsSplit():
+            self.splitter.Unsplit(self.summary)
+        else:
+            self.splitter.SplitHorizontally(self.dvc, self.summary, -200)
+
+    def ShowSummaryAfter(self, stats: BusStats):
+        wx.CallAfter(self.ShowSummary, stats)
+
     def SetProgressAfter(self, value):
         wx.CallAfter(self.sbar.gauge.SetValue, value)
 
-    def LogAppendedAfter(self):
-        wx.CallAfter(self.logview.RowAppended)
+    def SetThroughputAfter(self, text):
+        wx.CallAfter(self.sbar.SetStatusText, text, 2)
+
+    def LogAppendedAfter(self, size, reset=True):
+        wx.CallAfter(self.logview.RowsAppended, size, reset)
 
     def LogResetAfter(self, count):
         wx.CallAfter(self.logview.Reset, count)
 
 
 class MyFileDropTarget(wx.FileDropTarget):
+    UPDATE_INTERVAL = 1 / 30  # at most 30 UI updates per second
+    POLL_INTERVAL = 0.5  # seconds between polls of a followed file
 
     def __init__(self, window: AppFrame, logfunc: LogFunc):
         super().__init__()
         self.window = window
         self.th = None
-        self.abort = False
+        self.token = CancelToken()  # of the running thread, a new one for each start
         self.logfunc = logfunc
+        self.filenames: list[str] = []
+        self.follow = False
 
     def OnDropFiles(self, x, y, filenames):
+        self.Start(filenames)
+        return True
+
+    def Start(self, filenames):
+        # never waits on the GUI thread, the new thread waits for the aborted one
         self.Abort()
-        self.th = threading.Thread(target=self.Process, args=(filenames,))
+        self.token = token = CancelToken()
+        self.filenames = filenames
+        if self.follow and len(filenames) == 1:
+            target, args = self.Follow, (token, filenames[0])
+            self.window.sbar.SetStatusText("Following, press Ctrl+T to stop")
+        else:
+            target, args = self.Process, (token, filenames)
+            self.window.sbar.SetStatusText("Press ESC to abort")
+        self.th = threading.Thread(target=self.Run, args=(self.th, token, target, args), daemon=True)
         self.th.start()
-        self.window.sbar.SetStatusText("Press ESC to abort")
-        return True
+
+    def Run(self, previous, token, target, args):
+        if previous is not None:
+            previous.join()
+        cleared = threading.Event()
+        wx.CallAfter(self.ClearView, token, cleared)
+        while not cleared.wait(self.UPDATE_INTERVAL):
+            if token.cancelled:
+                return
+        if not token.cancelled:
+            target(token, *args)
+
+    def ClearView(self, token, cleared):
+        # the store is only cleared when no thread appends to it
+        if not token.cancelled:
+            self.window.search.cancel()  # their rows are gone
+            self.window.sorting.cancel()
+            self.window.logview.Clear()
+        cleared.set()
+
+    def ToggleFollow(self):
+        # follow mode polls a single file which is still being written
+        self.follow = not self.follow
+        if self.follow:
+            if len(self.filenames) == 1:
+                self.Start(self.filenames)
+            else:
+                self.window.sbar.SetStatusText("Follow mode, drop a file")
+        else:
+            self.Abort()
+            self.window.sbar.SetStatusText("")
 
     def Abort(self):
-        if self.th is not None:
-            self.abort = True
-            self.th.join()
-            self.th = None
-            self.abort = False
+        # returns at once, the thread stops at its next check and releases its files and shared memory
+        self.token.cancel()
 
-    def Process(self, filenames):
+    def Process(self, token, filenames):
         progress = self.window.SetProgressAfter
         appended = self.window.LogAppendedAfter
-        data = self.window.logview.data
-        data.clear()
-        self.window.LogResetAfter(0)
-        for item in self.logfunc(filenames):
-            if self.abort:
-                wx.CallAfter(self.window.sbar.SetStatusText, "")
+        throughput = self.window.SetThroughputAfter
+        store = self.window.logview.store
+        index = self.window.logview.index
+        summary = BusStats()  # aggregated with each UI update, ready when the load ends
+        stats = STATS.enabled
+        if stats:
+            STATS.reset()
+        started = time.monotonic()
+        cache = LogCache.beside(filenames)
+        cached = cache.load(filenames, store)
+        if cached:
+            appended(len(store))  # mapped and dissected, shown before the summary is read
+            value = cache.load_summary(filenames)
+            if value is not None and value["size"] == len(store):
+                summary = BusStats.from_json(value)  # the update below has nothing left to aggregate
+        else:
+            percent = 0
+            deadline = started + self.UPDATE_INTERVAL
+            source = self.logfunc(filenames, token)
+            isotp = IsoTpReassembler()
+            items = STATS.timed(source, "decode_wall_s") if stats else source
+            try:
+                for item in items:
+                    if token.cancelled:
+                        break
+                    if stats:
+                        t0 = time.perf_counter()
+                        append_item(store, isotp, item[2])
+                        STATS.add("append_s", time.perf_counter() - t0)
+                        for obj_type in item_types(item[2]):
+                            STATS.count_object(obj_type)
+                    else:
+                        append_item(store, isotp, item[2])
+                    now = time.monotonic()
+                    if now >= deadline:
+                        deadline = now + self.UPDATE_INTERVAL
+                        if index is not None:
+                            index.update(store)
+                        summary.update(store)
+                        appended(len(store))
+                        value = item[0] * 100 // item[1]
+                        if value != percent:
+                            percent = value
+                            progress(percent)
+                            elapsed = now - started
+                            throughput(f"{item[0] / elapsed / 1e6:.1f} MB/s, {len(store) / elapsed:.0f} rows/s")
+            except Cancelled:
+                pass
+            finally:
+                source.close()  # shuts the decompression pool down and closes the files now, not when collected
+            if token.cancelled:
+                self.Aborted(len(store))
+                return
+            try:
+                dissect_store(store, stats, token)  # before saving, the cache keeps the protocol columns and the refined layers
+            except Cancelled:
+                self.Aborted(len(store))
                 return
-            data.append(item[2])
-            progress(item[0] * item[1] // 100)
-            appended()
-            time.sleep(0.2)
+            summary.update(store)
+            try:
+                cache.save(filenames, store, summary.to_json())
+            except OSError:
+                pass  # no cache for read-only locations
+        if index is not None:
+            index.update(store)
+        summary.update(store)
+        self.window.ShowSummaryAfter(summary)
+        appended(len(store))
+        elapsed = max(time.monotonic() - started, 1e-9)
+        throughput(f"{len(store) / elapsed:.0f} rows/s" + (" (cache)" if cached else ""))
+        if stats:
+            STATS.dump(files=filenames, rows=len(store), cached=cached)
         progress(100)
-        time.sleep(1)
-        progress(0)
-        wx.CallAfter(self.window.sbar.SetStatusText, "")
+        if not token.wait(1):
+            progress(0)
+            wx.CallAfter(self.window.sbar.SetStatusText, "")
 
+    def Aborted(self, size):
+        # the rows read so far stay visible
+        self.window.LogAppendedAfter(size)
+        self.window.SetProgressAfter(0)
+        wx.CallAfter(self.window.sbar.SetStatusText, "Aborted")
 
-def logfunc(filenames):
-    for i in range(100):
-        yield (i, 100, ["2020-02-03 12:20:30.334455", "ABC/DEF", "TCP", "Info", "Message", "Message Trigger"])
+    def Follow(self, token, filename):
+        appended = self.window.LogAppendedAfter
+        store = self.window.logview.store
+        follower = BLFFollower(filename)
+        isotp = IsoTpReassembler()
+        reset = True  # the first poll reads what is already written
+        while not token.cancelled:
+            deadline = time.monotonic() + self.UPDATE_INTERVAL
+            for item in follower.poll():
+                if token.cancelled:
+                    return
+                append_object(store, isotp, item)
+                now = time.monotonic()
+                if now >= deadline:
+                    deadline = now + self.UPDATE_INTERVAL
+                    appended(len(store), reset)
+            appended(len(store), reset)
+            reset = False  # new rows are appended without a Reset
+            token.wait(self.POLL_INTERVAL)
+
+
+def append_item(store, isotp, item):
+    # a batch of the single file path of logfunc, else an object
+    if isinstance(item, tuple):
+        append_batch(store, isotp, *item)
+    else:
+        append_object(store, isotp, item)
+
+
+def item_types(item) -> list[int]:
+    if isinstance(item, tuple):
+        batch, others = item
+        return list(batch["obj_type"]) + [obj["obj_type"] for _, obj in others]
+    return [item["obj_type"]]
+
+
+def dissect_store(store, stats, token=None):
+    # protocol columns for filtering, computed once after the load
+    if stats:
+        t0 = time.perf_counter()
+        store.dissect_all(token)
+        STATS.add("dissect_s", time.perf_counter() - t0)
+    else:
+        store.dissect_all(token)
+
+
+def logfunc(filenames, cancel=None):
+    with ExitStack() as stack:
+        files = []
+        for filename in filenames:
+            fp = stack.enter_context(open(filename, "rb"))
+            mm = stack.enter_context(mmap(fp.fileno(), length=0, access=ACCESS_READ))
+            header = parse_file_header(mm)  # (object_count, start_timestamp, stop_timestamp), mm is left at the first container
+            files.append((filename, mm, header, mm.tell(), load_container_index(filename, *header)))
+        total = max(sum(mm.size() for _, mm, _, _, _ in files), 1)
+        done = 0  # container bytes
+        workers = os.cpu_count() or 1
+        executor = ThreadPoolExecutor(workers)  # shared by the files, shut down before the mmaps are closed
+        stack.callback(executor.shutdown, True, cancel_futures=True)
+
+        def containers(filename, mm, header, data_offset, index):
+            # without a fresh index, the first open, it is built from the containers decoded here and saved at the end
+            nonlocal done
+            if index is not None:
+                headers = [(entry["offset"], entry["obj_size"], entry["compression_method"], entry["uncompressed_size"])
+                           for entry in index["entries"]]
+                builder = None
+            else:
+                headers = list(parse_log_container_header_mm(mm))
+                builder = ContainerIndexBuilder()
+            for (pos, obj_size, compression_method, _), data in zip(headers, read_log_container_threaded(mm, headers, executor, 2 * workers)):
+                if cancel is not None:
+                    cancel.check()  # between containers, without waiting for the objects of the next one
+                if builder is not None:
+                    builder.add(pos, obj_size, compression_method, data)
+                yield data
+                done += obj_size
+            if builder is not None:
+                try:
+                    save_container_index(filename, builder.index(*header, data_offset))
+                except OSError:
+                    pass  # read-only location, built again next time
+
+        if len(files) == 1:
+            # nothing to merge, CAN messages are decoded to columns a container at a time
+            for batch in parse_container_batches(containers(*files[0]), *files[0][2]):
+                yield (done, total, batch)
+            return
+        sources = [parse_container_objects(containers(*file), *file[2]) for file in files]
+        for item in merge_base_object(sources):
+            yield (done, total, item)
 
 
 def main():
@@ -1,9 +1,21 @@
 import os
 import random
+import secrets
 import time
-from multiprocessing import Pool
+from array import array
+from mmap import ACCESS_READ, mmap
+from multiprocessing import Pool, TimeoutError, resource_tracker
 from multiprocessing.pool import AsyncResult
-from typing import Callable, Iterator, TypeVar
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Generator, Iterator
+
+from blfindex import load_container_index
+from blfparser import (OBJ_HEADER_STRUCTS, BaseObject, parse_container,
+                       parse_file_header, parse_log_container_header_mm,
+                       parse_log_container_mm, straddle_size)
+from cancel import CancelToken
+from constants import (CAN_FD_MESSAGE_64, ETHERNET_FRAME_EX, LOBJ,
+                       OBJ_HEADER_BASE_STRUCT)
 
 
 def long_time_task(name, buff):
@@ -36,23 +48,227 @@ def dispatcher():
     print('All subprocesses done. {} seconds.'.format(end - start))
 
 
-T = TypeVar("T")
+CHUNK_SIZE = 100_000_000  # compressed bytes of containers per task
+POLL_TIMEOUT = 0.05  # seconds between checks of the cancel token while a chunk is decoded
 
+Columns = dict[str, array | bytearray]
+ColumnLayout = list[tuple[str, str, int, int]]  # (name, typecode, offset, nbytes) in the shared memory block
+Position = tuple[int, int]  # (container, offset in its data) where an object starts
+ContainerHeader = tuple[int, int, int, int]  # (pos, obj_size, compression_method, uncompressed_size)
+Header = tuple[int, int, int]  # (object_count, start_timestamp, stop_timestamp)
 
-def map_chunks(f: Callable[[str, int, int, bytearray], list[T]], filenames: list[str]) -> Iterator[T]:
-    chunksize = 100_000_000
-    buffsize = 10_000_000
-    buff = bytearray(buffsize)
-    p = Pool()
-    results: list[AsyncResult] = []
+
+def plan_chunks(headers: list[ContainerHeader], chunk_size: int = CHUNK_SIZE) -> list[tuple[int, int]]:
+    # container ranges [start, stop) of about chunk_size bytes, from the container headers only
+    chunks = []
+    start = 0
+    size = 0
+    for i, (_, obj_size, _, _) in enumerate(headers):
+        size += obj_size
+        if size >= chunk_size:
+            chunks.append((start, i + 1))
+            start = i + 1
+            size = 0
+    if start < len(headers):
+        chunks.append((start, len(headers)))
+    return chunks
+
+
+def find_object_start(data: bytes) -> int:
+    # first LOBJ whose chain of object headers runs to the end of data, -1 if none
+    i = data.find(LOBJ)
+    while i >= 0:
+        if object_chain(data, i):
+            return i
+        i = data.find(LOBJ, i + 1)
+    return -1
+
+
+def object_chain(data: bytes, i: int) -> bool:
+    n = len(data)
+    while i + OBJ_HEADER_BASE_STRUCT.size <= n:
+        sig, header_size, version, obj_size, obj_type = OBJ_HEADER_BASE_STRUCT.unpack_from(data, i)
+        if sig != LOBJ or version not in OBJ_HEADER_STRUCTS or not OBJ_HEADER_BASE_STRUCT.size <= header_size <= obj_size:
+            return False
+        i += obj_size if obj_type in (CAN_FD_MESSAGE_64, ETHERNET_FRAME_EX) else obj_size + obj_size % 4
+    return i >= n or data[i:i + len(LOBJ)] == LOBJ[:n - i]  # a header continued in the next container
+
+
+def parse_chunk(mm: mmap, offset: int, start: int, stop: int, header: Header,
+                skip: int | None) -> Generator[BaseObject, None, tuple[Position | None, Position | None]]:
+    # objects which start in the containers [start, stop), read from offset, the position of container start,
+    # the last one is completed from the following containers
+    # skip None finds the first object by its header chain, returns the (first, end) positions, None if no object
+    mm.seek(offset)
+    rest = b""  # head of an object continued in the next container
+    first = None
+    for k, data in enumerate(parse_log_container_mm(mm), start):
+        if first is None:
+            if k >= stop:
+                return (None, None)
+            if skip is None:
+                skip = find_object_start(data)
+                if skip < 0:
+                    skip = None
+                    continue  # no object starts in the container
+            first = (k, skip)
+        if k < stop:
+            rest, skip = yield from parse_container(data, rest, skip, *header)
+            continue
+        if rest:
+            need = straddle_size(rest, data)
+            if need < 0:
+                rest = b"".join((rest, data))
+                continue
+            rest, skip = yield from parse_container(data[:need], rest, 0, *header)  # only the straddling object
+            skip += need
+        if skip < len(data):
+            return (first, (k, skip))
+        skip -= len(data)  # padding continued in the next container
+    return (first, None)  # end of the file
+
+
+def decode_chunk(f: Callable[[Iterator[BaseObject]], Columns], filename: str, offset: int, start: int, stop: int,
+                 header: Header, skip: int | None) -> tuple[Columns, Position | None, Position | None]:
+    positions = []
+
+    def objs():
+        positions.append((yield from parse_chunk(mm, offset, start, stop, header, skip)))
+    with open(filename, "rb") as fp, mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+        columns = f(objs())
+    return (columns, *(positions[0] if positions else (None, None)))
+
+
+def put_columns(name: str, columns: Columns) -> ColumnLayout:
+    # copies the columns into one shared memory block, the reader unlinks it
+    layout = []
+    offset = 0
+    for key, column in columns.items():
+        typecode = column.typecode if isinstance(column, array) else "B"
+        nbytes = len(column) * array(typecode).itemsize
+        layout.append((key, typecode, offset, nbytes))
+        offset += (nbytes + 7) // 8 * 8
+    if offset == 0:
+        return layout  # empty blocks can't be created
+    shm = SharedMemory(name=name, create=True, size=offset)
+    try:
+        for (_, _, offset, nbytes), column in zip(layout, columns.values()):
+            shm.buf[offset:offset + nbytes] = memoryview(column).cast("B")
+    finally:
+        shm.close()
+    return layout
+
+
+def take_columns(name: str, layout: ColumnLayout) -> Columns:
+    columns: Columns = {}
+    if not any(nbytes for _, _, _, nbytes in layout):
+        return {key: array(typecode) for key, typecode, _, _ in layout}
+    shm = SharedMemory(name=name)
+    try:
+        for key, typecode, offset, nbytes in layout:
+            column = array(typecode)
+            column.frombytes(shm.buf[offset:offset + nbytes])
+            columns[key] = column
+    finally:
+        shm.close()
+        shm.unlink()
+    return columns
+
+
+def discard_columns(name: str):
+    try:
+        shm = SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+Task = tuple[Callable[[Iterator[BaseObject]], Columns], str, str, int, int, int, Header, int | None]
+
+
+def run_chunk(task: Task) -> tuple[ColumnLayout, Position | None, Position | None]:
+    # columns of a chunk, no layout and no positions if a chunk entered without an index failed to decode,
+    # decoded again by the parent from the end of the previous chunk
+    f, name, filename, offset, start, stop, header, skip = task
+    try:
+        columns, first, end = decode_chunk(f, filename, offset, start, stop, header, skip)
+    except Exception:
+        if skip is not None:
+            raise
+        return ([], None, None)
+    return (put_columns(name, columns), first, end)
+
+
+def map_chunks(f: Callable[[Iterator[BaseObject]], Columns], filenames: list[str],
+               chunk_size: int = CHUNK_SIZE, processes: int | None = None,
+               cancel: CancelToken | None = None) -> Iterator[Columns]:
+    # f(objs) builds the columns of the objects of a chunk of containers, which come back
+    # through shared memory in file order as soon as each chunk is done
+    # chunks are planned from the container headers, nothing is decompressed here, an index saved beside a file
+    # gives each chunk its first object, else the worker finds it and it is checked against the end of
+    # the previous chunk, a chunk which doesn't follow on is decoded again here
+    prefix = f"chunk_{os.getpid()}_{secrets.token_hex(4)}"
+    tasks: list[Task] = []
+    headers: dict[str, list[ContainerHeader]] = {}
     for filename in filenames:
-        filesize = os.path.getsize(filename)
-        for i in range(0, filesize, chunksize):
-            results.append(p.apply_async(f, args=(filename, i, i + chunksize, buff)))
-    for result in results:
-        ls = result.get()
-        for item in ls:
-            yield item
+        with open(filename, "rb") as fp:
+            with mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+                header = parse_file_header(mm)
+                offset = mm.tell()
+                headers[filename] = list(parse_log_container_header_mm(mm))
+        index = load_container_index(filename, *header)
+        if index is not None and index["data_offset"] != offset:
+            index = None
+        for start, stop in plan_chunks(headers[filename], chunk_size):
+            skip = 0 if start == 0 else None
+            if index is not None:
+                entries = index["entries"]
+                while start < stop and not 0 <= entries[start]["skip"] < entries[start]["uncompressed_size"]:
+                    start += 1  # no object starts in the container, the skip runs past it or is unknown
+                if start >= stop:
+                    continue  # the chunk holds the middle of an object of the previous one
+                skip = entries[start]["skip"]
+            tasks.append((f, f"{prefix}_{len(tasks)}", filename, headers[filename][start][0], start, stop, header, skip))
+    done = 0
+    expected: Position | None = None  # where the next chunk must start
+    resource_tracker.ensure_running()  # shared by the workers, so the blocks unlinked here are not reported as leaked
+    try:
+        with Pool(processes) as p:  # terminated on exit, a chunk being decoded is not waited for
+            it = p.imap(run_chunk, tasks)
+            while done < len(tasks):
+                try:
+                    layout, first, end = it.next(POLL_TIMEOUT)
+                except TimeoutError:
+                    if cancel is not None:
+                        cancel.check()
+                    continue
+                _, name, filename, _, start, stop, header, _ = tasks[done]
+                if start == 0:
+                    expected = (0, 0)
+                if first is not None and first == expected:
+                    columns = take_columns(name, layout)
+                else:
+                    discard_columns(name)
+                    columns, end = redo_chunk(f, filename, headers[filename], expected, stop, header)
+                expected = end
+                done += 1
+                yield columns
+                if cancel is not None:
+                    cancel.check()
+    finally:
+        for task in tasks[done:]:
+            discard_columns(task[1])  # finished but not taken when the caller stopped early
+
+
+def redo_chunk(f: Callable[[Iterator[BaseObject]], Columns], filename: str, headers: list[ContainerHeader],
+               expected: Position | None, stop: int, header: Header) -> tuple[Columns, Position | None]:
+    # the objects of a chunk from the end of the previous one
+    if expected is None or expected[0] >= stop:
+        return (f(iter(())), expected)  # the previous chunk ran to the end of the file or past this one
+    start, skip = expected
+    columns, _, end = decode_chunk(f, filename, headers[start][0], start, stop, header, skip)
+    return (columns, end)
 
 
 if __name__ == "__main__":
@@ -1,99 +1,30 @@
+import os
+import struct
+import sys
+import threading
 import time
-from mmap import ACCESS_READ, mmap
-from multiprocessing import Condition, Process
-from multiprocessing.shared_memory import SharedMemory
+from multiprocessing import Process
 from multiprocessing.sharedctypes import RawValue, Value
-from typing import Any
+from typing import Callable, Iterator
 from zlib import decompress
 
-from blfparser import (BaseObject, CANMessage, EthernetFrame,
-                       parse_can_fd_message, parse_can_fd_message_64,
-                       parse_can_message, parse_ethernet_frame,
-                       parse_ethernet_frame_ex, parse_file_header)
-from constants import (CAN_FD_MESSAGE, CAN_FD_MESSAGE_64, CAN_MESSAGE,
-                       CAN_MESSAGE2, ETHERNET_FRAME, ETHERNET_FRAME_EX, LOBJ,
-                       LOG_CONTAINER, LOG_CONTAINER_STRUCT, NO_COMPRESSION,
-                       OBJ_HEADER_BASE_STRUCT, OBJ_HEADER_V1_STRUCT,
-                       OBJ_HEADER_V2_STRUCT, TIME_TEN_MICS, ZLIB_DEFLATE)
-
-
-class QueueBuf:
-    def __init__(self, size) -> None:
-        self.shm = SharedMemory(create=True, size=size)
-        self.q_idx_met = Condition()
-        self.q_idx = RawValue("I", 0)
-        self.room_available = Condition()
-        self.item_available = Condition()
-        self.q_top = RawValue("I", 0)
-        self.q_end = RawValue("I", 0)
-        self.q_close = RawValue("B", 0)
-
-    def write(self, idx, data):
-        n = self.shm.size
-        k = len(data)
-        if k > n:
-            raise Exception(f"shared memory is too short to store the data: {k} > {n}")
-        with self.q_idx_met:
-            with self.room_available:
-                while self.q_idx.value != idx:
-                    self.q_idx_met.wait()
-                self.q_idx.value += 1
-                while True:
-                    q = self.q_end.value
-                    p = self.q_top.value
-                    q_ = q + k
-                    if p <= q and q_ < n:
-                        self.q_end.value = q_
-                        break
-                    if p <= q and q_ >= n and q_ - n < p:
-                        self.q_end.value = q_ = q_ - n
-                        break
-                    if p > q and q_ < p:
-                        self.q_end.value = q_
-                        break
-                    self.room_available.wait()
-                self.q_idx_met.notify_all()
-        if q < q_:
-            self.shm.buf[q:q_] = data
-        else:
-            r = n - q
-            self.shm.buf[q:] = data[:r]
-            self.shm.buf[:q_] = data[r:]
-        with self.item_available:
-            self.item_available.notify_all()
-
-    def read(self, size):
-        n = self.shm.size
-        with self.item_available:
-            while True:
-                p = self.q_top.value
-                q = self.q_end.value
-                p_ = p + size
-                if p < q and p_ <= q:
-                    self.q_top.value = p_
-                    break
-                if p > q and p_ < n:
-                    self.q_top.value = p_
-                    break
-                if p > q and p_ >= n and p_ - n <= q:
-                    self.q_top.value = p_ = p_ - n
-                    break
-                if p == q and self.q_close.value:
-                    return None
-                self.item_available.wait()
-        with self.room_available:
-            self.room_available.notify_all()
-        if p < p_:
-            return self.shm.buf[p:p_]
-        else:
-            return memoryview(self.shm.buf[p:].tobytes() + self.shm.buf[:p_].tobytes())
-
-    def close(self):
-        self.q_close.value = 1
+from blfparser import (BaseObject, parse_container_objects, parse_file_header,
+                       parse_log_container)
+from cancel import CancelToken, Cancelled
+from constants import (LOBJ, LOG_CONTAINER, LOG_CONTAINER_STRUCT,
+                       NO_COMPRESSION, OBJ_HEADER_BASE_STRUCT, ZLIB_DEFLATE)
+from pipestats import STATS
+from sharedmem import RingChannel
 
 
-def parse_log_container_sync(fp, idx, pos):
+def parse_log_container_sync(fp, idx, pos, done=None, window: int = 0, waiting: Callable[[], bool] | None = None):
+    # containers are claimed in file order by any of the workers, at most window ahead of done, those read so far
+    # waiting is called at the end of the window, True stops
     while True:
+        while done is not None and idx.value - done.value >= window:
+            if waiting is not None and waiting():
+                return
+            time.sleep(WINDOW_WAIT)
         with idx:
             fp.seek(pos.value)
             data = fp.read(OBJ_HEADER_BASE_STRUCT.size)
@@ -131,106 +62,117 @@ def parse_log_container_sync(fp, idx, pos):
         yield (i, data)
 
 
-def parse_base_object_sync(q: QueueBuf, idx, object_count, start_timestamp, stop_timestamp):
-    while True:
-        data = q.read(OBJ_HEADER_BASE_STRUCT.size)
-        if data is None:
-            break
-        header = OBJ_HEADER_BASE_STRUCT.unpack(data)
-        if header[0] != LOBJ:
-            raise Exception("no magic number LOBJ (base object)")
-        # header_size = header[1]
-        version = header[2]
-        obj_size = header[3]
-        obj_type = header[4]
-        if obj_type in (CAN_FD_MESSAGE_64, ETHERNET_FRAME_EX):
-            size = obj_size - OBJ_HEADER_BASE_STRUCT.size
-        else:
-            size = obj_size - OBJ_HEADER_BASE_STRUCT.size + obj_size % 4
-        data = q.read(size)
-        if data is None:
-            break
-        continue
-        if version == 1:
-            m = OBJ_HEADER_V1_STRUCT.unpack_from(data)
-            flags = m[0]
-            timestamp = m[3]
-            i = OBJ_HEADER_V1_STRUCT.size
-        elif version == 2:
-            m = OBJ_HEADER_V2_STRUCT.unpack_from(data)
-            flags = m[0]
-            timestamp = m[3]
-            i = OBJ_HEADER_V2_STRUCT.size
-        else:
-            raise Exception("unknown header version")
-        obj_data = data[i:obj_size - OBJ_HEADER_BASE_STRUCT.size]
-
-        if flags == TIME_TEN_MICS:
-            time_ns = timestamp * 10000
-        else:
-            time_ns = timestamp
-        msg: CANMessage | EthernetFrame | None
-        if obj_type in (CAN_MESSAGE, CAN_MESSAGE2):
-            msg = parse_can_message(obj_data)
-        elif obj_type == CAN_FD_MESSAGE:
-            msg = parse_can_fd_message(obj_data)
-        elif obj_type == CAN_FD_MESSAGE_64:
-            msg = parse_can_fd_message_64(obj_data)
-        elif obj_type == ETHERNET_FRAME:
-            msg = parse_ethernet_frame(obj_data)
-        elif obj_type == ETHERNET_FRAME_EX:
-            msg = parse_ethernet_frame_ex(obj_data)
-        else:
-            msg = None
-        item: BaseObject = {"type": "base",
-                            "object_count": object_count,
-                            "start_timestamp": start_timestamp,
-                            "stop_timestamp": stop_timestamp,
-                            "time_ns": time_ns,
-                            "obj_type": obj_type,
-                            "obj_data": obj_data,
-                            "msg": msg}
-        yield item
-
-
-def source(q: QueueBuf, filename, idx, pos):
-    with open(filename, "rb") as fp:
-        with mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
-            it = parse_log_container_sync(fp, idx, pos)
-            for i, data in it:
-                q.write(i, data)
+CONTAINER_INDEX = struct.Struct("<L")  # container order, prefixed to each record
+ERROR_INDEX = 0xFFFFFFFF  # the record holds the message of a worker which failed
+JOIN_TIMEOUT = 0.1  # seconds for a cancelled worker to return before it is terminated
+WINDOW = 4  # containers per worker claimed ahead of the reader, bounds those pending in read_ordered
+WINDOW_WAIT = 0.001  # seconds between two checks of a worker at the end of the window
+
+
+def read_ordered(q: RingChannel, done=None) -> Iterator[memoryview]:
+    # containers in file order, records of the workers arrive in any order, done is the count read so far
+    pending: dict[int, bytes] = {}
+    i = 0
+    for record in q:
+        k = CONTAINER_INDEX.unpack_from(record)[0]
+        if k == ERROR_INDEX:
+            raise Exception(f"worker failed: {bytes(record[CONTAINER_INDEX.size:]).decode()}")
+        pending[k] = record
+        while i in pending:
+            yield memoryview(pending.pop(i))[CONTAINER_INDEX.size:]
+            i += 1
+            if done is not None:
+                done.value = i
+    if pending and not q.cancelled:
+        raise Exception(f"log container {i} is missing")
+
+
+def parse_base_object_sync(q: RingChannel, object_count, start_timestamp, stop_timestamp, done=None) -> Iterator[BaseObject]:
+    yield from parse_container_objects(read_ordered(q, done), object_count, start_timestamp, stop_timestamp)
+
+
+def source(q: RingChannel, filename, idx, pos, done, window):
+    def waiting():
+        q.flush()  # the reader needs the records held back in the batch to move the window
+        return q.cancelled
+    error = None
+    try:
+        with open(filename, "rb") as fp:
+            for i, data in parse_log_container_sync(fp, idx, pos, done, window, waiting):
+                if q.cancelled:
+                    return
+                q.send(CONTAINER_INDEX.pack(i) + data)
+    except Cancelled:
+        return  # the reader is gone, close_after_join shuts the channel down
+    except Exception as e:
+        error = str(e)
+    try:
+        if error is not None:
+            q.send(CONTAINER_INDEX.pack(ERROR_INDEX) + error.encode())  # raised by the reader
+        q.close()
+    except Cancelled:
+        pass
 
 
-def consume(q: QueueBuf, idx, object_count, start_timestamp, stop_timestamp):
-    for item in parse_base_object_sync(q, idx, object_count, start_timestamp, stop_timestamp):
-        pass
+def parse_base_object_mp(filename: str, workers: int | None = None, size: int = 64_000_000,
+                         cancel: CancelToken | None = None) -> Iterator[BaseObject]:
+    with open(filename, "rb") as fp:
+        object_count, start_timestamp, stop_timestamp = parse_file_header(fp)
+        offset = fp.tell()
+    workers = workers or os.cpu_count() or 1
+    q = RingChannel(size, workers, cancel=cancel)
+    idx = Value("I", 0)
+    pos = Value("Q", offset)
+    done = RawValue("I", 0)
+    ps = [Process(target=source, args=(q, filename, idx, pos, done, WINDOW * workers), daemon=True) for _ in range(workers)]
+    try:
+        for p in ps:
+            p.start()
+        closer = threading.Thread(target=close_after_join, args=(q, ps), daemon=True)
+        closer.start()
+        yield from parse_base_object_sync(q, object_count, start_timestamp, stop_timestamp, done)
+        closer.join()
+        failed = [p.exitcode for p in ps if p.exitcode != 0]
+        if failed and not q.cancelled:
+            raise Exception(f"worker exited with code {failed[0]}")  # before it sent an error record
+        if STATS.enabled:
+            STATS.add("queue_read_wait_s", q.read_wait.value)
+            STATS.add("queue_write_wait_s", q.write_wait.value)
+    finally:
+        q.cancel()  # workers waiting on a full ring return, also when the caller stopped early
+        for p in ps:
+            p.join(JOIN_TIMEOUT)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        q.release()
+
+
+def close_after_join(q: RingChannel, ps: list[Process]):
+    for p in ps:
+        p.join()
+    q.shutdown()  # also when a worker died before close
 
 
 def main():
-    # filename = sys.argv[1]
-    filenames = [r"C:\Users\k_hir\Projects\numba-test\test.blf"]
+    filenames = sys.argv[1:]
+    workers = os.cpu_count()
     t1 = time.time()
+    count = 0
     for filename in filenames:
         with open(filename, "rb") as fp:
             object_count, start_timestamp, stop_timestamp = parse_file_header(fp)
-            offset = fp.tell()
-        q = QueueBuf(size=10_000_000)
-        idx0 = Value("I", 0)
-        pos0 = Value("I", offset)
-        ps = [Process(target=source, args=(q, filename, idx0, pos0)) for _ in range(1)]
-        for p0 in ps:
-            p0.start()
-        idx1 = Value("I", 0)
-        cs = [Process(target=consume, args=(q, idx1, object_count, start_timestamp, stop_timestamp)) for _ in range(1)]
-        for c0 in cs:
-            c0.start()
-        for p0 in ps:
-            p0.join()
-        q.close()
-        for c0 in cs:
-            c0.join()
+            for item in parse_container_objects(parse_log_container(fp), object_count, start_timestamp, stop_timestamp):
+                count += 1
+    t2 = time.time()
+    print("single", count, t2 - t1)
+    t1 = time.time()
+    count = 0
+    for filename in filenames:
+        for item in parse_base_object_mp(filename, workers):
+            count += 1
     t2 = time.time()
-    print(t2 - t1)
+    print(f"multi ({workers} workers)", count, t2 - t1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,69 @@
+import json
+import os
+import sys
+import threading
+import time
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+class PipelineStats:
+    # counters and timers of the load pipeline, every probe is guarded by `if STATS.enabled`
+
+    def __init__(self, path: str | None = None):
+        self.path = path  # JSON lines of the summaries, "-" for stderr
+        self.enabled = path is not None
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.counters: dict[str, float] = {}
+        self.object_types: dict[int, int] = {}
+
+    def add(self, name: str, value: float = 1):
+        with self.lock:  # containers may be decompressed in a thread pool
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def count_object(self, obj_type: int):
+        self.object_types[obj_type] = self.object_types.get(obj_type, 0) + 1
+
+    def timed(self, iterable: Iterable[T], name: str) -> Iterator[T]:
+        # adds the time spent producing each item
+        it = iter(iterable)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add(name, time.perf_counter() - t0)
+                return
+            self.add(name, time.perf_counter() - t0)
+            yield item
+
+    def summary(self, **extra) -> dict:
+        elapsed = time.perf_counter() - self.started
+        # decode_wall_s is what the consumer waited for, the *_cpu_s sums come from the pool threads
+        # and overlap with it, so neither is derived from the other
+        counters = dict(self.counters)
+        rows = sum(self.object_types.values())
+        return {"elapsed_s": elapsed,
+                "mb_per_s": counters.get("bytes_read", 0) / elapsed / 1e6 if elapsed else 0,
+                "rows_per_s": rows / elapsed if elapsed else 0,
+                **counters,
+                "objects": {str(obj_type): count for obj_type, count in sorted(self.object_types.items())},
+                **extra}
+
+    def dump(self, **extra):
+        if not self.enabled:
+            return
+        line = json.dumps(self.summary(**extra))
+        if self.path == "-":
+            print(line, file=sys.stderr)
+        else:
+            with open(self.path, "a") as fp:
+                fp.write(line + "\n")
+
+
+STATS = PipelineStats(os.environ.get("LOGVIEWER_STATS") or None)
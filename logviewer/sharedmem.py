@@ -1,64 +1,222 @@
-from multiprocessing import Condition, Event, Process
+import os
+import struct
+import sys
+import time
+from multiprocessing import Lock, Process, Semaphore
 from multiprocessing.shared_memory import SharedMemory
 from multiprocessing.sharedctypes import RawValue
-import time
-import random
-import struct
+from typing import Iterator
+
+from cancel import CancelToken, Cancelled
+
+RECORD_HEADER = struct.Struct("<L")
+WRAP = 0xFFFFFFFF  # the rest of the ring is unused, the next record starts at 0
+WAIT_TIMEOUT = 0.05  # bounds the delay of a missed wakeup
+BATCH_SIZE = 256 * 1024
+
+
+class RingChannel:
+    # shared memory ring of length-prefixed records, many writer processes and one reader
+    # cursors count bytes since the start, the position in the ring is cursor % size
+
+    def __init__(self, size: int, writers: int = 1, batch_size: int = BATCH_SIZE, cancel: CancelToken | None = None):
+        self.shm = SharedMemory(create=True, size=size)
+        self.size = size
+        self.batch_size = batch_size
+        self.head = RawValue("Q", 0)  # consumed by the reader
+        self.tail = RawValue("Q", 0)  # published by the writers
+        self.writers = RawValue("I", writers)
+        self.write_lock = Lock()  # one writer copies and publishes at a time
+        self.reader_waiting = RawValue("B", 0)
+        self.writer_waiting = RawValue("B", 0)
+        self.items = Semaphore(0)  # posted only when the reader waits on an empty ring
+        self.rooms = Semaphore(0)  # posted only when a writer waits on a full ring
+        self.read_wait = RawValue("d", 0)  # seconds the reader waited on an empty ring
+        self.write_wait = RawValue("d", 0)  # seconds the writers waited on a full ring
+        self.token = cancel  # the caller's, seen by waiting writers and the reader within WAIT_TIMEOUT
+        self.stopped = RawValue("B", 0)  # set by cancel, e.g. when the reader stops early
+        self.pending: list[bytes | memoryview] = []  # records of this writer not yet copied
+        self.pending_size = 0
+
+    def send(self, data: bytes | memoryview):
+        # data must not be modified until the next flush
+        if RECORD_HEADER.size + len(data) > self.size:
+            raise Exception(f"shared memory is too short to store the data: {len(data)} >= {self.size}")
+        self.pending.append(data)
+        self.pending_size += RECORD_HEADER.size + len(data)
+        if self.pending_size >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # copy the pending records and publish the tail once
+        if not self.pending:
+            return
+        with self.write_lock:
+            tail = self.tail.value
+            for data in self.pending:
+                tail = self.put(tail, data)
+            self.tail.value = tail
+        self.pending.clear()
+        self.pending_size = 0
+        self.wake_reader()
+
+    def put(self, tail: int, data: bytes | memoryview) -> int:
+        size = self.size
+        k = RECORD_HEADER.size + len(data)
+        pos = tail % size
+        if size - pos < k:
+            self.wait_room(tail, size - pos)
+            if size - pos >= RECORD_HEADER.size:
+                RECORD_HEADER.pack_into(self.shm.buf, pos, WRAP)
+            tail += size - pos
+            pos = 0
+        self.wait_room(tail, k)
+        RECORD_HEADER.pack_into(self.shm.buf, pos, len(data))
+        self.shm.buf[pos + RECORD_HEADER.size:pos + k] = data
+        return tail + k
+
+    def wait_room(self, tail: int, k: int):
+        while self.size - (tail - self.head.value) < k:
+            if self.cancelled:
+                raise Cancelled()
+            # the reader can't free what is not published yet
+            self.tail.value = tail
+            self.wake_reader()
+            self.writer_waiting.value = 1
+            if self.size - (tail - self.head.value) >= k:
+                break
+            t0 = time.perf_counter()
+            self.rooms.acquire(timeout=WAIT_TIMEOUT)
+            self.write_wait.value += time.perf_counter() - t0
+
+    def wake_reader(self):
+        if self.reader_waiting.value:
+            self.reader_waiting.value = 0
+            self.items.release()
+
+    def wake_writer(self):
+        if self.writer_waiting.value:
+            self.writer_waiting.value = 0
+            self.rooms.release()
+
+    def recv_many(self) -> list[bytes] | None:
+        # records published so far up to batch_size bytes, waits while empty, None after closed and drained or cancelled
+        head = self.head.value
+        while True:
+            if self.cancelled:
+                return None  # the records not read yet are dropped
+            closed = self.writers.value == 0
+            tail = self.tail.value
+            if tail != head:
+                break
+            if closed:
+                return None
+            self.reader_waiting.value = 1
+            if self.tail.value != head or self.writers.value == 0:
+                continue
+            t0 = time.perf_counter()
+            self.items.acquire(timeout=WAIT_TIMEOUT)
+            self.read_wait.value += time.perf_counter() - t0
+        size = self.size
+        buf = self.shm.buf
+        stop = head + self.batch_size
+        records = []
+        while head < tail and head < stop:
+            pos = head % size
+            if size - pos < RECORD_HEADER.size:
+                head += size - pos
+                continue
+            n, = RECORD_HEADER.unpack_from(buf, pos)
+            if n == WRAP:
+                head += size - pos
+                continue
+            records.append(bytes(buf[pos + RECORD_HEADER.size:pos + RECORD_HEADER.size + n]))
+            head += RECORD_HEADER.size + n
+        self.head.value = head
+        self.wake_writer()
+        return records
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            records = self.recv_many()
+            if records is None:
+                return
+            yield from records
+
+    def close(self):
+        # called by each writer when it is done
+        self.flush()
+        with self.write_lock:
+            self.writers.value -= 1
+        self.reader_waiting.value = 0
+        self.items.release()
+
+    def shutdown(self):
+        # no more records even if a writer went away without close
+        with self.write_lock:
+            self.writers.value = 0
+        self.items.release()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.stopped.value != 0 or (self.token is not None and self.token.cancelled)
+
+    def cancel(self):
+        # writers blocked on a full ring raise Cancelled, the reader gets None
+        self.stopped.value = 1
+        for _ in range(max(self.writers.value, 1)):
+            self.rooms.release()
+        self.items.release()
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def produce(ch: RingChannel, count: int, record_size: int):
+    data = bytes(record_size)
+    for _ in range(count):
+        ch.send(data)
+    ch.close()
+
+
+def consume(ch: RingChannel) -> tuple[int, int]:
+    count = 0
+    size = 0
+    while True:
+        records = ch.recv_many()
+        if records is None:
+            return (count, size)
+        count += len(records)
+        size += sum(map(len, records))
 
 
-def produce(shm: SharedMemory, r_ptr, w_ptr, w_close):
-    size = shm.size
-    buf = shm.buf
-    left_size = 2000
-    while left_size > 0:
-        data_size = 4
-        w_ptr_ = w_ptr.value + data_size
-        if w_ptr_ > size:
-            while r_ptr.value == 0:
-                time.sleep(0.5)  # queue is full
-            w_ptr.value = 0
-            w_ptr_ = data_size
-        while w_ptr.value < r_ptr.value <= w_ptr_:
-            time.sleep(0.5)  # queue is full
-        time.sleep(random.random() / 4 + 0.1)
-        buf[w_ptr.value:w_ptr_] = struct.pack(">I", left_size)
-        w_ptr.value = w_ptr_
-        print("write", w_ptr.value)
-        left_size -= data_size
-    print("finish")
-    w_close.value = 1
-
-
-def consume(shm: SharedMemory, r_ptr, w_ptr, w_close):
-    size = shm.size
-    buf = shm.buf
-    while not (w_close.value == 1 and w_ptr.value == r_ptr.value):
-        while w_ptr.value == r_ptr.value:
-            time.sleep(0.5)  # queue is empty
-        data_size = 4
-        r_ptr_ = r_ptr.value + data_size
-        if r_ptr_ > size:
-            r_ptr.value = 0
-            r_ptr_ = data_size
-        data = buf[r_ptr.value:r_ptr_]
-        r_ptr.value = r_ptr_
-        print("read", struct.unpack(">I", data.tobytes()))
-        time.sleep(random.random() + 0.1)
+def run(writers: int, count: int, record_size: int, size: int = 64_000_000):
+    ch = RingChannel(size, writers)
+    ps = [Process(target=produce, args=(ch, count, record_size), daemon=True) for _ in range(writers)]
+    try:
+        t0 = time.perf_counter()
+        for p in ps:
+            p.start()
+        n, total = consume(ch)
+        t1 = time.perf_counter()
+        for p in ps:
+            p.join()
+    finally:
+        for p in ps:
+            if p.is_alive():
+                p.terminate()
+        ch.release()
+    print(f"{writers}->1 {record_size:7d} bytes: {n / (t1 - t0):12.0f} records/s {total / (t1 - t0) / 1e9:6.2f} GB/s"
+          f" (waits: read {ch.read_wait.value:.2f} s, write {ch.write_wait.value:.2f} s)")
 
 
 def main():
-    r_ptr = RawValue("I", 0)
-    w_ptr = RawValue("I", 0)
-    w_close = RawValue("I", 0)
-    shm = SharedMemory(size=1000, create=True)
-    p1 = Process(target=produce, args=(shm, r_ptr, w_ptr, w_close))
-    p2 = Process(target=consume, args=(shm, r_ptr, w_ptr, w_close))
-    p1.start()
-    p2.start()
-    p1.join()
-    p2.join()
-    p1.close()
-    p2.close()
+    total = int(sys.argv[1]) * 1_000_000 if len(sys.argv) > 1 else 500_000_000
+    workers = os.cpu_count() or 1
+    for record_size in (64, 1024, 65536):
+        for writers in sorted({1, workers}):
+            run(writers, total // record_size // writers, record_size)
 
 
 if __name__ == "__main__":
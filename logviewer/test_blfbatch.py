@@ -0,0 +1,64 @@
+from mmap import ACCESS_READ, mmap
+
+import pytest
+
+from blfbatch import parse_container_batches
+from blfgen import START_TIMESTAMP, generate_blf
+from blfparser import (parse_container_objects, parse_file_header,
+                       parse_log_container_mm)
+from blfwriter import BLFWriter, pack_can_message, pack_object
+from constants import CAN_MESSAGE, GLOBAL_MARKER
+from isotp import IsoTpReassembler
+from logstore import LogStore, append_batch, append_object
+
+
+def load(filename, batched):
+    store = LogStore()
+    isotp = IsoTpReassembler()
+    with open(filename, "rb") as fp, mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+        header = parse_file_header(mm)
+        containers = list(parse_log_container_mm(mm))
+    if batched:
+        for batch, others in parse_container_batches(containers, *header):
+            append_batch(store, isotp, batch, others)
+    else:
+        for obj in parse_container_objects(containers, *header):
+            append_object(store, isotp, obj)
+    return store
+
+
+def assert_same(store, expected):
+    for (name, column), (_, other) in zip(store.columns(), expected.columns()):
+        assert column == other, name
+    assert store.payload == expected.payload
+
+
+@pytest.mark.parametrize("compressed", [True, False])
+@pytest.mark.parametrize("container_size", [37, 300, 128 * 1024])
+def test_batch_matches_append(tmp_path, compressed, container_size):
+    # CAN, CAN FD and Ethernet rows, objects straddle small containers
+    filename = str(tmp_path / "log.blf")
+    generate_blf(filename, 200_000, compressed=compressed, container_size=container_size)
+    expected = load(filename, False)
+    assert len(expected) > 1000
+    assert_same(load(filename, True), expected)
+
+
+def test_uds_rows(tmp_path):
+    # a UDS row after the frame that completes it, before the next marker
+    filename = str(tmp_path / "uds.blf")
+    frames = [(0x7E0, [0x02, 0x10, 0x03]),
+              (0x7E8, [0x10, 0x0A, 0x62, 0xF1, 0x90, 1, 2, 3]),
+              (0x7E8, [0x21, 4, 5, 6, 7, 0, 0, 0])]
+    with open(filename, "wb") as fp:
+        writer = BLFWriter(fp, START_TIMESTAMP, True, 64)
+        for i, (can_id, data) in enumerate(frames):
+            writer.write_object(pack_object(CAN_MESSAGE, 1000 * i, pack_can_message(1, 0, can_id, bytes(data))), 1000 * i)
+            writer.write_object(pack_object(GLOBAL_MARKER, 1000 * i + 500, bytes(5)), 1000 * i + 500)
+        writer.close()
+    store = load(filename, True)
+    assert_same(store, load(filename, False))
+    assert [store.obj_type[row] for row in range(len(store))] == [CAN_MESSAGE, CAN_MESSAGE, GLOBAL_MARKER, CAN_MESSAGE, GLOBAL_MARKER,
+                                                                  CAN_MESSAGE, CAN_MESSAGE, GLOBAL_MARKER]
+    assert store.data(1) == b"\x10\x03"
+    assert store.data(6) == bytes([0x62, 0xF1, 0x90, 1, 2, 3, 4, 5, 6, 7])
@@ -0,0 +1,91 @@
+import csv
+import os
+
+import pytest
+
+from blfexport import (CSV_HEADER, export_blf, export_columns, export_csv,
+                       read_columns, select_objects, store_rows)
+from blfgen import START_TIMESTAMP, generate_blf
+from blfparser import absolute_time, parse_base_object_file
+from logstore import COLUMNS, LogStore
+
+
+def summary(objs):
+    return [(absolute_time(obj), obj["obj_type"], bytes(obj["obj_data"])) for obj in objs]
+
+
+@pytest.fixture
+def blf(tmp_path):
+    filename = str(tmp_path / "log.blf")
+    generate_blf(filename, 100_000, container_size=4096)
+    return filename
+
+
+@pytest.fixture
+def store(blf):
+    store = LogStore()
+    for obj in parse_base_object_file(blf):
+        store.append(obj)
+    return store
+
+
+def test_blf_time_range(blf, tmp_path):
+    objs = list(parse_base_object_file(blf))
+    t0 = absolute_time(objs[len(objs) // 3])
+    t1 = absolute_time(objs[len(objs) // 2])
+    out = str(tmp_path / "range.blf")
+    count = export_blf(select_objects([blf], t0, t1), out)
+    expected = [obj for obj in summary(objs) if t0 <= obj[0] <= t1]
+    assert count == len(expected)
+    assert summary(parse_base_object_file(out)) == expected
+
+
+def test_blf_clamps_earlier_objects(blf, tmp_path):
+    # an object before the first one starts the new file instead of a negative time
+    objs = list(parse_base_object_file(blf))[:10]
+    objs[5] = dict(objs[5], time_ns=objs[5]["time_ns"] - 5_000_000_000)
+    out = str(tmp_path / "clamped.blf")
+    assert export_blf(objs, out) == 10
+    exported = list(parse_base_object_file(out))
+    start = exported[0]["start_timestamp"]
+    assert start == absolute_time(objs[0]) // 1_000_000_000 * 1_000_000_000
+    assert exported[5]["time_ns"] == 0
+    assert [obj["obj_type"] for obj in exported] == [obj["obj_type"] for obj in objs]
+
+
+def test_failed_export_is_removed(blf, tmp_path):
+    def failing():
+        yield from list(parse_base_object_file(blf))[:100]
+        raise Exception("no magic number LOBJ")
+    out = str(tmp_path / "failed.blf")
+    with pytest.raises(Exception, match="LOBJ"):
+        export_blf(failing(), out)
+    assert not os.path.exists(out)
+
+
+def test_csv(store, tmp_path):
+    out = str(tmp_path / "rows.csv")
+    rows = list(store_rows(store, store.time_ns[10], store.time_ns[20]))
+    assert rows == list(range(10, 21))
+    assert export_csv(store, rows, out, chunk_rows=4) == 11
+    with open(out, newline="", encoding="utf-8") as fp:
+        lines = list(csv.reader(fp))
+    assert lines[0] == CSV_HEADER
+    assert [line[:6] for line in lines[1:]] == [store.format_row(row) for row in rows]
+    assert [int(line[6]) for line in lines[1:]] == [store.time_ns[row] for row in rows]
+    assert [bytes.fromhex(line[10]) for line in lines[1:]] == [store.data(row) for row in rows]
+
+
+def test_columns_round_trip(store, tmp_path):
+    out = str(tmp_path / "rows.lvc")
+    rows = list(store_rows(store, rows=range(0, len(store), 3)))
+    assert export_columns(store, rows, out, chunk_rows=50) == len(rows)
+    read = []
+    for columns, payload in read_columns(out):
+        for k in range(len(columns["time_ns"])):
+            i = columns["data_offset"][k]
+            read.append(tuple(columns[name][k] for name, _ in COLUMNS if name not in ("data_offset", "data_length")) +
+                        (payload[i:i + columns["data_length"][k]],))
+    assert read == [tuple(getattr(store, name)[row] for name, _ in COLUMNS if name not in ("data_offset", "data_length")) +
+                    (store.data(row),) for row in rows]
+    assert START_TIMESTAMP <= read[0][0]
@@ -0,0 +1,54 @@
+from blffollow import BLFFollower
+from blfgen import START_TIMESTAMP
+from blfparser import parse_base_object_file
+from blfwriter import FILE_HEADER_SIZE, BLFWriter, pack_can_message, pack_object
+from constants import CAN_MESSAGE
+
+
+def can_object(i):
+    return (pack_object(CAN_MESSAGE, 1000 * i, pack_can_message(1, 0, 0x700 + i % 16, bytes([i % 256] * (i % 9)))), 1000 * i)
+
+
+def summary(objs):
+    return [(obj["start_timestamp"] + obj["time_ns"], bytes(obj["obj_data"])) for obj in objs]
+
+
+def test_follow_while_writing(tmp_path):
+    # objects come out as their containers are written, objects straddle the containers
+    filename = str(tmp_path / "log.blf")
+    follower = BLFFollower(filename)
+    seen = []
+    with open(filename, "wb") as fp:
+        writer = BLFWriter(fp, START_TIMESTAMP, container_size=100)
+        fp.flush()
+        seen += follower.poll()  # only the header, which is valid already
+        assert seen == [] and follower.pos == FILE_HEADER_SIZE
+        for i in range(500):
+            writer.write_object(*can_object(i))
+            if i % 50 == 0:
+                fp.flush()
+                seen += follower.poll()
+        assert 0 < len(seen) < 500
+        writer.close()
+    seen += follower.poll()
+    assert summary(seen) == summary(parse_base_object_file(filename))
+    assert list(follower.poll()) == []
+
+
+def test_zeroed_header(tmp_path):
+    # a writer which writes the header on close
+    filename = str(tmp_path / "log.blf")
+    with open(filename, "wb") as fp:
+        writer = BLFWriter(fp, START_TIMESTAMP, compressed=False, container_size=100)
+        for i in range(100):
+            writer.write_object(*can_object(i))
+        writer.close()
+    with open(filename, "rb") as fp:
+        data = fp.read()
+    with open(filename, "wb") as fp:
+        fp.write(bytes(FILE_HEADER_SIZE) + data[FILE_HEADER_SIZE:])
+    follower = BLFFollower(filename)
+    assert list(follower.poll()) == [] and follower.pos == 0
+    with open(filename, "wb") as fp:
+        fp.write(data)
+    assert summary(follower.poll()) == summary(parse_base_object_file(filename))
@@ -0,0 +1,80 @@
+import os
+from mmap import ACCESS_READ, mmap
+
+import pytest
+
+from blfgen import generate_blf
+from blfindex import (find_container, get_container_index,
+                      load_container_index, parse_base_object_range,
+                      parse_time_range, scan_container_index)
+from blfparser import parse_base_object_file, parse_file_header
+
+
+def summary(objs):
+    return [(obj["time_ns"], obj["obj_type"], bytes(obj["obj_data"])) for obj in objs]
+
+
+@pytest.fixture(params=[64, 300, 4096])
+def blf(tmp_path, request):
+    # small containers, many objects straddle them
+    filename = str(tmp_path / f"log{request.param}.blf")
+    generate_blf(filename, 60_000, container_size=request.param)
+    return filename
+
+
+def test_ranges_match_the_parser(blf):
+    # objects of consecutive container ranges are those of a full parse
+    expected = summary(parse_base_object_file(blf))
+    with open(blf, "rb") as fp, mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+        index = scan_container_index(mm)
+        n = len(index["entries"])
+        for step in (1, 7, n):
+            objs = []
+            for start in range(0, n, step):
+                objs += summary(parse_base_object_range(mm, index, start, min(start + step, n)))
+            assert objs == expected
+
+
+def test_time_range(blf):
+    objs = summary(parse_base_object_file(blf))
+    last = objs[-1][0]
+    with open(blf, "rb") as fp, mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+        index = scan_container_index(mm)
+        for t0, t1 in ((0, last), (last // 3, last // 2), (objs[5][0], objs[5][0]), (last + 1, last + 2), (-5, 0)):
+            assert summary(parse_time_range(mm, index, t0, t1)) == [obj for obj in objs if t0 <= obj[0] <= t1]
+
+
+def test_find_container(blf):
+    # the container found for a time holds no later object before it
+    with open(blf, "rb") as fp, mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+        index = scan_container_index(mm)
+    entries = index["entries"]
+    for time_ns in (0, entries[len(entries) // 2]["first_time_ns"], entries[-1]["last_time_ns"]):
+        k = find_container(index, time_ns)
+        assert entries[k]["skip"] >= 0
+        assert all(entry["last_time_ns"] < time_ns for entry in entries[:k])
+
+
+def test_saved_index(blf):
+    with open(blf, "rb") as fp, mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+        index = get_container_index(blf, mm)
+        assert os.path.exists(blf + ".idx")
+        mm.seek(0)
+        header = parse_file_header(mm)
+    assert load_container_index(blf, *header) == index
+    st = os.stat(blf)
+    os.utime(blf, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert load_container_index(blf, *header) is None  # stale
+
+
+def test_read_only_location(blf, monkeypatch):
+    # the index is still returned when it can't be saved
+    def fail(filename, index):
+        raise OSError("read-only")
+    monkeypatch.setattr("blfindex.save_container_index", fail)
+    with open(blf, "rb") as fp, mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+        index = get_container_index(blf, mm)
+        assert mm.tell() == 0
+        mm.seek(0)
+        assert index == scan_container_index(mm)
+    assert not os.path.exists(blf + ".idx")
@@ -0,0 +1,96 @@
+from mmap import ACCESS_READ, mmap
+
+import pytest
+
+from blfgen import START_TIMESTAMP, generate_blf
+from blfparser import (parse_base_object_file, parse_container_objects,
+                       parse_file_header, parse_log_container_mm)
+from blfwriter import BLFWriter, pack_can_message, pack_object
+from constants import (CAN_FD_MESSAGE_64, CAN_MESSAGE, ETHERNET_FRAME_EX,
+                       GLOBAL_MARKER, LOBJ, OBJ_HEADER_BASE_STRUCT,
+                       OBJ_HEADER_V2_STRUCT, TIME_TEN_MICS)
+
+
+def pack_object_v2(obj_type: int, timestamp: int, body: bytes, flags: int = TIME_TEN_MICS) -> bytes:
+    header_size = OBJ_HEADER_BASE_STRUCT.size + OBJ_HEADER_V2_STRUCT.size
+    obj_size = header_size + len(body)
+    return (OBJ_HEADER_BASE_STRUCT.pack(LOBJ, header_size, 2, obj_size, obj_type) +
+            OBJ_HEADER_V2_STRUCT.pack(flags, 0, 0, timestamp, 0) + body + bytes(obj_size % 4))
+
+
+def write_objects(filename, objects, container_size=128 * 1024, compressed=True):
+    # objects are (packed object, time_ns)
+    with open(filename, "wb") as fp:
+        writer = BLFWriter(fp, START_TIMESTAMP, compressed, container_size)
+        for data, time_ns in objects:
+            writer.write_object(data, time_ns)
+        writer.close()
+
+
+def summary(objs):
+    return [(obj["time_ns"], obj["obj_type"], bytes(obj["obj_data"])) for obj in objs]
+
+
+def test_can_messages(tmp_path):
+    filename = tmp_path / "can.blf"
+    write_objects(filename, [(pack_object(CAN_MESSAGE, 1000 * i, pack_can_message(1, i % 2, 0x700 + i, bytes([i] * (i % 9)))), 1000 * i)
+                             for i in range(20)])
+    objs = list(parse_base_object_file(str(filename)))
+    assert len(objs) == 20
+    for i, obj in enumerate(objs):
+        msg = obj["msg"]
+        assert obj["time_ns"] == 1000 * i
+        assert obj["start_timestamp"] == START_TIMESTAMP
+        assert (msg["type"], msg["channel"], msg["dir"], msg["can_id"]) == ("can", 1, i % 2, 0x700 + i)
+        assert bytes(msg["data"][:msg["dlc"]]) == bytes([i] * (i % 9))
+
+
+def test_v2_header(tmp_path):
+    # v2 object headers with timestamps in 10 us, next to v1 ones
+    filename = tmp_path / "v2.blf"
+    body = pack_can_message(2, 0, 0x123, b"\x01\x02")
+    write_objects(filename, [(pack_object_v2(CAN_MESSAGE, 7, body), 70_000),
+                             (pack_object(CAN_MESSAGE, 80_000, body), 80_000),
+                             (pack_object_v2(CAN_MESSAGE, 90_000, body, flags=0), 90_000)])
+    objs = list(parse_base_object_file(str(filename)))
+    assert [obj["time_ns"] for obj in objs] == [70_000, 80_000, 90_000]
+    assert all(obj["msg"]["can_id"] == 0x123 for obj in objs)
+
+
+def test_padding(tmp_path):
+    # obj_size % 4 bytes of padding, none after CAN_FD_MESSAGE_64 and ETHERNET_FRAME_EX
+    filename = tmp_path / "padding.blf"
+    objects = []
+    for i, n in enumerate(range(1, 9)):
+        objects.append((pack_object(GLOBAL_MARKER, 10 * i, bytes(n)), 10 * i))
+        objects.append((pack_object(CAN_MESSAGE, 10 * i + 5, pack_can_message(1, 0, i, b"")), 10 * i + 5))
+    write_objects(filename, objects)
+    objs = list(parse_base_object_file(str(filename)))
+    assert [obj["obj_type"] for obj in objs] == [GLOBAL_MARKER, CAN_MESSAGE] * 8
+    assert [len(obj["obj_data"]) for obj in objs[::2]] == list(range(1, 9))
+    assert [obj["msg"]["can_id"] for obj in objs[1::2]] == list(range(8))
+
+
+@pytest.mark.parametrize("compressed", [True, False])
+@pytest.mark.parametrize("container_size", [37, 64, 1000])
+def test_objects_straddle_containers(tmp_path, compressed, container_size):
+    # small containers split objects, headers and padding at every offset
+    whole = tmp_path / "whole.blf"
+    split = tmp_path / "split.blf"
+    mix = {"can": 6, "can_fd_64": 3, "ethernet_ex": 1}
+    count = generate_blf(str(whole), 50_000, mix)
+    assert generate_blf(str(split), 50_000, mix, compressed, container_size) == count
+    expected = summary(parse_base_object_file(str(whole)))
+    assert len(expected) == count
+    assert summary(parse_base_object_file(str(split))) == expected
+
+
+def test_build(tmp_path):
+    filename = tmp_path / "build.blf"
+    generate_blf(str(filename), 20_000, container_size=100)
+    with open(filename, "rb") as fp, mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+        header = parse_file_header(mm)
+        items = list(parse_container_objects(parse_log_container_mm(mm), *header,
+                                             build=lambda time_ns, obj_type, obj_data: (time_ns, obj_type, bytes(obj_data))))
+    assert items == summary(parse_base_object_file(str(filename)))
+    assert {obj_type for _, obj_type, _ in items} <= {CAN_MESSAGE, CAN_FD_MESSAGE_64, ETHERNET_FRAME_EX}
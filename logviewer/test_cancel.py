@@ -0,0 +1,48 @@
+import time
+from multiprocessing import Process
+
+import pytest
+
+from cancel import CancelToken, Cancelled
+
+
+def test_check():
+    token = CancelToken()
+    assert not token.cancelled
+    token.check()
+    token.cancel()
+    assert token.cancelled
+    with pytest.raises(Cancelled):
+        token.check()
+
+
+def test_wait():
+    token = CancelToken()
+    t0 = time.monotonic()
+    assert not token.wait(0.1)
+    assert time.monotonic() - t0 >= 0.1
+    token.cancel()
+    t0 = time.monotonic()
+    assert token.wait(10)
+    assert time.monotonic() - t0 < 1
+
+
+def test_guard():
+    # raises within every items after the cancel
+    token = CancelToken()
+    assert list(token.guard(range(10), every=3)) == list(range(10))
+    seen = []
+    with pytest.raises(Cancelled):
+        for i in token.guard(range(100), every=4):
+            seen.append(i)
+            if i == 10:
+                token.cancel()
+    assert len(seen) <= 10 + 4
+
+
+def test_cancel_from_another_process():
+    token = CancelToken()
+    p = Process(target=token.cancel)
+    p.start()
+    p.join()
+    assert token.cancelled
@@ -0,0 +1,96 @@
+import pytest
+
+from isotp import IsoTpReassembler, describe_uds, is_response, request_sid
+
+
+def feed(reassembler, frames, can_id=0x7E8, step=1000):
+    # frames at step ns apart, the UDS messages they complete
+    out = []
+    for i, frame in enumerate(frames):
+        uds = reassembler.feed(i * step, 1, 0, can_id, bytes(frame))
+        if uds is not None:
+            out.append(uds)
+    return out
+
+
+def test_single_frame():
+    [uds] = feed(IsoTpReassembler(), [[0x02, 0x10, 0x03, 0, 0, 0, 0, 0]])
+    assert uds["data"] == b"\x10\x03"
+    assert (uds["sid"], uds["service"], uds["response"]) == (0x10, "DiagnosticSessionControl", False)
+
+
+def test_can_fd_single_frame():
+    frame = [0x00, 12] + list(range(1, 13)) + [0xCC] * 2
+    [uds] = feed(IsoTpReassembler(), [frame])
+    assert uds["data"] == bytes(range(1, 13))
+
+
+def test_multi_frame():
+    data = bytes(range(20))
+    frames = [[0x10, 20] + list(data[:6]), [0x21] + list(data[6:13]), [0x22] + list(data[13:20])]
+    [uds] = feed(IsoTpReassembler(), frames)
+    assert uds["data"] == data
+    assert (uds["first_time_ns"], uds["time_ns"]) == (0, 2000)
+
+
+@pytest.mark.parametrize("frame", [
+    [0x10, 0x00, 0, 0, 0, 0, 0, 0],  # size 0
+    [0x10, 0x07, 1, 2, 3, 4, 5, 6],  # fits a single frame
+    [0x10, 0x00, 0x00, 0x00, 0x0F, 0xFF, 1, 2],  # escape for less than 4096 bytes
+    [0x10],
+])
+def test_malformed_first_frame(frame):
+    # no session, the following consecutive frame completes nothing
+    reassembler = IsoTpReassembler()
+    assert feed(reassembler, [frame, [0x21, 1, 2, 3, 4, 5, 6, 7]]) == []
+    assert not reassembler.sessions
+
+
+def test_can_fd_first_frame_size():
+    # 62 bytes fit a CAN FD single frame of 64
+    reassembler = IsoTpReassembler()
+    assert feed(reassembler, [[0x10, 62] + [0] * 62]) == []
+    assert not reassembler.sessions
+    feed(reassembler, [[0x10, 63] + [0] * 62])
+    assert reassembler.sessions
+
+
+def test_sequence_error():
+    reassembler = IsoTpReassembler()
+    assert feed(reassembler, [[0x10, 20, 0, 0, 0, 0, 0, 0], [0x22, 0, 0, 0, 0, 0, 0, 0]]) == []
+    assert reassembler.dropped == 1 and not reassembler.sessions
+
+
+def test_timeout():
+    reassembler = IsoTpReassembler(timeout_ns=1500)
+    frames = [[0x10, 10, 0, 0, 0, 0, 0, 0], [0x21, 0, 0, 0, 0, 0, 0, 0]]
+    assert feed(reassembler, frames, step=2000) == []
+    assert reassembler.dropped == 1
+
+
+def test_max_sessions():
+    reassembler = IsoTpReassembler(max_sessions=2)
+    for can_id in (0x7E0, 0x7E1, 0x7E2):
+        feed(reassembler, [[0x10, 10, 0, 0, 0, 0, 0, 0]], can_id)
+    assert list(reassembler.sessions) == [(1, 0x7E1), (1, 0x7E2)]
+    assert reassembler.dropped == 1
+
+
+def test_latency():
+    reassembler = IsoTpReassembler()
+    request, response = feed(reassembler, [[0x02, 0x10, 0x03], [0x02, 0x50, 0x03]], step=5000)
+    assert request["latency_ns"] == -1
+    assert response["response"] and response["sid"] == 0x10 and response["latency_ns"] == 5000
+
+
+def test_negative_response():
+    [uds] = feed(IsoTpReassembler(), [[0x03, 0x7F, 0x22, 0x31]])
+    assert (uds["sid"], uds["nrc"], uds["response"]) == (0x22, 0x31, True)
+    assert describe_uds(uds["data"]) == "ReadDataByIdentifier NRC 31 requestOutOfRange"
+
+
+def test_empty_data():
+    assert request_sid(b"") == -1
+    assert not is_response(b"")
+    assert describe_uds(b"") == ""
+    assert IsoTpReassembler().complete(0, 0, 1, 0, 0x7E8, b"") is None
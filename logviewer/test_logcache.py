@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+from blfgen import generate_blf
+from blfparser import parse_base_object_file
+from logcache import MANIFEST, LogCache
+from logstore import LogStore
+
+
+@pytest.fixture
+def log(tmp_path):
+    filename = str(tmp_path / "log.blf")
+    generate_blf(filename, 20_000)
+    store = LogStore()
+    for obj in parse_base_object_file(filename):
+        store.append(obj)
+    return filename, store
+
+
+def entry(cache, filename):
+    # the entry directory only depends on the paths
+    return cache.entry_dir([[os.path.abspath(filename), 0, 0]])
+
+
+def snapshot(store):
+    return ([(name, bytes(column)) for name, column in store.columns()], bytes(store.payload))
+
+
+def test_round_trip(tmp_path, log):
+    filename, store = log
+    cache = LogCache(str(tmp_path / "cache"))
+    assert not cache.load([filename], LogStore())
+    cache.save([filename], store, {"rows": len(store)})
+    loaded = LogStore()
+    assert cache.load([filename], loaded)
+    assert snapshot(loaded) == snapshot(store)
+    assert [loaded.get_row(row) for row in range(0, len(store), 97)] == [store.get_row(row) for row in range(0, len(store), 97)]
+    assert loaded.protocols is None
+    assert cache.load_summary([filename]) == {"rows": len(store)}
+    loaded.release()
+
+
+def test_protocols(tmp_path, log):
+    # the protocol columns of dissect_all are cached with the rows
+    filename, store = log
+    protocols = store.dissect_all()
+    cache = LogCache(str(tmp_path / "cache"))
+    cache.save([filename], store)
+    loaded = LogStore()
+    assert cache.load([filename], loaded)
+    assert {name: bytes(column) for name, column in loaded.protocols.items()} == {name: bytes(column) for name, column in protocols.items()}
+    assert loaded.dissect_all() is loaded.protocols
+    assert bytes(loaded.layer) == bytes(store.layer)
+    loaded.release()
+
+
+def test_stale(tmp_path, log):
+    filename, store = log
+    cache = LogCache(str(tmp_path / "cache"))
+    cache.save([filename], store, {})
+    st = os.stat(filename)
+    os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    assert not cache.load([filename], LogStore())
+    assert cache.load_summary([filename]) is None
+
+
+def test_truncated_column(tmp_path, log):
+    filename, store = log
+    cache = LogCache(str(tmp_path / "cache"))
+    cache.save([filename], store)
+    path = entry(cache, filename)
+    with open(os.path.join(path, "time_ns.bin"), "r+b") as fp:
+        fp.truncate(8)
+    loaded = LogStore()
+    assert not cache.load([filename], loaded)
+    assert len(loaded) == 0
+
+
+def test_evict(tmp_path):
+    # the least recently used entries go first, the one just saved is kept
+    cache = LogCache(str(tmp_path / "cache"))
+    filenames = []
+    for i in range(3):
+        filename = str(tmp_path / f"log{i}.blf")
+        generate_blf(filename, 2000, seed=i)
+        store = LogStore()
+        for obj in parse_base_object_file(filename):
+            store.append(obj)
+        cache.save([filename], store)
+        filenames.append(filename)
+    sizes = {path: size for _, size, path in cache.entries()}
+    assert cache.load([filenames[0]], LogStore())  # used last
+    cache.max_size = sum(sizes.values()) - sizes[entry(cache, filenames[1])]
+    cache.evict()
+    assert not os.path.exists(os.path.join(entry(cache, filenames[1]), MANIFEST))
+    assert [cache.load([filename], LogStore()) for filename in filenames] == [True, False, True]
+    cache.max_size = 0
+    cache.evict(keep=entry(cache, filenames[2]))
+    assert [path for _, _, path in cache.entries()] == [entry(cache, filenames[2])]
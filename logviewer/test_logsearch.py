@@ -0,0 +1,61 @@
+import pytest
+
+from blfgen import generate_blf
+from blfparser import parse_base_object_file
+from cancel import CancelToken, Cancelled
+from logsearch import (MessageIndex, find_all, find_bytes, find_text,
+                       message_text)
+from logstore import LogStore
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp("search") / "log.blf")
+    generate_blf(filename, 100_000)
+    store = LogStore()
+    for obj in parse_base_object_file(filename):
+        store.append(obj)
+    return store
+
+
+def test_find_bytes(store):
+    # one hit per row, ascending
+    rows = [row for row in range(len(store)) if store.data_length[row] >= 3]
+    for row in (rows[0], rows[len(rows) // 2], rows[-1]):
+        pattern = store.data(row)[:3]
+        expected = [r for r in range(len(store)) if pattern in store.data(r)]
+        assert row in expected
+        assert list(find_bytes(store, pattern)) == expected
+        assert list(find_bytes(store, pattern, row, row + 1)) == [row]
+
+
+def test_find_text(store):
+    query = message_text(store, 10)[:5]
+    expected = [row for row in range(len(store)) if query in message_text(store, row)]
+    assert list(find_text(store, query.upper())) == expected
+    index = MessageIndex()
+    index.update(store, len(store) // 2)  # the rest is formatted row by row
+    assert sorted(find_text(store, query, index)) == expected
+
+
+def test_hex_query_skips_the_messages(store, monkeypatch):
+    row = next(row for row in range(len(store)) if store.data_length[row] >= 2)
+    pattern = store.data(row)[:2]
+    expected = list(find_all(store, pattern.hex(" ")))
+
+    def fail(store, row):
+        raise AssertionError("message text formatted")
+    monkeypatch.setattr("logsearch.message_text", fail)
+    assert list(find_all(store, pattern.hex(" "))) == expected
+    assert row in expected
+    with pytest.raises(AssertionError):
+        find_all(store, pattern.hex(" "), messages=True)
+    with pytest.raises(AssertionError):
+        find_all(store, "can fd")
+
+
+def test_cancel(store):
+    token = CancelToken()
+    token.cancel()
+    with pytest.raises(Cancelled):
+        find_all(store, "can", cancel=token)
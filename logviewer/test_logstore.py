@@ -0,0 +1,108 @@
+from array import array
+
+import pytest
+
+from blfgen import START_TIMESTAMP, generate_blf
+from blfparser import parse_base_object_file
+from constants import CAN_MESSAGE
+from isotp import IsoTpReassembler
+from logstore import (DIR_NAMES, LAYER_CAN, LAYER_ISOTP, LAYER_TCPIP,
+                      LogStore, format_time, inverse_order, parse_time)
+
+
+@pytest.fixture(scope="module")
+def objs(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp("store") / "log.blf")
+    generate_blf(filename, 100_000)
+    return list(parse_base_object_file(filename))
+
+
+def load(objs):
+    store = LogStore()
+    for obj in objs:
+        store.append(obj)
+    return store
+
+
+@pytest.mark.parametrize("col", [0, 1, 2, 3, 4])
+@pytest.mark.parametrize("ascending", [True, False])
+def test_sort_like_the_text(objs, col, ascending):
+    store = load(objs)
+    values = [store.format_row(row)[col] for row in store.sort_order(col, ascending)]
+    assert values == sorted(values, reverse=not ascending)
+
+
+def test_sort_message(objs):
+    # col 5 groups the rows by layer and id, in time order within equal data
+    store = load(objs)
+    order = store.sort_order(5, True)
+    keys = [(store.layer[row], store.ident[row], store.data(row)) for row in order]
+    assert keys == sorted(keys)
+    assert sorted(order) == list(range(len(store)))
+
+
+def test_sort_stop(objs):
+    # the rows loaded when the sort started, later ones are not in the order
+    store = load(objs)
+    n = len(store) // 2
+    assert store.sort_order(5, False, n) == load(objs[:n]).sort_order(5, False)
+    store.layer = array("B", store.layer) + array("B", [LAYER_CAN]) * 10  # dissect_all replaced it with a longer one
+    assert len(store.sort_order(2, True, n)) == n
+
+
+def test_inverse_order():
+    order = array("L", [3, 0, 2, 1])
+    inverse = inverse_order(order)
+    assert [inverse[row] for row in order] == [0, 1, 2, 3]
+
+
+def test_format_can_row(objs):
+    store = load(objs)
+    row = next(row for row, obj in enumerate(objs) if obj["obj_type"] == CAN_MESSAGE)
+    stamp, stream, layer, severity, event, message = store.format_row(row)
+    msg = objs[row]["msg"]
+    assert parse_time(stamp) // 1000 == (START_TIMESTAMP + objs[row]["time_ns"]) // 1000
+    assert (stream, layer, severity, event) == (f"CAN {msg['channel']}", "CAN", "Info", "CAN")
+    assert message == f"{msg['can_id']:X} {DIR_NAMES[msg['dir']]} [8] {bytes(msg['data']).hex(' ').upper()}"
+
+
+def test_format_uds_row():
+    store = LogStore()
+    isotp = IsoTpReassembler()
+    for i, frame in enumerate(([0x02, 0x10, 0x03], [0x02, 0x50, 0x03])):
+        uds = isotp.feed(START_TIMESTAMP + i * 2_000_000, 1, i, 0x7E0 + 8 * i, bytes(frame))
+        store.append_uds(uds, 1)
+    assert all(store.layer[row] == LAYER_ISOTP for row in range(2))
+    assert store.format_row(0)[5] == "7E0 DiagnosticSessionControl Rx [2] 10 03"
+    assert store.format_row(1)[5] == "7E8 DiagnosticSessionControl response (+2.000 ms) Tx [2] 50 03"
+
+
+def test_time_round_trip():
+    t = START_TIMESTAMP + 123_456_789
+    assert parse_time(format_time(t)) == t // 1000 * 1000
+
+
+def test_no_stale_row_after_dissect_all(objs):
+    # a row formatted while dissect_all replaces layer is shown but not cached
+    store = load(objs)
+    format_row = store.format_row
+
+    def dissect_meanwhile(row, memo=True):
+        value = format_row(row, memo)
+        store.dissect_all()
+        return value
+    store.format_row = dissect_meanwhile
+    store.get_row(0)
+    assert 0 not in store.cache
+    del store.format_row
+    value = store.get_row(0)
+    assert store.cache[0] == value
+
+
+def test_dissect_all_refines_the_layer(objs):
+    store = load(objs)
+    protocols = store.dissect_all()
+    assert len(protocols["ip_proto"]) == len(store)
+    assert store.dissect_all() is protocols
+    tcpip = [row for row in range(len(store)) if store.layer[row] == LAYER_TCPIP]
+    assert tcpip and any(protocols["ip_proto"][row] >= 0 for row in tcpip)
@@ -0,0 +1,108 @@
+from mmap import ACCESS_READ, mmap
+
+import pytest
+
+import multiproc
+from blfgen import generate_blf
+from blfindex import get_container_index
+from blfparser import parse_base_object_file
+from logstore import LogStore
+from multiproc import find_object_start, map_chunks, plan_chunks
+
+
+def store_columns(objs) -> multiproc.Columns:
+    store = LogStore()
+    for obj in objs:
+        store.append(obj)
+    columns: multiproc.Columns = dict(store.columns())
+    columns["payload"] = store.payload
+    return columns
+
+
+def rows(columns_list):
+    # (time_ns, obj_type, data) of the chunks in order
+    out = []
+    for columns in columns_list:
+        payload = columns["payload"]
+        for t, obj_type, i, n in zip(columns["time_ns"], columns["obj_type"], columns["data_offset"], columns["data_length"]):
+            out.append((t, obj_type, bytes(payload[i:i + n])))
+    return out
+
+
+def expected(filenames):
+    return rows([store_columns(obj for filename in filenames for obj in parse_base_object_file(filename))])
+
+
+@pytest.fixture
+def redone(monkeypatch):
+    # chunks decoded again by the parent
+    calls = []
+    redo = multiproc.redo_chunk
+
+    def counting(*args):
+        calls.append(args[3])
+        return redo(*args)
+    monkeypatch.setattr(multiproc, "redo_chunk", counting)
+    return calls
+
+
+@pytest.mark.parametrize("compressed", [True, False])
+@pytest.mark.parametrize("container_size", [37, 300, 4096])
+@pytest.mark.parametrize("indexed", [True, False])
+def test_matches_the_parser(tmp_path, redone, compressed, container_size, indexed):
+    filename = str(tmp_path / "log.blf")
+    generate_blf(filename, 60_000, compressed=compressed, container_size=container_size)
+    if indexed:
+        with open(filename, "rb") as fp, mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+            get_container_index(filename, mm)
+    result = rows(map_chunks(store_columns, [filename], chunk_size=2000, processes=2))
+    assert result == expected([filename])
+    if indexed:
+        assert redone == []
+
+
+def test_files(tmp_path):
+    filenames = [str(tmp_path / f"log{i}.blf") for i in range(2)]
+    for i, filename in enumerate(filenames):
+        generate_blf(filename, 30_000, container_size=500, seed=i)
+    assert rows(map_chunks(store_columns, filenames, chunk_size=3000, processes=2)) == expected(filenames)
+
+
+@pytest.mark.parametrize("start", [lambda data: -1, lambda data: 1])
+def test_wrong_object_start(tmp_path, monkeypatch, redone, start):
+    # a chunk which doesn't follow on the previous one is decoded again from its end
+    filename = str(tmp_path / "log.blf")
+    generate_blf(filename, 60_000, container_size=300)
+    monkeypatch.setattr(multiproc, "find_object_start", start)  # inherited by the forked workers
+    assert rows(map_chunks(store_columns, [filename], chunk_size=2000, processes=2)) == expected([filename])
+    assert redone
+
+
+def test_find_object_start(tmp_path):
+    filename = str(tmp_path / "log.blf")
+    generate_blf(filename, 30_000, container_size=300)
+    with open(filename, "rb") as fp, mmap(fp.fileno(), length=0, access=ACCESS_READ) as mm:
+        index = get_container_index(filename, mm)
+        mm.seek(index["data_offset"])
+        for entry, data in zip(index["entries"], multiproc.parse_log_container_mm(mm)):
+            if 0 <= entry["skip"] < len(data):
+                assert find_object_start(data) == entry["skip"]
+
+
+def test_plan_chunks():
+    headers = [(i * 100, 100, 2, 400) for i in range(10)]
+    assert plan_chunks(headers, 250) == [(0, 3), (3, 6), (6, 9), (9, 10)]
+    assert plan_chunks([], 250) == []
+
+
+def test_corrupt_file(tmp_path):
+    filename = str(tmp_path / "log.blf")
+    generate_blf(filename, 60_000, container_size=300, compressed=False)
+    with open(filename, "r+b") as fp:
+        data = bytearray(fp.read())
+        i = data.index(b"LOBJ", data.index(b"LOBJ", len(data) // 2) + 4)  # an object inside a container
+        fp.seek(i)
+        fp.write(b"XXXX")
+    with pytest.raises(Exception):
+        for _ in map_chunks(store_columns, [filename], chunk_size=2000, processes=2):
+            pass
@@ -0,0 +1,79 @@
+import struct
+from multiprocessing.sharedctypes import RawValue, Value
+
+import pytest
+
+from blfgen import generate_blf
+from blfparser import parse_base_object_file, parse_file_header
+from multiread import (CONTAINER_INDEX, ERROR_INDEX, parse_base_object_mp,
+                       parse_log_container_sync, read_ordered)
+
+
+class Records(list):
+    # the records of a RingChannel
+    cancelled = False
+
+
+def summary(objs):
+    return [(obj["time_ns"], obj["obj_type"], bytes(obj["obj_data"])) for obj in objs]
+
+
+@pytest.fixture
+def blf(tmp_path):
+    filename = str(tmp_path / "log.blf")
+    generate_blf(filename, 300_000, container_size=2000)
+    return filename
+
+
+def test_matches_the_parser(blf):
+    # a ring shorter than the file, objects straddle the containers of different workers
+    assert summary(parse_base_object_mp(blf, 3, size=64 * 1024)) == summary(parse_base_object_file(blf))
+
+
+def test_corrupt_container(blf):
+    # the error of the worker is raised instead of a shorter stream
+    with open(blf, "r+b") as fp:
+        data = fp.read()
+        i = data.index(b"LOBJ", len(data) // 2)
+        fp.seek(i)
+        fp.write(b"XXXX")
+    with pytest.raises(Exception, match="worker failed: no magic number"):
+        for _ in parse_base_object_mp(blf, 2):
+            pass
+
+
+def test_read_ordered():
+    done = RawValue("I", 0)
+    records = Records(CONTAINER_INDEX.pack(i) + bytes([i]) for i in (2, 0, 1, 3))
+    assert [bytes(data) for data in read_ordered(records, done)] == [b"\x00", b"\x01", b"\x02", b"\x03"]
+    assert done.value == 4
+
+
+def test_read_ordered_missing():
+    records = Records(CONTAINER_INDEX.pack(i) for i in (0, 2))
+    with pytest.raises(Exception, match="container 1 is missing"):
+        list(read_ordered(records))
+
+
+def test_read_ordered_error():
+    records = Records([CONTAINER_INDEX.pack(0), struct.pack("<L", ERROR_INDEX) + b"truncated"])
+    with pytest.raises(Exception, match="worker failed: truncated"):
+        list(read_ordered(records))
+
+
+def test_window(blf):
+    # a worker stops claiming containers window ahead of those read
+    with open(blf, "rb") as fp:
+        parse_file_header(fp)
+        idx = Value("I", 0)
+        pos = Value("Q", fp.tell())
+        done = RawValue("I", 0)
+        waits = []
+
+        def waiting():
+            waits.append(idx.value)
+            done.value += 1
+            return len(waits) == 2
+        containers = [i for i, _ in parse_log_container_sync(fp, idx, pos, done, 3, waiting)]
+    assert containers == [0, 1, 2, 3]
+    assert waits == [3, 4]
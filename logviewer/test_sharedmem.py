@@ -0,0 +1,87 @@
+import threading
+from multiprocessing import Process
+
+import pytest
+
+from cancel import CancelToken, Cancelled
+from sharedmem import RingChannel, consume, produce
+
+
+@pytest.fixture
+def channel():
+    channels = []
+
+    def make(*args, **kwargs):
+        ch = RingChannel(*args, **kwargs)
+        channels.append(ch)
+        return ch
+    yield make
+    for ch in channels:
+        ch.release()
+
+
+def test_round_trip(channel):
+    # records of every size, the ring wraps many times
+    ch = channel(1000, batch_size=100)
+    records = [bytes([i % 256]) * (i % 97) for i in range(2000)]
+
+    def write():
+        for record in records:
+            ch.send(record)
+        ch.close()
+    th = threading.Thread(target=write)
+    th.start()
+    assert list(ch) == records
+    th.join()
+
+
+def test_writer_processes(channel):
+    ch = channel(4096, writers=2, batch_size=512)
+    ps = [Process(target=produce, args=(ch, 1000, 100)) for _ in range(2)]
+    for p in ps:
+        p.start()
+    assert consume(ch) == (2000, 200_000)
+    for p in ps:
+        p.join()
+        assert p.exitcode == 0
+
+
+def test_record_too_long(channel):
+    ch = channel(100)
+    with pytest.raises(Exception):
+        ch.send(bytes(100))
+
+
+def test_cancel_blocked_writer(channel):
+    # a writer waiting on a full ring raises Cancelled, the reader gets None
+    ch = channel(256, batch_size=1)
+    errors = []
+
+    def write():
+        try:
+            for _ in range(100):
+                ch.send(bytes(60))
+        except Cancelled as e:
+            errors.append(e)
+    th = threading.Thread(target=write)
+    th.start()
+    th.join(0.2)
+    assert th.is_alive()  # nobody reads
+    ch.cancel()
+    th.join(5)
+    assert not th.is_alive() and len(errors) == 1
+    assert ch.recv_many() is None
+
+
+def test_cancel_token(channel):
+    # the caller's token stops a reader waiting on an empty ring
+    token = CancelToken()
+    ch = channel(256, cancel=token)
+    result = []
+    th = threading.Thread(target=lambda: result.append(ch.recv_many()))
+    th.start()
+    th.join(0.2)
+    assert th.is_alive()
+    token.cancel()
+    th.join(5)
+    assert result == [None]